@@ -3,6 +3,12 @@ import { Table, Pagination, Container} from "react-bootstrap";
 import { BsSortDown, BsSortUp } from "react-icons/bs";
 import apiCall from "../utils/fetch";
 
+// Cast, country, director and genres are arrays, older movies may still hold strings
+const formatList = (value) => (Array.isArray(value) ? value.join(", ") : value);
+
+// Columns rendered by the table, the server leaves out the other fields
+const listFields = "show_id,type,title,director,cast,country,date_added,release_year,rating,duration,listed_in,description";
+
 // class MovieList extends React.Component {
 const MovieList = () => {
   const [movieList, setMovieList] = useState([]);
@@ -20,7 +26,7 @@ const MovieList = () => {
       },
     };
     let data = await apiCall(
-      `/api/movies/list/?page=${currentPage}&page_size=${itemsPerPage}&sort_key=${column}&sort_value=${order}`,
+      `/api/movies/list/?page=${currentPage}&page_size=${itemsPerPage}&sort_key=${column}&sort_value=${order}&fields=${listFields}`,
       options
     );
     if (data.data) {
@@ -100,9 +106,9 @@ const MovieList = () => {
               <td>{item.show_id}</td>
               <td>{item.type}</td>
               <td>{item.title}</td>
-              <td>{item.director}</td>
-              <td>{item.cast}</td>
-              <td>{item.country || "N/A"}</td>
+              <td>{formatList(item.director)}</td>
+              <td>{formatList(item.cast)}</td>
+              <td>{formatList(item.country) || "N/A"}</td>
               <td>
                 {new Date(item.date_added).toLocaleDateString("en-US", {
                   month: "long",
@@ -113,7 +119,7 @@ const MovieList = () => {
               <td>{item.release_year}</td>
               <td>{item.rating}</td>
               <td>{item.duration}</td>
-              <td>{item.listed_in}</td>
+              <td>{formatList(item.listed_in)}</td>
               <td>{item.description}</td>
             </tr>
           ))}
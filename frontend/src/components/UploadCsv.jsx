@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { useDropzone } from "react-dropzone";
 import {
   Card,
@@ -12,13 +12,16 @@ import {
 import "./FileUpload.css";
 import { BsArrowClockwise } from "react-icons/bs";
 import apiCall from "../utils/fetch";
+import streamProgress from "../utils/progress";
 
 const FileUpload = () => {
   const [uploadedFiles, setUploadedFiles] = useState([]);
   const [fileList, setFileList] = useState([]);
+  // The open progress stream and the files it follows, one stream at a time
+  const progressStream = useRef({ ids: [], close: null });
 
   const { getRootProps, getInputProps } = useDropzone({
-    accept: ".csv",
+    accept: [".csv", ".gz", ".bz2", ".zst"],
     onDrop: (acceptedFiles) => {
       setUploadedFiles(acceptedFiles);
     },
@@ -55,9 +58,11 @@ const FileUpload = () => {
       };
       const data = await apiCall("/api/csv/upload", options);
       if (data && data.data) {
-        setFileList([data.data, ...fileList]);
+        // An identical re-upload returns the existing file
+        setFileList([data.data, ...fileList.filter((file) => file._id !== data.data._id)]);
         setUploadedFiles([]);
-        setTimeout(() => refreshFileData(data.data._id), 1000);
+        if (data.duplicate) alert("This file was already uploaded");
+        else followProgress([data.data._id]);
       } else {
         console.error("Failed to upload file");
         alert("Failed to upload file");
@@ -78,16 +83,42 @@ const FileUpload = () => {
     };
     let data = await apiCall(`/api/csv/list/?page_size=100`, options);
     if (data.data) {
-      data.data.map((file) => {
-        if (file.status === "in_progress" || file.status === "pending")
-          setTimeout(() => refreshFileData(file._id), 1000);
-      });
+      const running = data.data
+        .filter((file) => ["in_progress", "pending"].includes(file.status))
+        .map((file) => file._id);
       setFileList(data.data);
+      if (running.length) followProgress(running);
     }
   };
-  useState(() => {
+  useEffect(() => {
     fetchProcessedList();
-  }, [fileList]);
+    // Close the stream when leaving the page, it holds a server worker while open
+    return () => {
+      if (progressStream.current.close) progressStream.current.close();
+      progressStream.current = { ids: [], close: null };
+    };
+  }, []);
+  const followProgress = (file_ids) => {
+    // Replace the open stream with one that also follows the new files
+    const ids = [...new Set([...progressStream.current.ids, ...file_ids])];
+    if (progressStream.current.close) progressStream.current.close();
+
+    const stream = { ids, close: null };
+    stream.close = streamProgress(
+      ids,
+      (event) => {
+        setFileList((fileList) =>
+          fileList.map((file) =>
+            file._id === event._id ? { ...file, ...event } : file
+          )
+        );
+      },
+      () => {
+        if (progressStream.current === stream) progressStream.current = { ids: [], close: null };
+      }
+    );
+    progressStream.current = stream;
+  };
   const refreshFileData = async (file_id) => {
     const options = {
       method: "GET",
@@ -98,9 +129,6 @@ const FileUpload = () => {
     };
     let data = await apiCall(`/api/csv/get/${file_id}`, options);
 
-    if (["in_progress", "pending"].includes(data.status)) {
-      setTimeout(() => refreshFileData(file_id), 1000);
-    }
     if (data) {
       setFileList((fileList) =>
         fileList.map((file) => {
@@ -124,7 +152,7 @@ const FileUpload = () => {
                 <input
                   {...getInputProps()}
                   type="file"
-                  accept=".csv"
+                  accept=".csv,.gz,.bz2,.zst"
                   multiple={false}
                 />
                 <h6>Drag and drop CSV files here, or click to browse.</h6>
@@ -164,10 +192,16 @@ const FileUpload = () => {
                 <td>{file.status}</td>
                 <td>
                   <ProgressBar
-                    now={100}
+                    now={
+                      file.status === "in_progress" && file.estimated_rows
+                        ? Math.min((100 * file.progress) / file.estimated_rows, 100)
+                        : 100
+                    }
                     label={
                       file.status === "failed"
                         ? file.error
+                        : file.status === "in_progress" && file.eta_seconds
+                        ? `${file.progress} rows processed, ${Math.ceil(file.eta_seconds)}s left`
                         : `${file.progress} rows processed`
                     }
                     variant={
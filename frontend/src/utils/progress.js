@@ -0,0 +1,65 @@
+/**
+ * Streams the progress of uploaded files from the server-sent events endpoint.
+ *
+ * EventSource cannot send the Authorization header, so the stream is read with fetch,
+ * and reconnecting is done here: the server ends a stream after a timeout, and a
+ * connection can drop, so a new one is opened after the retry delay sent by the
+ * server until every file is done or the stream is closed.
+ *
+ * @param {string[]} ids - The ids of the files to follow.
+ * @param {function} onProgress - Called with each progress event.
+ * @param {function} [onDone] - Called once every file has reached a final status.
+ * @returns {function} - Closes the stream.
+ */
+const streamProgress = (ids, onProgress, onDone) => {
+  const url = `${process.env.REACT_APP_SERVER_URL}/api/csv/progress/?ids=${ids.join(",")}`;
+  const controller = new AbortController();
+  let retry = 1000;
+
+  // Reads one connection, resolves to true once every file is done
+  const read = async () => {
+    const response = await fetch(url, {
+      headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
+      signal: controller.signal,
+    });
+    if (!response.ok) throw new Error(`Progress stream failed: ${response.status}`);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) return false;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      const events = buffer.split("\n\n");
+      buffer = events.pop();
+      for (const event of events) {
+        const lines = event.split("\n");
+        const type = lines.find((line) => line.startsWith("event: "));
+        const data = lines.find((line) => line.startsWith("data: "));
+        const delay = lines.find((line) => line.startsWith("retry: "));
+        if (delay) retry = parseInt(delay.slice(7), 10) || retry;
+        if (type === "event: progress" && data) onProgress(JSON.parse(data.slice(6)));
+        if (type === "event: done") return true;
+        if (type === "event: timeout") return false;
+      }
+    }
+  };
+
+  const follow = async () => {
+    while (!(await read())) {
+      await new Promise((resolve) => setTimeout(resolve, retry));
+      if (controller.signal.aborted) return;
+    }
+    if (onDone) onDone();
+  };
+
+  follow().catch((error) => {
+    if (error.name !== "AbortError") console.error("Error:", error);
+  });
+  return () => controller.abort();
+};
+
+export default streamProgress;
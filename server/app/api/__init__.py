@@ -1,3 +1,4 @@
 from .upload_csv import csv_router
 from .user import user_router
 from .movies import movies_router
+from .metrics import metrics_router
@@ -0,0 +1,126 @@
+import os
+import logging
+
+from flask import Blueprint, Response
+from pymongo.errors import PyMongoError
+
+from app.database import SessionManager, Collections
+from app.utils.auth import user_cache
+from app.utils.cache import TTLCache
+from app.utils.const import metrics_csv_files_ttl
+from app.utils.helper import count_cache, result_cache
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+metrics_router = Blueprint('metrics', __name__)
+
+# Upper bounds in seconds of the ingestion duration buckets, from a small file to a large sharded one
+ingest_buckets = (1, 5, 15, 60, 300, 900, 3600)
+
+csv_files_cache = TTLCache(1, float(os.environ.get('METRICS_CSV_FILES_TTL', metrics_csv_files_ttl)))
+
+
+def csv_files_stats():
+    """
+    Aggregate the ingestion results recorded by the Celery tasks on the csv_files documents.
+
+    The tasks run in the worker processes, so their duration and rows are read
+    from what they write on each file rather than from in-process counters.
+
+    Returns:
+        tuple: Per status counts and rows, and the ingestion durations of processed files.
+    """
+    with SessionManager() as (client, db):
+        csv_files = db.get_collection(Collections.csv_files)
+        by_status = list(csv_files.aggregate([
+            {'$group': {'_id': '$status',
+                        'files': {'$sum': 1},
+                        'rows': {'$sum': '$progress'},
+                        'quarantined': {'$sum': '$quarantined'}}}
+        ]))
+        durations = list(csv_files.aggregate([
+            {'$match': {'status': 'processed', 'ingest_seconds': {'$exists': True}}},
+            {'$bucket': {'groupBy': '$ingest_seconds', 'boundaries': [0] + list(ingest_buckets) + [float('inf')],
+                         'default': 'other',
+                         'output': {'count': {'$sum': 1}, 'seconds': {'$sum': '$ingest_seconds'}}}}
+        ]))
+    return by_status, durations
+
+
+def collect_csv_files():
+    """
+    Expose the Celery ingestion results as metrics, reusing the aggregation for a few seconds.
+
+    Returns:
+        list: (name, type, help, samples) tuples for the metrics registry.
+    """
+    stats = csv_files_cache.get('stats')
+    if stats is None:
+        try:
+            stats = csv_files_stats()
+        except PyMongoError as e:
+            logger.error(e)
+            return []
+        csv_files_cache.set('stats', stats)
+    by_status, durations = stats
+
+    metrics = [
+        ('csv_files', 'gauge', 'Uploaded CSV files by status.',
+         [('csv_files', {'status': group['_id']}, group['files']) for group in by_status]),
+        ('csv_ingest_rows', 'gauge', 'Rows ingested from CSV files by file status.',
+         [('csv_ingest_rows', {'status': group['_id']}, group['rows']) for group in by_status]),
+        ('csv_quarantined_rows', 'gauge', 'Rows set aside because they could not be converted.',
+         [('csv_quarantined_rows', {}, sum(group['quarantined'] for group in by_status))]),
+    ]
+
+    # $bucket reports each bucket by its lower bound, Prometheus buckets are cumulative upper bounds
+    counts = {bucket['_id']: bucket for bucket in durations}
+    samples, cumulative, total = [], 0, 0.0
+    for lower, upper in zip([0] + list(ingest_buckets), list(ingest_buckets) + ['+Inf']):
+        bucket = counts.get(lower, {'count': 0, 'seconds': 0.0})
+        cumulative += bucket['count']
+        total += bucket['seconds']
+        samples.append(('csv_ingest_duration_seconds_bucket', {'le': upper}, cumulative))
+    samples.append(('csv_ingest_duration_seconds_sum', {}, total))
+    samples.append(('csv_ingest_duration_seconds_count', {}, cumulative))
+    metrics.append(('csv_ingest_duration_seconds', 'histogram', 'Duration of CSV ingestion tasks.', samples))
+    return metrics
+
+
+def collect_caches():
+    """
+    Expose the counters of the in-process caches, labelled by cache.
+
+    Returns:
+        list: (name, type, help, samples) tuples for the metrics registry.
+    """
+    stats = {name: cache.stats() for name, cache in
+             (('users', user_cache), ('counts', count_cache), ('results', result_cache))}
+    return [
+        (metric, kind, documentation, [(metric, {'cache': name}, values[key]) for name, values in stats.items()])
+        for metric, kind, documentation, key in (
+            ('cache_hits_total', 'counter', 'Lookups served from an in-process cache.', 'hits'),
+            ('cache_misses_total', 'counter', 'Lookups missing or expired in an in-process cache.', 'misses'),
+            ('cache_evictions_total', 'counter', 'Entries evicted from a full in-process cache.', 'evictions'),
+            ('cache_entries', 'gauge', 'Entries held by an in-process cache.', 'size'),
+        )
+    ]
+
+
+registry.register_collector(collect_csv_files)
+registry.register_collector(collect_caches)
+
+
+@metrics_router.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Expose the metrics of this process in the Prometheus text format.
+
+    Request latencies, Mongo command timings and pool stats are per process,
+    Prometheus sums them across processes when scraping each one.
+
+    Returns:
+        flask.Response: The metrics as text/plain.
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,17 +1,121 @@
+import os
 import logging
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from app.utils.auth import jwt_required
 from app.database import SessionManager, Collections
-from app.utils.helper import paginator
+from app.database.facets import facet_fields, facets_query, facets_result
+from app.database.versions import get_version_info
+from app.utils.conditional import catalogue_validators, is_not_modified, not_modified, set_validators
+from app.utils.const import csv_headers, batch_max_ids, default_facet_limit
+from app.utils.helper import paginator, parse_projection
+from app.utils.streaming import should_stream, stream_page
 
 
 logger = logging.getLogger(__name__)
 movies_router = Blueprint('movies', __name__)
 
+# Define fields to be used for search, shared with the async endpoints
+search_allowed_fields = {'title': 1, 'type': 1, 'director': 1, 'cast': 1, 'country': 1, 'release_year': 1}
+
+# Define search fields served by the text index
+text_search_fields = {'title', 'director', 'cast'}
+
+# Define fields to be used for sorting
+sort_allowed_fields = {'_id': 1, 'show_id': 1,'created_at': 1, 'updated_at': 1, 'release_year':-1, 'duration':-1, 'date_added':-1}
+
+# Define multi valued fields that can be filtered on by exact values, stored as arrays
+filter_allowed_fields = {'cast', 'country', 'director', 'listed_in'}
+
+# Define fields that can be requested with fields=, the ingestion bookkeeping fields are left out
+projection_allowed_fields = set(csv_headers) | {'created_at', 'updated_at'}
+
+max_batch_ids = int(os.environ.get('BATCH_MAX_IDS', batch_max_ids))
+
+
+def batch_query(body):
+    """
+    Parse the body of a batch lookup, {"ids": [...]} or {"show_ids": [...]}.
+
+    Args:
+        body (dict): The JSON body of the request.
+
+    Raises:
+        ValueError: If the body is not a list of at most BATCH_MAX_IDS string ids.
+
+    Returns:
+        tuple: The field looked up ('_id' or 'show_id'), the requested ids in request order
+            and the mongo filter matching all of them.
+    """
+    if isinstance(body, dict) and 'ids' in body:
+        field, keys = '_id', body['ids']
+    elif isinstance(body, dict) and 'show_ids' in body:
+        field, keys = 'show_id', body['show_ids']
+    else:
+        raise ValueError('ids or show_ids is required')
+
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        raise ValueError('ids must be a list of strings')
+    if len(keys) > max_batch_ids:
+        raise ValueError('At most {} ids can be requested at once'.format(max_batch_ids))
+
+    # Invalid ObjectIds cannot match, they are reported as missing like any unknown id
+    values = [ObjectId(key) for key in keys if ObjectId.is_valid(key)] if field == '_id' else keys
+    return field, keys, {field: {'$in': list(dict.fromkeys(values))}}
+
+
+def facets_args(rqst_args):
+    """
+    Parse the arguments of the facets endpoint.
+
+    Args:
+        rqst_args (object): request args, facets is a comma separated list and limit
+            the number of values per facet
+
+    Raises:
+        ValueError: If a facet is unknown or limit is not a positive integer.
+
+    Returns:
+        tuple: The requested facets and the limit.
+    """
+    fields = [field for field in rqst_args.get('facets', ','.join(facet_fields)).split(',') if field]
+    invalid = [field for field in fields if field not in facet_fields]
+    if invalid:
+        raise ValueError('Invalid facets: {}'.format(', '.join(invalid)))
+
+    limit = int(rqst_args.get('limit', default_facet_limit))
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return fields or list(facet_fields), limit
+
+
+def batch_result(field, keys, movies):
+    """
+    Put the movies found by a batch lookup back in request order.
+
+    Args:
+        field (str): The field looked up.
+        keys (list): The requested ids, in request order.
+        movies (iterable): The matching documents, sorted by _id.
+
+    Returns:
+        dict: data with a movie or None per requested id, and the ids that were not found.
+    """
+    # A show_id ingested several times resolves to the latest document
+    found = {str(movie[field]): movie for movie in movies}
+    # Requested ids are compared in the canonical form of their ObjectId, e.g. lowercase hex
+    if field == '_id':
+        lookup = {key: str(ObjectId(key)) if ObjectId.is_valid(key) else key for key in keys}
+    else:
+        lookup = {key: key for key in keys}
+    return {
+        'data': [found.get(lookup[key]) for key in keys],
+        'missing': [key for key in keys if lookup[key] not in found]
+    }
+
 
 @movies_router.route('/list/', methods=['GET'])
 @jwt_required
@@ -33,39 +137,45 @@ def get_movie_list(user, *args, **kwargs):
     # Log request arguments
     logger.info(rqst_args)
 
+    # The page only changes with the catalogue version, answer repeat requests without querying it
+    etag, last_modified = catalogue_validators(request, *get_version_info(Collections.movies))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(current_app.response_class, etag, last_modified)
+
     # Get the movies collection
     with SessionManager() as (client, db):
         movies_collection = db.get_collection(Collections.movies)
 
-        # Define fields to be used for search
-        search_allowed_fields = {'title': 1, 'type': 1, 'director': 1, 'country': 1, 'release_year': 1}
+        # Get paginated movie data, large pages are streamed straight from the cursor
+        try:
+            stream = should_stream(rqst_args)
+            data = paginator(movies_collection, rqst_args, search_allowed_fields, sort_allowed_fields,
+                             text_search_fields, projection_allowed_fields, filter_allowed_fields,
+                             cache_counts=True, cache_results=True, lazy=stream)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Define fields to be used for sorting
-        sort_allowed_fields = {'_id': 1, 'show_id': 1,'created_at': 1, 'updated_at': 1, 'release_year':-1, 'duration':-1, 'date_added':-1}
-
-        # Get paginated movie data
-        data = paginator(movies_collection, rqst_args, search_allowed_fields, sort_allowed_fields)
+        if stream:
+            return set_validators(stream_page(data), etag, last_modified)
 
         # If movies are found, return their data
         
         movies = data['data']
-        return jsonify({
+        return set_validators(jsonify({
             'total_count': data['total_count'],
-            'data': [{
-                **movie, '_id': str(movie['_id']),
-                'created_by': str(movie['created_by']),
-                'sourced_from': str(movie['sourced_from'])
-                } for movie in movies],
+            'count_type': data['count_type'],
+            'data': movies,
             'page': data['page'],
             'page_size': data['page_size'],
-            'skip': data['skip']
-        })
+            'skip': data['skip'],
+            'next_cursor': data['next_cursor']
+        }), etag, last_modified)
 
 @movies_router.route('/get/<movie_id>', methods=['GET'])
 @jwt_required
 def get_movies_by_id(user, movie_id, *args, **kwargs):
     """
-    Get a movie by its ID.
+    Get a movie by its ID, fields=a,b returns only those fields.
 
     Args:
         user (dict): The user making the request.
@@ -81,22 +191,93 @@ def get_movies_by_id(user, movie_id, *args, **kwargs):
         logger.error('Invalid ID')
         return jsonify({}), 404
 
+    # Return only the requested fields
+    try:
+        projection = parse_projection(request.args, projection_allowed_fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The document only changes with the catalogue version
+    etag, last_modified = catalogue_validators(request, *get_version_info(Collections.movies))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(current_app.response_class, etag, last_modified)
+
     # Get the movies collection
     with SessionManager() as (client, db):
         movies_collection = db.get_collection(Collections.movies)
 
         # Find the movie by its ID
-        movie = movies_collection.find_one({'_id': movie_id})
+        movie = movies_collection.find_one({'_id': movie_id}, projection)
 
         # If the movie is found, return its data
         if movie:
-            return jsonify({
-                **movie,
-                '_id': str(movie['_id']),
-                'created_by': str(movie['created_by']),
-                'sourced_from': str(movie['sourced_from'])
-            })
+            return set_validators(jsonify(movie), etag, last_modified)
 
         # If the movie is not found, log a message and return a 404 response
         logger.info('Movie not found')
         return jsonify({}), 404
+
+
+@movies_router.route('/batch/', methods=['POST'])
+@jwt_required
+def get_movies_batch(user, *args, **kwargs):
+    """
+    Get many movies in one request, by ID or by show ID.
+
+    The body is {"ids": [...]} or {"show_ids": [...]}, fields=a,b returns only
+    those fields. All ids are resolved with a single $in query.
+
+    Args:
+        user (dict): The user making the request.
+
+    Returns:
+        flask.Response: A JSON response with a movie or null per requested id, in request order,
+            and the list of missing ids.
+    """
+    # Parse the requested ids and fields
+    try:
+        field, keys, find_context = batch_query(request.get_json(silent=True))
+        projection = parse_projection(request.args, projection_allowed_fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The looked up field is needed to put the movies back in request order
+    if projection:
+        projection[field] = 1
+
+    with SessionManager() as (client, db):
+        movies_collection = db.get_collection(Collections.movies)
+        movies = movies_collection.find(find_context, projection).sort('_id', 1)
+        return jsonify(batch_result(field, keys, movies))
+
+
+@movies_router.route('/facets/', methods=['GET'])
+@jwt_required
+def get_movie_facets(user, *args, **kwargs):
+    """
+    Get the number of movies per type, country, rating, release year and genre.
+
+    The counts are read from the movie_facets collection, kept up to date by the
+    ingestion, so the cost depends on the number of values and not on the catalogue.
+
+    Args:
+        user (dict): The user making the request.
+
+    Returns:
+        flask.Response: A JSON response with, per facet, its values and counts, largest first.
+    """
+    try:
+        fields, limit = facets_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The counts change with the catalogue version
+    etag, last_modified = catalogue_validators(request, *get_version_info(Collections.movies))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(current_app.response_class, etag, last_modified)
+
+    with SessionManager() as (client, db):
+        facets_collection = db.get_collection(Collections.movie_facets)
+        find_context, projection, sort = facets_query(fields)
+        buckets = facets_collection.find(find_context, projection).sort(sort)
+        return set_validators(jsonify(facets_result(buckets, fields, limit)), etag, last_modified)
@@ -1,21 +1,32 @@
 import os
+import time
 import logging
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request
 
 from app.celery import celery
 from app.utils.auth import jwt_required
-from app.utils.file_handler import format_file_name
+from app.utils.file_handler import format_file_name, save_upload
+from app.utils.compression import upload_formats, upload_format
 from app.database import SessionManager, Collections
 from app.utils.helper import paginator
+from app.utils.streaming import should_stream, stream_page
+from app.utils.const import (csv_headers, upload_buffer_size, upload_max_header_bytes,
+                             progress_stream_poll_interval, progress_stream_heartbeat,
+                             progress_stream_timeout)
 
 logger = logging.getLogger(__name__)
 
 csv_router = Blueprint('upload', __name__)
 
+search_allowed_fields = {'filename': 1, 'status': 1}  # Fields allowed for searching
+sort_allowed_fields = {'_id': -1, 'created_at': -1, 'updated_at': -1}  # Fields allowed for sorting
+
 
 @csv_router.route('/upload', methods=['POST'])
 @jwt_required
@@ -44,23 +55,22 @@ def upload_csv(user, *args, **kwargs):
         if file.filename == '':
             return {'message': 'No selected file'}, 400
 
-        # Check if the file is a CSV file
-        if file and file.filename.endswith('.csv'):
-            chunk_size = 4096
+        # Check if the file is a CSV file, plain or compressed
+        if file and file.filename.lower().endswith(tuple(upload_formats)):
+            buffer_size = int(os.environ.get('UPLOAD_BUFFER_SIZE', upload_buffer_size))
             filename = format_file_name(file.filename)
             file_path = f'/app/data/{filename}'
             logger.info(f'File path: {file_path}')
 
-            # Save the file to the server
-            with open(file_path, 'wb') as f:
-                logger.info(f'Saving file: {f.name}')
-                while True:
-                    chunk = file.read(chunk_size)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-
-                logger.info(f'File uploaded successfully: {f.name}')
+            # Save the file to the server as uploaded, compressed files stay compressed,
+            # rejecting a wrong header before writing anything
+            try:
+                compression = upload_format(file.filename)
+                content_hash, file_size = save_upload(file.stream, file_path, csv_headers, buffer_size,
+                                                      upload_max_header_bytes, compression)
+            except ValueError as e:
+                return {'error': str(e)}, 400
+            logger.info(f'File uploaded successfully: {file_path}')
 
             # Save the file details to the database
             with SessionManager() as (client, db):
@@ -73,14 +83,47 @@ def upload_csv(user, *args, **kwargs):
                     'uploaded_by': user.get('_id'),
                     'created_at': datetime.now(),
                     'updated_at': datetime.now(),
-                    'file_size': os.path.getsize(file_path),
+                    'file_size': file_size,
+                    'compression': compression,
+                    'content_hash': content_hash,
                     'progress': 0
                 }
-                file_obj = csv_files.insert_one(file_dict)
-                file_dict['_id'] = str(file_obj.inserted_id)
-                file_dict['uploaded_by'] = str(file_dict['uploaded_by'])
+                try:
+                    file_obj = csv_files.insert_one(file_dict)
+                    file_id = file_obj.inserted_id
+                except DuplicateKeyError:
+                    # The same content was uploaded before, the unique index on
+                    # content_hash makes concurrent identical uploads share one record
+                    file_dict = csv_files.find_one({'content_hash': content_hash})
+                    if file_dict['status'] != 'failed':
+                        os.remove(file_path)
+                        logger.info(f'File already uploaded: {file_dict["filepath"]}')
+                        return {'message': 'File already uploaded',
+                                'duplicate': True,
+                                'data': file_dict}, 200
+
+                    # Retry a failed file from its checkpoints with the new copy, the content
+                    # and so the shard offsets are the same, and ingestion is idempotent
+                    if os.path.exists(file_dict['filepath']):
+                        os.remove(file_dict['filepath'])
+                    retry = {'filepath': file_path, 'filename': filename, 'status': 'pending',
+                             'updated_at': datetime.now()}
+                    if file_dict.get('shards'):
+                        for shard in file_dict['shards']:
+                            if shard['status'] == 'failed':
+                                shard['status'] = 'pending'
+                                shard.pop('error', None)
+                        retry['shards'] = file_dict['shards']
+                        retry['shards_done'] = sum(shard['status'] == 'processed' for shard in file_dict['shards'])
+                    file_dict = csv_files.find_one_and_update(
+                        {'_id': file_dict['_id']},
+                        {'$set': retry, '$unset': {'error': ''}},
+                        return_document=ReturnDocument.AFTER
+                    )
+                    file_id = file_dict['_id']
+
                 celery.send_task('app.celery.tasks.process_csv',
-                                args=[str(file_obj.inserted_id)])
+                                args=[str(file_id)])
 
             return {'message': 'File uploaded successfully',
                     'data': file_dict}, 200
@@ -108,27 +151,28 @@ def get_file_list(user, *args, **kwargs):
     with SessionManager() as (client, db):
         csv_files_collection = db.get_collection(Collections.csv_files)  # Get the CSV files collection
 
-        search_allowed_fields = {'filename': 1, 'status': 1}  # Fields allowed for searching
-        sort_allowed_fields = {'_id': -1, 'created_at': -1, 'updated_at': -1}  # Fields allowed for sorting
+        # Retrieve the paginated data, large pages are streamed straight from the cursor
+        try:
+            stream = should_stream(rqst_args)
+            data = paginator(csv_files_collection, rqst_args, search_allowed_fields, sort_allowed_fields,
+                             lazy=stream)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Retrieve the paginated data
-        data = paginator(csv_files_collection, rqst_args, search_allowed_fields, sort_allowed_fields)
+        if stream:
+            return stream_page(data)
 
         file_list = data['data']  # Get the list of files
 
-        # Transform the file list to include the necessary fields and convert the IDs to strings
-        transformed_file_list = [{
-            **x, '_id': str(x['_id']),
-            'uploaded_by': str(x['uploaded_by']),
-        } for x in file_list]
-
         # Construct the response
         return jsonify({
             'total_count': data['total_count'],
-            'data': transformed_file_list,
+            'count_type': data['count_type'],
+            'data': file_list,
             'page': data['page'],
             'page_size': data['page_size'],
-            'skip': data['skip']
+            'skip': data['skip'],
+            'next_cursor': data['next_cursor']
         })
 
 
@@ -155,7 +199,7 @@ def get_file_by_id(user, file_id, *args, **kwargs):
 
             # If the file is found, return it as a JSON object
             if file:
-                return jsonify({**file, '_id': str(file['_id']), 'uploaded_by': str(file['uploaded_by'])})
+                return jsonify(file)
 
             # If the file is not found, log a message and return an empty JSON object with a 404 status code
             logger.info('file not found')
@@ -164,3 +208,173 @@ def get_file_by_id(user, file_id, *args, **kwargs):
             # If the file ID is invalid, log an error and return an empty JSON object with a 404 status code
             logger.error('Invalid ID')
             return jsonify({}), 404
+
+
+def progress_event(file):
+    """
+    Build the progress event of a file.
+
+    Args:
+        file (dict): The csv_files document.
+
+    Returns:
+        dict: The status, progress, throughput and estimated remaining seconds of the file.
+    """
+    progress = file.get('progress', 0)
+    estimated_rows = file.get('estimated_rows') or 0
+    started_at = file.get('ingest_started_at')
+
+    # The throughput over the whole ingestion, so sharded files count every shard
+    rows_per_second = file.get('rows_per_second', 0.0)
+    if started_at and file.get('status') == 'in_progress':
+        seconds = (datetime.now() - started_at).total_seconds()
+        rows_per_second = progress / seconds if seconds > 0 else 0.0
+
+    eta_seconds = None
+    if file.get('status') == 'in_progress' and rows_per_second:
+        eta_seconds = max(estimated_rows - progress, 0) / rows_per_second
+
+    return {
+        '_id': file['_id'],
+        'status': file.get('status'),
+        'progress': progress,
+        'estimated_rows': estimated_rows,
+        'quarantined': file.get('quarantined', 0),
+        'rows_per_second': rows_per_second,
+        'eta_seconds': eta_seconds,
+        'error': file.get('error')
+    }
+
+
+def progress_file_ids(rqst_args):
+    """
+    Parse the ids argument of the progress stream.
+
+    Args:
+        rqst_args (object): request args, ids is a comma separated list of file ids
+
+    Raises:
+        ValueError: If an id is invalid or none is given.
+
+    Returns:
+        list: The ObjectIds of the files.
+    """
+    try:
+        file_ids = [ObjectId(file_id) for file_id in rqst_args.get('ids', '').split(',') if file_id]
+    except InvalidId:
+        raise ValueError('Invalid ID')
+    if not file_ids:
+        raise ValueError('ids is required')
+    return file_ids
+
+
+class ProgressStream:
+
+    # Response headers of an event stream, X-Accel-Buffering disables response buffering in nginx
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    def __init__(self, file_ids, dumps):
+        """
+        Initialize a new instance of ProgressStream.
+
+        Holds the state of one progress event stream and turns each poll of the
+        files into server-sent event messages, for the sync and async endpoints.
+
+        Args:
+            file_ids (list): The ObjectIds of the files to follow.
+            dumps (function): The JSON encoder of the application.
+        """
+        self.file_ids = file_ids
+        self.dumps = dumps
+        self.poll_interval = float(os.environ.get('PROGRESS_STREAM_POLL_INTERVAL', progress_stream_poll_interval))
+        self.heartbeat = float(os.environ.get('PROGRESS_STREAM_HEARTBEAT', progress_stream_heartbeat))
+        self.timeout = float(os.environ.get('PROGRESS_STREAM_TIMEOUT', progress_stream_timeout))
+        self.sent = {}
+        self.started = self.last_sent = time.monotonic()
+        # Tell the client how long to wait before reconnecting
+        self.start = 'retry: {}\n\n'.format(int(self.poll_interval * 1000))
+        self.end = 'event: timeout\ndata: {}\n\n'
+
+    def query(self):
+        """
+        Returns:
+            tuple: The filter and projection reading the followed files.
+        """
+        return ({'_id': {'$in': self.file_ids}},
+                {'status': 1, 'progress': 1, 'estimated_rows': 1, 'quarantined': 1,
+                 'rows_per_second': 1, 'ingest_started_at': 1, 'error': 1})
+
+    def expired(self):
+        return time.monotonic() - self.started >= self.timeout
+
+    def messages(self, files):
+        """
+        Build the messages of one poll.
+
+        Args:
+            files (list): The csv_files documents read with query().
+
+        Returns:
+            tuple: The messages to send and True once every file has reached a final status.
+        """
+        messages = []
+        events = [progress_event(file) for file in files]
+        for event in events:
+            # Only send what changed since the last event of the file
+            state = (event['status'], event['progress'], event['quarantined'])
+            if self.sent.get(event['_id']) != state:
+                self.sent[event['_id']] = state
+                self.last_sent = time.monotonic()
+                messages.append('event: progress\ndata: {}\n\n'.format(self.dumps(event)))
+
+        # Stop once every file has reached a final status
+        if len(events) == len(self.file_ids) and all(event['status'] in ('processed', 'failed') for event in events):
+            messages.append('event: done\ndata: {}\n\n')
+            return messages, True
+
+        # Keep proxies from closing an idle connection
+        if time.monotonic() - self.last_sent >= self.heartbeat:
+            self.last_sent = time.monotonic()
+            messages.append(': heartbeat\n\n')
+        return messages, False
+
+
+@csv_router.route('/progress/', methods=['GET'])
+@jwt_required
+def get_file_progress(user, *args, **kwargs):
+    """
+    Stream the progress of CSV files as server-sent events.
+
+    The client keeps one connection open instead of polling each file. The server
+    reads the files once per PROGRESS_STREAM_POLL_INTERVAL with a single query and
+    sends a progress event only for the files that changed, a comment line as a
+    heartbeat when nothing changed for a while, and a done event once every file is
+    processed or failed.
+
+    Args:
+        user (dict): The user making the request.
+
+    Returns:
+        flask.Response: A text/event-stream response, or a JSON error with a 400 status code.
+    """
+    try:
+        file_ids = progress_file_ids(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Bind the JSON provider now, the generator runs after the request context is gone
+    stream = ProgressStream(file_ids, current_app.json.dumps)
+
+    def generate():
+        yield stream.start
+        with SessionManager() as (client, db):
+            csv_files_collection = db.get_collection(Collections.csv_files)
+            while not stream.expired():
+                messages, done = stream.messages(csv_files_collection.find(*stream.query()))
+                yield from messages
+                if done:
+                    return
+                time.sleep(stream.poll_interval)
+        yield stream.end
+
+    return Response(generate(), mimetype='text/event-stream', headers=stream.headers)
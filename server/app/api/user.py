@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify, make_response
 from app.database import SessionManager, Collections
-from app.utils.auth import generate_token
-from app.utils.auth import verify_password
+from app.utils.auth import generate_token, needs_rehash
+from app.utils.auth import jwt_required, revoke_token
+from app.utils.passwords import PoolFull, password_pool, user_throttle, ip_throttle, login_attempts, rehash_password
 
 user_router = Blueprint('api', __name__)
 
@@ -12,6 +13,10 @@ def login():
     Endpoint for user login.
     Expects a JSON payload with 'username' and 'password' fields.
     Returns a token if credentials are valid.
+
+    Passwords are checked on the bounded bcrypt pool, so a burst of logins cannot
+    take every request thread. A username or client address with too many recent
+    failures gets a 429, and a 503 is returned at once when the pool is full.
     """
     # Get the JSON payload
     data = request.get_json()
@@ -25,6 +30,14 @@ def login():
         # Return an error if either field is missing
         return make_response('Username and password are required', 400)
 
+    # Refuse throttled usernames and addresses before spending any bcrypt time
+    retry_after = max(user_throttle.retry_after(username), ip_throttle.retry_after(request.remote_addr))
+    if retry_after:
+        login_attempts.inc('throttled')
+        response = make_response(jsonify({"message": "Too many failed login attempts, try again later"}), 429)
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
     # Use SessionManager to get a database connection
     with SessionManager() as (client, db):
         # Get the users collection
@@ -33,28 +46,63 @@ def login():
         # Find the user with the given username
         user = users.find_one({'username': username})
 
-        # Check if the user exists
-        if not user:
-            # Return an error if the user does not exist
-            return make_response(jsonify({"message": "Invalid username or password"}), 401)
-
         # Get the stored password for the user
-        stored_password = user.get('password')
+        stored_password = user.get('password') if user else None
+
+    # Check the password on the bcrypt pool, the database connection is not needed meanwhile
+    try:
+        valid = bool(stored_password) and password_pool.verify(password, stored_password)
+    except PoolFull:
+        login_attempts.inc('busy')
+        response = make_response(jsonify({"message": "Too many concurrent logins, try again shortly"}), 503)
+        response.headers['Retry-After'] = '1'
+        return response
+
+    if valid:
+        user_throttle.reset(username)
+        login_attempts.inc('success')
+
+        # Move hashes made with another cost to the configured one, in the background
+        if needs_rehash(stored_password):
+            try:
+                password_pool.submit(rehash_password, user['_id'], password, stored_password)
+            except PoolFull:
+                # Retried on the next login
+                pass
+
+        # Generate a token for the user
+        token = generate_token(user)
 
-        # Check if the stored password is valid
-        if stored_password and verify_password(password, stored_password):
-            # Generate a token for the user
-            token = generate_token(user)
+        # Prepare the response data
+        res_data = {
+            'username': username,
+            'token': token,
+            'message': 'Login successful'
+        }
 
-            # Prepare the response data
-            res_data = {
-                'username': username,
-                'token': token,
-                'message': 'Login successful'
-            }
+        # Return the token and success message
+        return make_response(jsonify(res_data), 200)
 
-            # Return the token and success message
-            return make_response(jsonify(res_data), 200)
+    # Count the failure against the username and the client address
+    user_throttle.failed(username)
+    ip_throttle.failed(request.remote_addr)
+    login_attempts.inc('invalid')
 
     # Return an error if the credentials are invalid
     return make_response(jsonify({"message": "Invalid username or password"}), 401)
+
+
+@user_router.route('/logout', methods=['POST'])
+@jwt_required
+def logout(user, *args, **kwargs):
+    """
+    Endpoint for user logout.
+    Revokes the token sent in the Authorization header.
+    """
+    # Extract the token from the authorization header
+    token = request.headers.get('Authorization').split()[1]
+
+    # Revoke the token
+    revoke_token(token)
+
+    return make_response(jsonify({'message': 'Logout successful'}), 200)
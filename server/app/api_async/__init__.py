@@ -0,0 +1,2 @@
+from .upload_csv import csv_router
+from .movies import movies_router
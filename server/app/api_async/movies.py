@@ -0,0 +1,158 @@
+import logging
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+from quart import Blueprint, current_app, jsonify, request
+from app.database import Collections
+from app.database.facets import facets_query, facets_result
+from app.database.versions import get_version_info_async
+from app.utils.conditional import catalogue_validators, is_not_modified, not_modified, set_validators
+from app.utils.aio import jwt_required, paginator, stream_page
+from app.utils.helper import parse_projection
+from app.utils.streaming import should_stream
+from app.api.movies import (search_allowed_fields, text_search_fields, sort_allowed_fields, projection_allowed_fields,
+                            filter_allowed_fields, batch_query, batch_result, facets_args)
+
+logger = logging.getLogger(__name__)
+movies_router = Blueprint('movies', __name__)
+
+
+@movies_router.route('/list/', methods=['GET'])
+@jwt_required
+async def get_movie_list(user, db, *args, **kwargs):
+    """
+    Get a list of movies, async counterpart of app.api.movies.get_movie_list.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+
+    Returns:
+        quart.Response: A JSON response containing a list of movies.
+    """
+    rqst_args = request.args
+
+    # The page only changes with the catalogue version, answer repeat requests without querying it
+    etag, last_modified = catalogue_validators(request, *await get_version_info_async(db, Collections.movies))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(current_app.response_class, etag, last_modified)
+
+    movies_collection = db.get_collection(Collections.movies)
+
+    # Get paginated movie data, large pages are streamed straight from the cursor
+    try:
+        stream = should_stream(rqst_args)
+        data = await paginator(db, movies_collection, rqst_args, search_allowed_fields, sort_allowed_fields,
+                               text_search_fields, projection_allowed_fields, filter_allowed_fields,
+                               cache_counts=True, cache_results=True, lazy=stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if stream:
+        return set_validators(stream_page(data), etag, last_modified)
+
+    return set_validators(jsonify({
+        'total_count': data['total_count'],
+        'count_type': data['count_type'],
+        'data': data['data'],
+        'page': data['page'],
+        'page_size': data['page_size'],
+        'skip': data['skip'],
+        'next_cursor': data['next_cursor']
+    }), etag, last_modified)
+
+
+@movies_router.route('/get/<movie_id>', methods=['GET'])
+@jwt_required
+async def get_movies_by_id(user, db, movie_id, *args, **kwargs):
+    """
+    Get a movie by its ID, async counterpart of app.api.movies.get_movies_by_id.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+        movie_id (str): The ID of the movie.
+
+    Returns:
+        quart.Response: A JSON response containing the movie data.
+    """
+    try:
+        movie_id = ObjectId(movie_id)
+    except InvalidId:
+        logger.error('Invalid ID')
+        return jsonify({}), 404
+
+    # Return only the requested fields
+    try:
+        projection = parse_projection(request.args, projection_allowed_fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The document only changes with the catalogue version
+    etag, last_modified = catalogue_validators(request, *await get_version_info_async(db, Collections.movies))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(current_app.response_class, etag, last_modified)
+
+    movie = await db.get_collection(Collections.movies).find_one({'_id': movie_id}, projection)
+    if movie:
+        return set_validators(jsonify(movie), etag, last_modified)
+
+    logger.info('Movie not found')
+    return jsonify({}), 404
+
+
+@movies_router.route('/batch/', methods=['POST'])
+@jwt_required
+async def get_movies_batch(user, db, *args, **kwargs):
+    """
+    Get many movies in one request, async counterpart of app.api.movies.get_movies_batch.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+
+    Returns:
+        quart.Response: A JSON response with a movie or null per requested id, in request order,
+            and the list of missing ids.
+    """
+    try:
+        field, keys, find_context = batch_query(await request.get_json(silent=True))
+        projection = parse_projection(request.args, projection_allowed_fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The looked up field is needed to put the movies back in request order
+    if projection:
+        projection[field] = 1
+
+    movies = await db.get_collection(Collections.movies).find(find_context, projection).sort('_id', 1).to_list(None)
+    return jsonify(batch_result(field, keys, movies))
+
+
+@movies_router.route('/facets/', methods=['GET'])
+@jwt_required
+async def get_movie_facets(user, db, *args, **kwargs):
+    """
+    Get the facet counts of the catalogue, async counterpart of app.api.movies.get_movie_facets.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+
+    Returns:
+        quart.Response: A JSON response with, per facet, its values and counts, largest first.
+    """
+    try:
+        fields, limit = facets_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The counts change with the catalogue version
+    etag, last_modified = catalogue_validators(request, *await get_version_info_async(db, Collections.movies))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(current_app.response_class, etag, last_modified)
+
+    find_context, projection, sort = facets_query(fields)
+    buckets = await db.get_collection(Collections.movie_facets).find(find_context, projection).sort(sort).to_list(None)
+    return set_validators(jsonify(facets_result(buckets, fields, limit)), etag, last_modified)
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+from quart import Blueprint, Response, current_app, jsonify, request
+from app.database import Collections
+from app.database.aio import AsyncSessionManager
+from app.utils.aio import jwt_required, paginator, stream_page
+from app.utils.streaming import should_stream
+from app.api.upload_csv import search_allowed_fields, sort_allowed_fields, progress_file_ids, ProgressStream
+
+logger = logging.getLogger(__name__)
+
+csv_router = Blueprint('upload', __name__)
+
+
+@csv_router.route('/list/', methods=['GET'])
+@jwt_required
+async def get_file_list(user, db, *args, **kwargs):
+    """
+    Retrieves a paginated list of CSV files, async counterpart of app.api.upload_csv.get_file_list.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+
+    Returns:
+        quart.Response: A JSON response containing the list of CSV files.
+    """
+    rqst_args = request.args  # Get the request arguments
+    csv_files_collection = db.get_collection(Collections.csv_files)  # Get the CSV files collection
+
+    # Retrieve the paginated data, large pages are streamed straight from the cursor
+    try:
+        stream = should_stream(rqst_args)
+        data = await paginator(db, csv_files_collection, rqst_args, search_allowed_fields, sort_allowed_fields,
+                               lazy=stream)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if stream:
+        return stream_page(data)
+
+    return jsonify({
+        'total_count': data['total_count'],
+        'count_type': data['count_type'],
+        'data': data['data'],
+        'page': data['page'],
+        'page_size': data['page_size'],
+        'skip': data['skip'],
+        'next_cursor': data['next_cursor']
+    })
+
+
+@csv_router.route('/get/<file_id>', methods=['GET'])
+@jwt_required
+async def get_file_by_id(user, db, file_id, *args, **kwargs):
+    """
+    Get a file by its ID, async counterpart of app.api.upload_csv.get_file_by_id.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+        file_id (str): The ID of the file to retrieve.
+
+    Returns:
+        quart.Response: A JSON representation of the file, or an empty JSON object with a 404 status code.
+    """
+    try:
+        file_id = ObjectId(file_id)
+    except InvalidId:
+        logger.error('Invalid ID')
+        return jsonify({}), 404
+
+    file = await db.get_collection(Collections.csv_files).find_one({'_id': file_id})
+    if file:
+        return jsonify(file)
+
+    logger.info('file not found')
+    return jsonify({}), 404
+
+
+@csv_router.route('/progress/', methods=['GET'])
+@jwt_required
+async def get_file_progress(user, db, *args, **kwargs):
+    """
+    Stream the progress of CSV files as server-sent events, async counterpart of
+    app.api.upload_csv.get_file_progress.
+
+    An open stream only holds a coroutine between two polls instead of a worker
+    thread, so many uploads can be followed at once.
+
+    Args:
+        user (dict): The user making the request.
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+
+    Returns:
+        quart.Response: A text/event-stream response, or a JSON error with a 400 status code.
+    """
+    try:
+        file_ids = progress_file_ids(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Bind the JSON provider now, the generator runs after the request context is gone
+    stream = ProgressStream(file_ids, current_app.json.dumps)
+
+    async def generate():
+        yield stream.start.encode('utf-8')
+        async with AsyncSessionManager() as (client, db):
+            csv_files_collection = db.get_collection(Collections.csv_files)
+            while not stream.expired():
+                messages, done = stream.messages(await csv_files_collection.find(*stream.query()).to_list(None))
+                for message in messages:
+                    yield message.encode('utf-8')
+                if done:
+                    return
+                await asyncio.sleep(stream.poll_interval)
+        yield stream.end.encode('utf-8')
+
+    response = Response(generate(), mimetype='text/event-stream', headers=stream.headers)
+    # Quart stops a response body after RESPONSE_TIMEOUT, the stream ends on its own timeout
+    response.timeout = None
+    return response
@@ -1,19 +1,77 @@
+import os
+import click
+
 from flask import Flask
-from app.api import user_router, csv_router, movies_router
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app.api import user_router, csv_router, movies_router, metrics_router
 from app.bootstrap import load_bootstrap_data
+from app.database import SessionManager, Collections
+from app.database.facets import rebuild_facets
+from app.database.indexes import ensure_indexes
+from app.database.migrations import split_list_fields, null_blank_values
+from app.database.versions import bump_version
+from app.utils.const import csv_column_types, trusted_proxies
+from app.utils.json_provider import MongoJSONProvider
+from app.utils.metrics import instrument_app
 from flask_cors import CORS, cross_origin
 
 app = Flask(__name__)
+app.json = MongoJSONProvider(app)
+# Behind reverse proxies, request.remote_addr is the client address they forward,
+# the login throttle counts failures per client address
+proxies = int(os.environ.get('TRUSTED_PROXIES', trusted_proxies))
+if proxies:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies)
 CORS(app, origins="*", allow_headers=[
     "Content-Type", "Authorization", "Access-Control-Allow-Credentials"],
      supports_credentials=True)
 cross_origin(app)
+instrument_app(app)
 
 load_bootstrap_data()
 
 app.register_blueprint(csv_router, url_prefix='/api/csv')
 app.register_blueprint(user_router, url_prefix='/api/user')
 app.register_blueprint(movies_router, url_prefix='/api/movies')
+app.register_blueprint(metrics_router)
+
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create the indexes declared in Collections.indexes."""
+    with SessionManager() as (client, db):
+        for name in ensure_indexes(db):
+            click.echo(name)
+
+
+@app.cli.command('rebuild-facets')
+def rebuild_facets_command():
+    """Recount the movie_facets collection from the movies collection."""
+    with SessionManager() as (client, db):
+        click.echo('{} facet values'.format(rebuild_facets(db)))
+
+
+@app.cli.command('split-list-fields')
+def split_list_fields_command():
+    """Convert the comma separated fields of movies ingested as strings into arrays."""
+    fields = [column for column, kind in csv_column_types.items() if kind == 'list']
+    with SessionManager() as (client, db):
+        for field, count in split_list_fields(db, fields).items():
+            click.echo('{}: {}'.format(field, count))
+        # Cached pages and counts hold the previous values
+        bump_version(db, Collections.movies)
+
+
+@app.cli.command('null-blank-values')
+def null_blank_values_command():
+    """Replace the empty strings stored in the typed fields of existing movies with null."""
+    fields = [column for column, kind in csv_column_types.items() if kind in ('date', 'int')]
+    with SessionManager() as (client, db):
+        for field, count in null_blank_values(db, fields).items():
+            click.echo('{}: {}'.format(field, count))
+        # Cached pages and counts hold the previous values
+        bump_version(db, Collections.movies)
+
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=5000)
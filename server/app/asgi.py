@@ -0,0 +1,61 @@
+"""
+Async serving mode of the read API.
+
+Serves the movies and csv read endpoints with Quart and motor, so a waiting
+request holds a coroutine instead of a worker thread. Routes, auth and response
+shapes are the same as app.app, uploads and the user endpoints stay there.
+
+Run it with an ASGI server, e.g.:
+    hypercorn app.asgi:app --bind 0.0.0.0:5001
+"""
+import time
+
+from quart import Quart, Response, g, request
+from quart.utils import run_sync
+from quart_cors import cors
+
+from app.api_async import csv_router, movies_router
+from app.database.aio import close_async_client
+from app.utils.json_provider import MongoJSONProvider
+from app.utils.metrics import registry, http_request_duration
+
+app = Quart(__name__)
+app.json = MongoJSONProvider(app)
+app = cors(app, allow_origin='*', allow_headers=[
+    "Content-Type", "Authorization", "Access-Control-Allow-Credentials"])
+
+app.register_blueprint(csv_router, url_prefix='/api/csv')
+app.register_blueprint(movies_router, url_prefix='/api/movies')
+
+
+@app.before_request
+async def start_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+async def record_duration(response):
+    # Same histogram as app.utils.metrics.instrument_app
+    started = g.pop('request_started_at', None)
+    if started is not None:
+        http_request_duration.observe(time.perf_counter() - started, request.endpoint or 'unmatched',
+                                      request.method, response.status_code)
+    return response
+
+
+@app.after_serving
+async def close_client():
+    close_async_client()
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """
+    Expose the metrics of this process in the Prometheus text format.
+
+    The csv_files collector reads Mongo with pymongo, so rendering runs in a thread.
+
+    Returns:
+        quart.Response: The metrics as text/plain.
+    """
+    return Response(await run_sync(registry.render)(), mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,7 @@
 import logging
 
 from app.database import SessionManager, Collections
+from app.database.indexes import ensure_indexes
 from app.utils.auth import hash_password
 
 logger = logging.getLogger(__name__)
@@ -10,8 +11,9 @@ def load_bootstrap_data():
     """
     Function to load initial bootstrap data into the database.
 
-    This function creates a new user with the username 'admin' and
-    password 'admin' if one does not already exist in the database.
+    This function creates the declared indexes, then creates a new user
+    with the username 'admin' and password 'admin' if one does not
+    already exist in the database.
     """
     # User credentials
     user = {
@@ -20,6 +22,9 @@ def load_bootstrap_data():
     }
 
     with SessionManager() as (client, db):
+        # Create the indexes declared in Collections.indexes
+        ensure_indexes(db)
+
         # Log the creation of the admin user
         logger.info('creating admin user')
 
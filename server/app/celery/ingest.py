@@ -0,0 +1,257 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+from pymongo.errors import BulkWriteError
+
+from app.utils.const import (ingest_writers, ingest_queue_size, ingest_batch_size, ingest_min_batch_size,
+                             ingest_max_batch_size, ingest_target_batch_seconds)
+
+logger = logging.getLogger(__name__)
+
+# Mongo error code for a unique index violation
+duplicate_key_error = 11000
+
+
+def insert_ignoring_duplicates(collection, documents):
+    """
+    Insert documents unordered, ignoring the ones whose unique key already exists.
+
+    Args:
+        collection (pymongo.collection.Collection): The collection to insert into.
+        documents (list): The documents to insert.
+
+    Raises:
+        BulkWriteError: If a write fails for any other reason than a duplicate key.
+
+    Returns:
+        list: The documents actually inserted.
+    """
+    try:
+        collection.insert_many(documents, ordered=False)
+        return documents
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if e.details.get('writeConcernErrors') or any(error['code'] != duplicate_key_error for error in errors):
+            raise
+        # An unordered insert writes every document but the ones reported in writeErrors
+        duplicates = {error['index'] for error in errors}
+        return [document for index, document in enumerate(documents) if index not in duplicates]
+
+
+class IngestPipeline:
+
+    def __init__(self, collection, on_commit=None, on_insert=None, writers=None, queue_size=None, batch_size=None,
+                 row_field='source_row', committed=0, checkpoint=0):
+        """
+        Initialize a new instance of IngestPipeline.
+
+        The caller parses the file and puts documents into the pipeline, which cuts them
+        into batches and hands them through a bounded queue to a pool of writer threads
+        doing unordered bulk inserts. Parsing and writing overlap, and a full queue blocks
+        the caller so it never runs ahead of the database.
+
+        Batch sizes adapt to the observed write time: a batch written in less than half the
+        target duration doubles the size, a batch slower than the target halves it.
+
+        Documents carry their row number in the file (row_field) and the collection has a
+        unique index on it, so a batch that is written twice only inserts the missing rows.
+        Batches commit out of order; the checkpoint is the row number before which every
+        batch has been committed, which is where a restarted ingestion can resume. The
+        documents of the batches before the checkpoint are counted apart, a resumed run
+        starts from that count since it writes the later batches again.
+
+        Args:
+            collection (pymongo.collection.Collection): The collection to insert into.
+            on_commit (function, optional): Called from a writer thread after each batch with
+                the total number of committed documents, the checkpoint and the number of
+                documents committed before the checkpoint.
+            on_insert (function, optional): Called from a writer thread after each batch with the
+                documents it inserted, rows written by an earlier attempt are not included.
+            writers (int, optional): The number of writer threads.
+            queue_size (int, optional): The number of batches that can wait for a writer.
+            batch_size (int, optional): The initial batch size.
+            row_field (str, optional): The document field holding the row number in the file.
+            committed (int, optional): Documents committed before the checkpoint by a previous
+                run, when resuming.
+            checkpoint (int, optional): The checkpoint of a previous run, when resuming.
+        """
+        self.collection = collection
+        self.on_commit = on_commit
+        self.on_insert = on_insert
+        self.writers = writers or int(os.environ.get('INGEST_WRITERS', ingest_writers))
+        self.queue = queue.Queue(maxsize=queue_size or int(os.environ.get('INGEST_QUEUE_SIZE', ingest_queue_size)))
+        self.batch_size = batch_size or int(os.environ.get('INGEST_BATCH_SIZE', ingest_batch_size))
+        self.target_seconds = float(os.environ.get('INGEST_TARGET_BATCH_SECONDS', ingest_target_batch_seconds))
+
+        self.lock = threading.Lock()
+        self.pending = []
+        self.threads = []
+        self.error = None
+        self.row_field = row_field
+        self.committed = committed
+        self.inserted = 0
+        self.batches = 0
+        self.checkpoint = checkpoint
+        self.checkpoint_committed = committed
+        # Sequence numbers of the batches handed out and the next one the checkpoint waits for
+        self.sequence = 0
+        self.next_sequence = 0
+        self.done = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def __enter__(self):
+        """
+        Start the writer threads.
+        """
+        self.started_at = time.perf_counter()
+        for i in range(self.writers):
+            thread = threading.Thread(target=self.write, name='ingest-writer-{}'.format(i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """
+        Flush the pending documents and wait for the writers.
+
+        If the block raised, the pending documents are dropped and the writers
+        stop without writing the queued batches.
+        """
+        if exc_type is not None and self.error is None:
+            self.error = exc_val
+        self.close(flush=exc_type is None)
+
+    def raise_error(self):
+        # Surface a writer failure in the thread feeding the pipeline
+        if self.error is not None:
+            raise self.error
+
+    def put(self, documents):
+        """
+        Add documents to the pipeline, blocking while every writer is busy and the queue is full.
+
+        Args:
+            documents (list): The documents to insert.
+
+        Raises:
+            Exception: The error of a failed writer.
+        """
+        self.raise_error()
+        self.pending.extend(documents)
+        while len(self.pending) >= self.batch_size:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self.enqueue(batch)
+
+    def enqueue(self, batch):
+        # The checkpoint moves past the last row of the batch once it and all earlier ones are committed
+        item = (self.sequence, batch[-1][self.row_field] + 1, batch)
+        self.sequence += 1
+        while True:
+            self.raise_error()
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, flush=True):
+        """
+        Write the remaining documents and stop the writers.
+
+        Args:
+            flush (bool): Write the pending documents before stopping.
+
+        Raises:
+            Exception: The error of a failed writer, if flushing.
+        """
+        try:
+            if flush and self.pending:
+                self.enqueue(self.pending)
+            self.pending = []
+        finally:
+            # Writers keep draining the queue after an error, so the sentinels always fit
+            for _ in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+            self.finished_at = time.perf_counter()
+
+        if flush:
+            self.raise_error()
+        logger.info('Ingested {inserted} rows in {seconds:.2f}s ({rows_per_second:.0f} rows/s)'.format(**self.stats()))
+
+    def write(self):
+        """
+        Writer thread loop, inserts batches until it gets the None sentinel.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            # Drop the remaining batches once a writer has failed
+            if self.error is not None:
+                continue
+
+            sequence, end_row, batch = item
+            try:
+                started = time.perf_counter()
+                inserted = insert_ignoring_duplicates(self.collection, batch)
+                self.adapt(len(batch), time.perf_counter() - started)
+                if self.on_insert and inserted:
+                    self.on_insert(inserted)
+
+                with self.lock:
+                    self.committed += len(batch)
+                    self.inserted += len(inserted)
+                    self.batches += 1
+                    # Advance the checkpoint over the contiguous run of committed batches
+                    self.done[sequence] = (end_row, len(batch))
+                    while self.next_sequence in self.done:
+                        self.checkpoint, size = self.done.pop(self.next_sequence)
+                        self.checkpoint_committed += size
+                        self.next_sequence += 1
+                    committed, checkpoint, checkpoint_committed = (self.committed, self.checkpoint,
+                                                                   self.checkpoint_committed)
+                if self.on_commit:
+                    self.on_commit(committed, checkpoint, checkpoint_committed)
+            except Exception as e:
+                logger.error(e)
+                self.error = e
+
+    def adapt(self, size, seconds):
+        """
+        Adjust the batch size from the duration of a write.
+
+        Args:
+            size (int): The number of documents written.
+            seconds (float): How long the write took.
+        """
+        with self.lock:
+            if seconds > self.target_seconds:
+                self.batch_size = max(ingest_min_batch_size, self.batch_size // 2)
+            elif seconds < self.target_seconds / 2 and size >= self.batch_size:
+                self.batch_size = min(ingest_max_batch_size, self.batch_size * 2)
+
+    def stats(self):
+        """
+        Returns:
+            dict: The committed rows, newly inserted rows, elapsed seconds, throughput,
+                batches written, current batch size, checkpoint and the rows committed before it.
+        """
+        end = self.finished_at or time.perf_counter()
+        seconds = end - self.started_at if self.started_at else 0.0
+        return {
+            'rows': self.committed,
+            'inserted': self.inserted,
+            'seconds': seconds,
+            'rows_per_second': self.inserted / seconds if seconds else 0.0,
+            'batches': self.batches,
+            'batch_size': self.batch_size,
+            'checkpoint': self.checkpoint,
+            'checkpoint_rows': self.checkpoint_committed,
+        }
@@ -0,0 +1,294 @@
+import io
+import os
+import csv
+import logging
+import pandas as pd
+
+from app.utils.compression import open_decompressed
+from app.utils.const import (csv_headers, csv_column_types, csv_date_format, csv_engine,
+                             pd_chunk_size, pyarrow_block_size)
+
+try:
+    import pyarrow
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# Every column is read as a string, typed columns are converted after reading
+csv_dtypes = {header: str for header in csv_headers}
+
+
+def read_chunks(file_path, engine=None, start_row=0):
+    """
+    Read a CSV file in chunks of untyped string columns.
+
+    The row index of each chunk continues from the previous one, so it is the
+    position of the row in the file (0 for the first data row). Rows are CSV
+    records, a quoted field spanning several lines is still one row, so the
+    checkpoint of a resumed ingestion skips the same rows with either engine.
+
+    Files ending in .gz, .bz2 or .zst are decompressed as a stream by both
+    engines, which infer the compression from the suffix.
+
+    Args:
+        file_path (str): The path of the CSV file.
+        engine (str, optional): 'c' or 'pyarrow', defaults to the CSV_ENGINE setting.
+        start_row (int, optional): The number of data rows to skip, the header is always read.
+
+    Returns:
+        iterator: pandas.DataFrame chunks.
+    """
+    engine = engine or os.environ.get('CSV_ENGINE', csv_engine)
+    if engine == 'pyarrow':
+        if pyarrow is not None:
+            return read_chunks_pyarrow(file_path, start_row)
+        logger.warning('pyarrow is not installed, falling back to the c engine')
+
+    # No type inference: every column is a string and converted once per chunk
+    if not start_row:
+        return pd.read_csv(file_path, chunksize=pd_chunk_size, dtype=csv_dtypes)
+    return read_chunks_from(file_path, start_row)
+
+
+def read_chunks_from(file_path, start_row):
+    """
+    Read a CSV file with the pandas reader, skipping the first start_row data rows.
+
+    Yields:
+        pandas.DataFrame: Chunks indexed by their position in the file.
+    """
+    # Record 0 is the header, records 1..start_row are the rows already ingested. The
+    # callable is applied to records, not lines, so quoted newlines do not shift it
+    reader = pd.read_csv(file_path, chunksize=pd_chunk_size, dtype=csv_dtypes,
+                         skiprows=lambda line: 0 < line <= start_row)
+    for df in reader:
+        df.index = df.index + start_row
+        yield df
+
+
+def read_chunks_pyarrow(file_path, start_row=0):
+    """
+    Read a CSV file with the arrow streaming reader, which parses blocks on several threads.
+
+    Args:
+        file_path (str): The path of the CSV file.
+        start_row (int, optional): The number of data rows to skip.
+
+    Yields:
+        pandas.DataFrame: One chunk per arrow record batch.
+    """
+    reader = pa_csv.open_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(block_size=pyarrow_block_size, skip_rows_after_names=start_row),
+        # Without it a quoted newline splits a row, and skipped rows are counted as lines
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types={header: pyarrow.string() for header in csv_headers})
+    )
+    offset = start_row
+    for batch in reader:
+        df = batch.to_pandas()
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        offset += len(df)
+        yield df
+
+
+def present(column):
+    """
+    Returns:
+        pandas.Series: True where a string column holds a non blank value.
+    """
+    return column.notna() & (column.str.strip() != '')
+
+
+def split_values(value):
+    """
+    Returns:
+        list: The trimmed non empty items of a comma separated value.
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_chunk(df):
+    """
+    Convert the typed columns of a chunk and split off the rows that cannot be converted.
+
+    Conversions are vectorized over the whole chunk. Blank values of typed columns
+    are stored as None ([] for lists), so a sort key holds one type besides null,
+    and blank strings stay empty strings. Values that cannot be converted put the
+    row in quarantine instead of failing the file. List columns cannot fail, they
+    are split on commas into trimmed values.
+
+    Args:
+        df (pandas.DataFrame): A chunk returned by read_chunks.
+
+    Returns:
+        tuple: The converted DataFrame and a list of quarantined rows,
+            each a dict with row, error and the raw data.
+    """
+    errors = pd.Series('', index=df.index, dtype=object)
+    converted = {}
+
+    for column, kind in csv_column_types.items():
+        if kind == 'list':
+            continue
+        raw = df[column].str.strip()
+        has_value = present(raw)
+
+        if kind == 'date':
+            values = pd.to_datetime(raw, format=csv_date_format, errors='coerce')
+            invalid = has_value & values.isna()
+        else:
+            values = pd.to_numeric(raw, errors='coerce')
+            invalid = has_value & (values.isna() | (values % 1 != 0))
+
+        # Keep the first error of each row
+        errors = errors.mask(invalid & (errors == ''), 'Invalid {}'.format(column))
+        converted[column] = (values, has_value & ~invalid, kind)
+
+    bad = errors != ''
+    quarantined = [{
+        'row': int(index),
+        'error': errors[index],
+        'data': {key: (None if pd.isna(value) else value) for key, value in row.items()}
+    } for index, row in df[bad].iterrows()] if bad.any() else []
+
+    good = ~bad
+    df = df[good].fillna('')
+    for column, (values, valid, kind) in converted.items():
+        values, valid = values[good], valid[good]
+        typed = pd.Series([None] * len(df), index=df.index, dtype=object)
+        if kind == 'date':
+            typed[valid] = values[valid].dt.to_pydatetime()
+        else:
+            typed[valid] = values[valid].astype('int64').tolist()
+        df[column] = typed
+
+    for column, kind in csv_column_types.items():
+        if kind == 'list':
+            df[column] = df[column].map(split_values)
+
+    return df, quarantined
+
+
+class ByteRange(io.RawIOBase):
+
+    def __init__(self, file_path, start, end):
+        """
+        Initialize a new instance of ByteRange.
+
+        A read-only stream over the bytes [start, end) of a file.
+
+        Args:
+            file_path (str): The path of the file.
+            start (int): The offset of the first byte.
+            end (int): The offset after the last byte.
+        """
+        self.file = open(file_path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.remaining <= 0:
+            return 0
+        view = memoryview(b)[:min(len(b), self.remaining)]
+        read = self.file.readinto(view)
+        self.remaining -= read
+        return read
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def read_header(file_path):
+    """
+    Read the header row of a CSV file.
+
+    Args:
+        file_path (str): The path of the CSV file.
+
+    Returns:
+        list: The column names.
+    """
+    with io.TextIOWrapper(open_decompressed(file_path), newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+
+def shard_offsets(file_path, shard_bytes, block_bytes=1 << 20):
+    """
+    Split the data rows of a CSV file into byte ranges of about shard_bytes each.
+
+    Every range but the first starts right after the newline ending a record. Quoted
+    fields may hold newlines, so the file is scanned from its start counting quotes:
+    a newline only ends a record when an even number of quotes precedes it, escaped
+    quotes ("") being counted twice. Compressed files cannot be split at byte offsets
+    and are never sharded.
+
+    Args:
+        file_path (str): The path of the CSV file.
+        shard_bytes (int): The target size of a shard.
+        block_bytes (int, optional): The number of bytes scanned at a time.
+
+    Returns:
+        list: (start, end) byte offsets, the header record is not part of any range.
+    """
+    size = os.path.getsize(file_path)
+    starts = []
+    # The first boundary wanted is the end of the header record
+    target, offset, quoted = 0, 0, False
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                break
+            position = 0
+            while offset + len(block) > target:
+                # Skip to the target, then to the first newline outside quotes
+                skip = max(target - offset, position)
+                quoted ^= block.count(b'"', position, skip) % 2 == 1
+                newline = block.find(b'\n', skip)
+                if newline < 0:
+                    position = skip
+                    break
+                quoted ^= block.count(b'"', skip, newline) % 2 == 1
+                position = newline + 1
+                if not quoted:
+                    starts.append(offset + position)
+                    target = offset + position + shard_bytes
+                else:
+                    target = offset + position
+            quoted ^= block.count(b'"', position) % 2 == 1
+            offset += len(block)
+
+    # A header without data rows, or a last boundary at the end of the file
+    starts = [start for start in starts if start < size] or [size]
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def read_shard_chunks(file_path, start, end, start_row=0):
+    """
+    Read the rows of a byte range of a CSV file in chunks of untyped string columns.
+
+    Args:
+        file_path (str): The path of the CSV file.
+        start (int): The offset of the first byte of the shard.
+        end (int): The offset after the last byte of the shard.
+        start_row (int, optional): The number of rows of the shard to skip.
+
+    Yields:
+        pandas.DataFrame: Chunks indexed by the position of the row in the shard.
+    """
+    stream = io.BufferedReader(ByteRange(file_path, start, end), buffer_size=1 << 20)
+    try:
+        reader = pd.read_csv(stream, chunksize=pd_chunk_size, dtype=csv_dtypes, header=None, names=csv_headers,
+                             skiprows=(lambda line: line < start_row) if start_row else None)
+        for df in reader:
+            df.index = df.index + start_row
+            yield df
+    finally:
+        stream.close()
@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+
+from datetime import datetime
+
+from app.utils.const import progress_publish_interval, progress_publish_step_percent
+from app.utils.compression import decompressed_sample
+
+# Bytes read from the start of a file to estimate its number of rows
+estimate_sample_bytes = 1 << 20
+
+
+def estimate_rows(file_path):
+    """
+    Estimate the number of data rows of a CSV file from the line density of its first bytes.
+
+    Compressed files are sampled after decompression and scaled by the compression
+    ratio of the sample.
+
+    Args:
+        file_path (str): The path of the CSV file.
+
+    Returns:
+        int: The estimated number of rows, exact for files smaller than the sample.
+    """
+    size = os.path.getsize(file_path)
+    sample, consumed = decompressed_sample(file_path, estimate_sample_bytes)
+    if not sample:
+        return 0
+
+    lines = sample.count(b'\n') + (0 if sample.endswith(b'\n') else 1)
+    if consumed < size:
+        lines = int(lines * size / consumed)
+    # The header is not a data row
+    return max(lines - 1, 0)
+
+
+class ProgressPublisher:
+
+    def __init__(self, collection, file_id, estimated_rows=0, committed=0, prefix='', add_to_total=False):
+        """
+        Initialize a new instance of ProgressPublisher.
+
+        Receives the progress of every committed batch but writes it to the csv_files
+        document only when PROGRESS_PUBLISH_INTERVAL seconds have passed or the progress
+        moved by PROGRESS_PUBLISH_STEP_PERCENT of the estimated rows since the last write,
+        so the number of writes does not grow with the number of batches.
+
+        checkpoint_progress only counts the rows before the checkpoint: the batches
+        committed past it are written again by a resumed run, which counts them then.
+        The top level progress of a sharded file adds the same count for that reason.
+
+        Args:
+            collection (pymongo.collection.Collection): The csv_files collection.
+            file_id (ObjectId): The id of the csv_files document.
+            estimated_rows (int, optional): The estimated number of rows to process.
+            committed (int, optional): The rows committed before the checkpoint by a previous
+                run, when resuming.
+            prefix (str, optional): Prefix of the progress fields, 'shards.<i>.' for a shard.
+            add_to_total (bool, optional): Also add the rows newly committed before the
+                checkpoint to the top level progress, used by shards.
+        """
+        self.collection = collection
+        self.file_id = file_id
+        self.prefix = prefix
+        self.add_to_total = add_to_total
+        self.interval = float(os.environ.get('PROGRESS_PUBLISH_INTERVAL', progress_publish_interval))
+        step_percent = float(os.environ.get('PROGRESS_PUBLISH_STEP_PERCENT', progress_publish_step_percent))
+        self.step_rows = estimated_rows * step_percent / 100
+
+        self.lock = threading.Lock()
+        self.committed = committed
+        self.processed = committed
+        self.checkpoint = 0
+        self.checkpoint_processed = committed
+        self.published = committed
+        self.published_checkpoint = committed
+        self.published_at = time.monotonic()
+        self.started_at = time.monotonic()
+
+    def update(self, processed, checkpoint, checkpoint_processed):
+        """
+        Record the progress after a committed batch, writing it if it is due.
+
+        Called from the ingestion writer threads.
+
+        Args:
+            processed (int): The total number of committed rows.
+            checkpoint (int): The row before which every row is committed.
+            checkpoint_processed (int): The number of committed rows before the checkpoint.
+        """
+        with self.lock:
+            self.processed = max(processed, self.processed)
+            self.checkpoint = max(checkpoint, self.checkpoint)
+            self.checkpoint_processed = max(checkpoint_processed, self.checkpoint_processed)
+
+            due = time.monotonic() - self.published_at >= self.interval
+            stepped = self.step_rows and self.processed - self.published >= self.step_rows
+            if due or stepped:
+                self.publish()
+
+    def flush(self):
+        """
+        Write the latest progress if it has not been written yet.
+        """
+        with self.lock:
+            if self.processed != self.published or self.checkpoint_processed != self.published_checkpoint:
+                self.publish()
+
+    def publish(self):
+        # Called with the lock held
+        seconds = time.monotonic() - self.started_at
+        update = {
+            '$max': {self.prefix + 'progress': self.processed,
+                     self.prefix + 'checkpoint': self.checkpoint,
+                     self.prefix + 'checkpoint_progress': self.checkpoint_processed},
+            '$set': {self.prefix + 'rows_per_second': (self.processed - self.committed) / seconds if seconds else 0.0,
+                     'updated_at': datetime.now()}
+        }
+        if self.add_to_total:
+            update['$inc'] = {'progress': self.checkpoint_processed - self.published_checkpoint}
+        self.collection.update_one({'_id': self.file_id}, update)
+
+        self.published = self.processed
+        self.published_checkpoint = self.checkpoint_processed
+        self.published_at = time.monotonic()
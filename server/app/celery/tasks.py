@@ -1,21 +1,168 @@
 import os
 import logging
-import pandas as pd
+from functools import partial
 from bson.objectid import ObjectId
 from datetime import datetime
+from pymongo import ReturnDocument
 
 from . import celery
 from app.database import SessionManager, Collections
-from app.utils.const import csv_headers, pd_chunk_size
+from app.database.facets import increment_facets
+from app.database.versions import bump_version
+from app.utils.compression import file_compression
+from app.utils.const import csv_headers, csv_shard_bytes
+from .parsing import read_chunks, read_header, read_shard_chunks, shard_offsets, parse_chunk
+from .ingest import IngestPipeline, insert_ignoring_duplicates
+from .progress import ProgressPublisher, estimate_rows
 
 logger = logging.getLogger(__name__)
 
+# Files larger than this are split into shards of about this size, 0 disables fan-out
+shard_bytes = int(os.environ.get('CSV_SHARD_BYTES', csv_shard_bytes))
 
-@celery.task()
+
+def ingest_chunks(db, file, chunks, pipeline, shard=0):
+    """
+    Parse CSV chunks and queue their rows into an ingestion pipeline.
+
+    Rows that cannot be converted are written to the quarantined_rows collection,
+    the others get the file metadata and their natural key (source_shard, source_row).
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        file (dict): The csv_files document.
+        chunks (iterator): pandas.DataFrame chunks indexed by row position.
+        pipeline (IngestPipeline): The pipeline writing into the movies collection.
+        shard (int, optional): The shard the chunks belong to, 0 for unsharded files.
+    """
+    csv_files_collection = db.get_collection(Collections.csv_files)
+    quarantine_collection = db.get_collection(Collections.quarantined_rows)
+
+    for df in chunks:
+        # Convert the typed columns, replace null values with empty strings
+        # and set aside the rows that cannot be converted
+        df, bad_rows = parse_chunk(df)
+
+        # Keep the rows that cannot be converted for inspection,
+        # rows already quarantined by a previous run are skipped
+        if bad_rows:
+            for row in bad_rows:
+                row['file_id'] = file['_id']
+                row['shard'] = shard
+                row['created_at'] = datetime.now()
+            insert_ignoring_duplicates(quarantine_collection, bad_rows)
+            quarantined = quarantine_collection.count_documents({'file_id': file['_id']})
+            csv_files_collection.update_one(
+                {'_id': file['_id']},
+                {'$set': {'quarantined': quarantined}}
+            )
+
+        # Add additional columns to the DataFrame
+        df['created_at'] = datetime.now()
+        df['updated_at'] = datetime.now()
+        df['created_by'] = file['uploaded_by']
+        df['sourced_from'] = file['_id']
+        # Position of the row in the file (or shard), the natural key of the document
+        df['source_shard'] = shard
+        df['source_row'] = df.index
+
+        # Queue the rows for insertion into the movies collection
+        pipeline.put(df.to_dict('records'))
+
+
+def fan_out(db, file):
+    """
+    Split a CSV file into byte range shards and queue one process_csv_shard task per shard.
+
+    Only pending shards are queued, when the task runs again after a redelivery.
+    A shard in progress belongs to the task that claimed it, which is redelivered
+    itself if its worker is lost, and a done shard has nothing left to do.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        file (dict): The csv_files document.
+    """
+    csv_files_collection = db.get_collection(Collections.csv_files)
+
+    shards = file.get('shards')
+    if not shards:
+        estimated_rows = estimate_rows(file['filepath'])
+        size = os.path.getsize(file['filepath']) or 1
+        shards = [{
+            'start': start,
+            'end': end,
+            'status': 'pending',
+            'progress': 0,
+            'checkpoint': 0,
+            'checkpoint_progress': 0,
+            'estimated_rows': int(estimated_rows * (end - start) / size)
+        } for start, end in shard_offsets(file['filepath'], shard_bytes)]
+        csv_files_collection.update_one(
+            {'_id': file['_id']},
+            {'$set': {'shards': shards, 'shards_done': 0, 'estimated_rows': estimated_rows,
+                      'ingest_started_at': datetime.now(), 'updated_at': datetime.now()}}
+        )
+        logger.info('Split {} into {} shards'.format(file['filepath'], len(shards)))
+
+    for i, shard in enumerate(shards):
+        if shard['status'] == 'pending':
+            process_csv_shard.delay(str(file['_id']), i)
+
+
+def finish_shards(db, file):
+    """
+    Set the final status of a sharded file once every shard is done.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        file (dict): The csv_files document, with every shard processed or failed.
+    """
+    csv_files_collection = db.get_collection(Collections.csv_files)
+
+    failed = [i for i, shard in enumerate(file['shards']) if shard['status'] == 'failed']
+    if failed:
+        csv_files_collection.update_one(
+            {'_id': file['_id']},
+            {'$set': {'status': 'failed',
+                      'error': 'Failed shards: {}'.format(', '.join(str(i) for i in failed)),
+                      'processed_at': datetime.now(),
+                      'updated_at': datetime.now()}}
+        )
+    else:
+        rows = sum(shard['progress'] for shard in file['shards'])
+        seconds = (datetime.now() - file['ingest_started_at']).total_seconds()
+        csv_files_collection.update_one(
+            {'_id': file['_id']},
+            {'$set': {'status': 'processed',
+                      'progress': rows,
+                      'rows_per_second': rows / seconds if seconds else 0.0,
+                      'ingest_seconds': seconds,
+                      'processed_at': datetime.now(),
+                      'updated_at': datetime.now()}}
+        )
+        logger.info('File processed successfully: {}'.format(file['filepath']))
+
+    # Invalidate the cached counts of the movies collection
+    bump_version(db, Collections.movies)
+
+
+# acks_late with reject_on_worker_lost puts the task back on the queue if the worker dies,
+# the retry resumes from the checkpoint stored on the csv_files document
+@celery.task(acks_late=True, reject_on_worker_lost=True)
 def process_csv(file_id):
     """
     Celery task to process a CSV file.
 
+    Ingestion is resumable and idempotent: the csv_files document records the
+    row before which every row has been written (checkpoint), a re-run starts
+    from there, and rows are keyed on (sourced_from, source_shard, source_row)
+    so the rows written after the checkpoint are not duplicated.
+
+    Files larger than CSV_SHARD_BYTES are split into byte ranges aligned on records
+    processed in parallel by process_csv_shard tasks; the last shard to finish sets
+    the status of the file. Compressed files are decompressed as a stream by a
+    single task.
+
     Args:
         file_id (str): The ObjectId of the file to be processed.
 
@@ -27,86 +174,112 @@ def process_csv(file_id):
         # Retrieve the file from the database
         csv_files_collection = db.get_collection(Collections.csv_files)
         file = csv_files_collection.find_one({'_id': ObjectId(file_id)})
-        
+
+        # A redelivered task for a file that is already done has nothing to do
+        if file and file.get('status') == 'processed':
+            logger.info('File already processed: {}'.format(file_id))
+            return
+
+        # Every shard is done but the file status was not set, a redelivered task
+        # only finishes it, whatever status the shards ended in
+        if file and file.get('shards') and file.get('shards_done', 0) == len(file['shards']):
+            finish_shards(db, file)
+            return
+
         # If the file exists
         if file:
             try:
                 # Get the file path
                 file_path = file['filepath']
-                
+
                 # If the file exists
                 if os.path.exists(file_path):
-                    # Update the file status in the database
+                    # Update the file status in the database, the estimated rows
+                    # and start time let clients compute the remaining time
+                    file['estimated_rows'] = file.get('estimated_rows') or estimate_rows(file_path)
+                    file['ingest_started_at'] = file.get('ingest_started_at') or datetime.now()
                     csv_files_collection.update_one(
-                        {'_id': file['_id']}, 
-                        {'$set': {'status': 'in_progress', 'updated_at': datetime.now()}}
+                        {'_id': file['_id']},
+                        {'$set': {'status': 'in_progress',
+                                  'estimated_rows': file['estimated_rows'],
+                                  'ingest_started_at': file['ingest_started_at'],
+                                  'updated_at': datetime.now()}}
                     )
-                    
+
+                    # Large files are split across workers, the shards set the final status.
+                    # Compressed files are read as a single stream since they cannot be split
+                    compressed = file_compression(file_path) is not None
+                    large = shard_bytes and os.path.getsize(file_path) > shard_bytes
+                    if file.get('shards') or (large and not compressed):
+                        if read_header(file_path) != csv_headers:
+                            raise ValueError('Invalid header')
+                        fan_out(db, file)
+                        return
+
+                    # Resume after the rows committed by a previous run
+                    checkpoint = file.get('checkpoint', 0)
+                    if checkpoint:
+                        logger.info('Resuming {} from row {}'.format(file_path, checkpoint))
+
                     # Read the CSV file in chunks
-                    chunk = pd.read_csv(file_path, chunksize=pd_chunk_size)
+                    chunk = iter(read_chunks(file_path, start_row=checkpoint))
                     movies_collection = db.get_collection(Collections.movies)
                     success = True
-                    processed = 0
-                    
-                    # Iterate over the chunks
-                    for i, df in enumerate(chunk):
+
+                    committed = file.get('checkpoint_progress', 0) if checkpoint else 0
+
+                    # Progress is written at most once per interval or step, not once per batch.
+                    # The movies version is bumped once the file is done, not as rows land,
+                    # so cached pages and ETags stay valid while it loads
+                    publisher = ProgressPublisher(csv_files_collection, file['_id'], file['estimated_rows'],
+                                                  committed=committed)
+
+                    # Parse in this thread while the pipeline writes the previous batches,
+                    # the facet counts follow each batch of inserted rows
+                    pipeline = IngestPipeline(movies_collection, on_commit=publisher.update,
+                                              on_insert=partial(increment_facets, db),
+                                              committed=committed, checkpoint=checkpoint)
+                    with pipeline:
                         # Validate the header on the first chunk
-                        if i == 0:
-                            if df.columns.tolist() != csv_headers:
-                                success = False
-                                logger.info('Invalid header')
-                                # Update the file status in the database
-                                csv_files_collection.update_one(
-                                    {'_id': file['_id']}, 
-                                    {'$set': {'status': 'failed', 
-                                            'error': 'Invalid header', 
-                                            'processed_at': datetime.now(), 
-                                            'updated_at': datetime.now()}}
-                                )
-                                break
-                        
-                        # Add additional columns to the DataFrame
-                        df['created_at'] = datetime.now()
-                        df['updated_at'] = datetime.now()
-                        df['created_by'] = file['uploaded_by']
-                        df['sourced_from'] = file['_id']
-                        df['date_added'] = df['date_added'].apply(lambda x: datetime.strptime(x, '%B %d, %Y'))
-
-                        # Replace null values with empty strings
-                        df = df.fillna('')
-
-                        # Convert DataFrame to list of dictionaries
-                        data = df.to_dict('records')
-                        
-                        # Insert the data into the movies collection
-                        movies_collection.insert_many(data)
-                        
-                        # Update the progress
-                        processed += len(data)
-                        logger.info('Progress: {}'.format(processed))
-                        
-                        # Update the file status in the database
-                        csv_files_collection.update_one(
-                            {'_id': file['_id']}, 
-                            {'$set': {'progress': processed, 'updated_at': datetime.now()}}
-                        )
+                        first = next(chunk, None)
+                        if first is not None and first.columns.tolist() != csv_headers:
+                            success = False
+                            logger.info('Invalid header')
+                            # Update the file status in the database
+                            csv_files_collection.update_one(
+                                {'_id': file['_id']},
+                                {'$set': {'status': 'failed',
+                                        'error': 'Invalid header',
+                                        'processed_at': datetime.now(),
+                                        'updated_at': datetime.now()}}
+                            )
+                        elif first is not None:
+                            ingest_chunks(db, file, [first], pipeline)
+                            ingest_chunks(db, file, chunk, pipeline)
+
+                    publisher.flush()
 
                     # If the file was processed successfully
                     if success:
+                        stats = pipeline.stats()
                         # Update the file status in the database
                         csv_files_collection.update_one(
-                            {'_id': file['_id']}, 
-                            {'$set': {'status': 'processed', 
-                                    'processed_at': datetime.now(), 
+                            {'_id': file['_id']},
+                            {'$set': {'status': 'processed',
+                                    'progress': stats['rows'],
+                                    'checkpoint': stats['checkpoint'],
+                                    'rows_per_second': stats['rows_per_second'],
+                                    'ingest_seconds': stats['seconds'],
+                                    'processed_at': datetime.now(),
                                     'updated_at': datetime.now()}}
                         )
-                        logger.info('File processed successfully: {}'.format(file_path))    
+                        logger.info('File processed successfully: {}'.format(file_path))
                 else:
                     logger.info('File not found')
                     # Update the file status in the database
                     csv_files_collection.update_one(
-                        {'_id': file['_id']}, 
-                        {'$set': {'status': 'failed', 
+                        {'_id': file['_id']},
+                        {'$set': {'status': 'failed',
                                 'error': 'File not found',
                                 'processed_at': datetime.now(),
                                 'updated_at': datetime.now()}}
@@ -115,11 +288,89 @@ def process_csv(file_id):
                 logger.info(e)
                 # Update the file status in the database
                 csv_files_collection.update_one(
-                    {'_id': file['_id']}, 
-                    {'$set': {'status': 'failed', 
-                            'error': str(e), 
-                            'processed_at': datetime.now(), 
+                    {'_id': file['_id']},
+                    {'$set': {'status': 'failed',
+                            'error': str(e),
+                            'processed_at': datetime.now(),
                             'updated_at': datetime.now()}}
-                )     
+                )
+
+            # Invalidate the cached counts of the movies collection, rows may have
+            # been inserted even if the file failed part way through
+            bump_version(db, Collections.movies)
         else:
             logger.info('File not found')
+
+
+@celery.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_csv_shard(self, file_id, shard_index):
+    """
+    Celery task to process one byte range shard of a CSV file.
+
+    Each shard keeps its own progress and checkpoint under shards.<index> on the
+    csv_files document, and adds its committed rows to the progress of the file.
+
+    A task first claims its shard, moving it from pending to in_progress. A shard
+    queued again while another task runs it is skipped, so its rows and progress
+    are not counted twice. The claim records the task id, so this task redelivered
+    after its worker was lost takes the shard back and resumes from its checkpoint.
+
+    Args:
+        file_id (str): The ObjectId of the file.
+        shard_index (int): The position of the shard in the shards list.
+
+    Returns:
+        None
+    """
+    with SessionManager() as (client, db):
+        csv_files_collection = db.get_collection(Collections.csv_files)
+
+        prefix = 'shards.{}.'.format(shard_index)
+        file = csv_files_collection.find_one_and_update(
+            {'_id': ObjectId(file_id),
+             '$or': [{prefix + 'status': 'pending'},
+                     {prefix + 'status': 'in_progress', prefix + 'task_id': self.request.id}]},
+            {'$set': {prefix + 'status': 'in_progress', prefix + 'task_id': self.request.id,
+                      'updated_at': datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not file:
+            logger.info('Shard not found, done or run by another task: {} {}'.format(file_id, shard_index))
+            return
+
+        shard = file['shards'][shard_index]
+        try:
+            # The file progress is the sum of the shards, each write adds what the shard committed
+            publisher = ProgressPublisher(csv_files_collection, file['_id'], shard.get('estimated_rows', 0),
+                                          committed=shard['checkpoint_progress'], prefix=prefix, add_to_total=True)
+
+            chunks = read_shard_chunks(file['filepath'], shard['start'], shard['end'], shard['checkpoint'])
+            pipeline = IngestPipeline(db.get_collection(Collections.movies), on_commit=publisher.update,
+                                      on_insert=partial(increment_facets, db),
+                                      committed=shard['checkpoint_progress'], checkpoint=shard['checkpoint'])
+            with pipeline:
+                ingest_chunks(db, file, chunks, pipeline, shard=shard_index)
+            publisher.flush()
+
+            stats = pipeline.stats()
+            update = {prefix + 'status': 'processed',
+                      prefix + 'progress': stats['rows'],
+                      prefix + 'checkpoint': stats['checkpoint'],
+                      prefix + 'rows_per_second': stats['rows_per_second']}
+        except Exception as e:
+            logger.info(e)
+            update = {prefix + 'status': 'failed', prefix + 'error': str(e)}
+
+        # Mark the shard done, only the first run to do so counts it, and the
+        # run that completes the last shard sets the status of the file
+        update['updated_at'] = datetime.now()
+        file = csv_files_collection.find_one_and_update(
+            {'_id': file['_id'], prefix + 'status': {'$nin': ['processed', 'failed']}},
+            {'$set': update, '$inc': {'shards_done': 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if file and file['shards_done'] == len(file['shards']):
+            finish_shards(db, file)
+        elif file:
+            # The rows of the shard are in, cached pages and ETags of the movies are stale
+            bump_version(db, Collections.movies)
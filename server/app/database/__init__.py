@@ -1 +1 @@
-from .connections import SessionManager, Collections
+from .connections import SessionManager, Collections, get_client, close_client, pool_stats
@@ -0,0 +1,75 @@
+import os
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .connections import mongo_uri, pool_options, pool_listener, command_listener
+
+logger = logging.getLogger(__name__)
+
+# The motor client of the process and the pid that created it
+_client = None
+_client_pid = None
+
+
+def get_async_client():
+    """
+    Get the process-wide motor client, creating it on first use.
+
+    It uses the same pool settings and listeners as the pymongo client, so the
+    pool and command metrics cover both. Motor binds the client to the running
+    event loop on first use, the ASGI server runs one loop per worker process.
+
+    Returns:
+        motor.motor_asyncio.AsyncIOMotorClient: The shared motor client.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        _client = AsyncIOMotorClient(mongo_uri, connect=False, event_listeners=[pool_listener, command_listener],
+                                     **pool_options)
+        _client_pid = pid
+        logger.info('Created motor client for process {}'.format(pid))
+    return _client
+
+
+def close_async_client():
+    """
+    Close the process-wide motor client, if one exists.
+    """
+    global _client, _client_pid
+
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+        logger.info('Disconnected motor client from MongoDB')
+    _client = None
+    _client_pid = None
+
+
+class AsyncSessionManager:
+
+    def __init__(self):
+        """
+        Initialize a new instance of AsyncSessionManager.
+
+        The async counterpart of SessionManager, hands out the process-wide
+        motor client and database with an async context manager interface.
+        """
+        self.client = None
+        self.db = None
+
+    async def __aenter__(self):
+        """
+        Returns:
+            tuple: The motor client and database objects.
+        """
+        pool_listener.incr('sessions')
+        self.client = get_async_client()
+        self.db = self.client.get_database()
+        return self.client, self.db
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # The client is shared by the whole process, it is closed on shutdown only
+        self.client = None
+        self.db = None
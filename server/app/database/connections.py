@@ -1,18 +1,331 @@
 import os
+import time
 import logging
+import threading
 
 from pymongo import MongoClient
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+
+from app.utils.const import (mongo_max_pool_size, mongo_min_pool_size, mongo_max_idle_time_ms,
+                             mongo_wait_queue_timeout_ms, mongo_connect_timeout_ms,
+                             mongo_server_selection_timeout_ms)
+from app.utils.metrics import registry, Counter, Histogram
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 mongo_uri = os.environ.get('MONGO_URI')
 
+# Pool settings, read once per process from the environment
+pool_options = {
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', mongo_max_pool_size)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', mongo_min_pool_size)),
+    'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', mongo_max_idle_time_ms)),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', mongo_wait_queue_timeout_ms)),
+    'connectTimeoutMS': int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', mongo_connect_timeout_ms)),
+    'serverSelectionTimeoutMS': int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS',
+                                                   mongo_server_selection_timeout_ms)),
+}
+
 
 class Collections(object):
     users = 'users'
     csv_files = 'csv_files'
     movies = 'movies'
+    revoked_tokens = 'revoked_tokens'
+    versions = 'versions'
+    quarantined_rows = 'quarantined_rows'
+    movie_facets = 'movie_facets'
+
+    # Index spec per collection, applied by app.database.indexes.ensure_indexes.
+    # Sort keys are paired with _id to match the tie-breaker used by keyset pagination,
+    # mongo walks the same index backwards for descending sorts.
+    indexes = {
+        users: [
+            {'keys': [('username', 1)], 'unique': True},
+        ],
+        movies: [
+            {'keys': [('sourced_from', 1)]},
+            # Natural key of a row, makes re-ingesting a file idempotent. Partial so that
+            # documents ingested before rows were numbered do not collide
+            {'keys': [('sourced_from', 1), ('source_shard', 1), ('source_row', 1)], 'unique': True,
+             'partialFilterExpression': {'source_row': {'$exists': True}}},
+            {'keys': [('show_id', 1), ('_id', 1)]},
+            {'keys': [('created_at', 1), ('_id', 1)]},
+            {'keys': [('updated_at', 1), ('_id', 1)]},
+            {'keys': [('release_year', 1), ('_id', 1)]},
+            {'keys': [('duration', 1), ('_id', 1)]},
+            {'keys': [('date_added', 1), ('_id', 1)]},
+            {'keys': [('type', 1)]},
+            # Multikey indexes on the fields stored as arrays, one entry per value
+            {'keys': [('country', 1)]},
+            {'keys': [('cast', 1)]},
+            {'keys': [('director', 1)]},
+            {'keys': [('listed_in', 1)]},
+            # Full-text search on title, director and cast, without stemming or stop words
+            # since titles and names come in many languages. Every item of the director
+            # and cast arrays is indexed, so searching a partial name still works
+            {'keys': [('title', 'text'), ('director', 'text'), ('cast', 'text')],
+             'weights': {'title': 10, 'director': 5, 'cast': 2},
+             'default_language': 'none', 'name': 'movies_text'},
+        ],
+        csv_files: [
+            {'keys': [('created_at', 1), ('_id', 1)]},
+            {'keys': [('updated_at', 1), ('_id', 1)]},
+            {'keys': [('status', 1)]},
+            {'keys': [('filename', 1)]},
+            # One record per file content, an identical upload reuses it. Partial so that
+            # files uploaded before hashing do not collide
+            {'keys': [('content_hash', 1)], 'unique': True,
+             'partialFilterExpression': {'content_hash': {'$exists': True}}},
+        ],
+        quarantined_rows: [
+            {'keys': [('file_id', 1), ('shard', 1), ('row', 1)], 'unique': True},
+        ],
+        # One bucket per facet value, read largest first
+        movie_facets: [
+            {'keys': [('facet', 1), ('value', 1)], 'unique': True},
+            {'keys': [('facet', 1), ('count', -1)]},
+        ],
+        revoked_tokens: [
+            {'keys': [('jti', 1)], 'unique': True},
+            # Expired revocations are removed by mongo once the token itself has expired
+            {'keys': [('expires_at', 1)], 'expireAfterSeconds': 0},
+        ],
+    }
+
+
+class PoolStatsListener(ConnectionPoolListener):
+    """
+    Connection pool listener that keeps counters on checkouts and wait time.
+
+    The counters are per process and are reset whenever the shared client
+    is re-created after a fork.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Checkout start times are tracked per thread, pymongo emits the
+        # started/finished events for one checkout on the same thread
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        with self.lock:
+            self.counters = {
+                'sessions': 0,
+                'checkouts': 0,
+                'checkout_failures': 0,
+                'checked_in': 0,
+                'connections_created': 0,
+                'connections_closed': 0,
+                'wait_time_total': 0.0,
+                'wait_time_max': 0.0,
+            }
+
+    def incr(self, key, value=1):
+        with self.lock:
+            self.counters[key] += value
+
+    def record_wait(self):
+        # Measure how long the thread waited for a connection from the pool
+        started = getattr(self.local, 'started', None)
+        if started is None:
+            return
+        self.local.started = None
+        waited = time.perf_counter() - started
+        with self.lock:
+            self.counters['wait_time_total'] += waited
+            self.counters['wait_time_max'] = max(self.counters['wait_time_max'], waited)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: A copy of the current counters.
+        """
+        with self.lock:
+            return dict(self.counters)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.incr('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.incr('connections_closed')
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self.record_wait()
+        self.incr('checkout_failures')
+
+    def connection_checked_out(self, event):
+        self.record_wait()
+        self.incr('checkouts')
+
+    def connection_checked_in(self, event):
+        self.incr('checked_in')
+
+
+pool_listener = PoolStatsListener()
+
+mongo_command_duration = registry.register(Histogram(
+    'mongo_command_duration_seconds', 'Duration of MongoDB commands.', ('collection', 'command')))
+mongo_command_failures = registry.register(Counter(
+    'mongo_command_failures_total', 'MongoDB commands that returned an error.', ('collection', 'command')))
+
+
+class CommandStatsListener(CommandListener):
+    """
+    Command listener that records the duration of every MongoDB command,
+    tagged by collection and command name.
+
+    Only the started event carries the command document, so the collection is
+    kept per request id until the command succeeds or fails.
+    """
+
+    def __init__(self):
+        self.collections = {}
+
+    def started(self, event):
+        command = event.command
+        # getMore names its collection separately, the command value is the cursor id
+        collection = command.get('collection') if event.command_name == 'getMore' else command.get(event.command_name)
+        self.collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ''
+
+    def succeeded(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), '')
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), '')
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_command_failures.inc(collection, event.command_name)
+
+
+command_listener = CommandStatsListener()
+
+# The shared client and the pid of the process that created it
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Get the process-wide MongoDB client, creating it on first use.
+
+    The client is re-created if the current process is not the one that
+    created it, so forked gunicorn and celery prefork workers never share
+    sockets with their parent.
+
+    Returns:
+        pymongo.MongoClient: The shared MongoDB client.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            # connect=False defers the first connection until the client is used,
+            # so a client created before a fork never opens sockets in the parent
+            _client = MongoClient(mongo_uri, connect=False, event_listeners=[pool_listener, command_listener], **pool_options)
+            _client_pid = pid
+            pool_listener.reset()
+            logger.info('Created MongoDB client for process {}'.format(pid))
+    return _client
+
+
+def close_client():
+    """
+    Close the process-wide MongoDB client, if one exists.
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+            logger.info('Disconnected from MongoDB')
+        _client = None
+        _client_pid = None
+
+
+def _reset_client_after_fork():
+    """
+    Drop the inherited client in a forked child without closing it,
+    the parent still owns the sockets.
+    """
+    global _client, _client_pid, _client_lock
+
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_client_after_fork)
+
+
+def pool_stats():
+    """
+    Get connection pool statistics for the current process.
+
+    Returns:
+        dict: Session and checkout counters, wait times in seconds and pool settings.
+    """
+    stats = pool_listener.snapshot()
+    stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    stats['max_pool_size'] = pool_options['maxPoolSize']
+    stats['min_pool_size'] = pool_options['minPoolSize']
+    stats['pid'] = os.getpid()
+    return stats
+
+
+def collect_pool_stats():
+    """
+    Expose the connection pool statistics of the process as metrics.
+
+    Returns:
+        list: (name, type, help, samples) tuples for the metrics registry.
+    """
+    stats = pool_stats()
+    counters = ('sessions', 'checkouts', 'checkout_failures', 'checked_in', 'connections_created',
+                'connections_closed')
+    metrics = []
+    for key in counters:
+        name = 'mongo_pool_{}_total'.format(key)
+        metrics.append((name, 'counter', 'Connection pool {}.'.format(key.replace('_', ' ')), [(name, {}, stats[key])]))
+    metrics.append(('mongo_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.',
+                    [('mongo_pool_wait_seconds_total', {}, stats['wait_time_total'])]))
+    metrics.append(('mongo_pool_wait_seconds_max', 'gauge', 'Longest wait for a pooled connection.',
+                    [('mongo_pool_wait_seconds_max', {}, stats['wait_time_max'])]))
+    metrics.append(('mongo_pool_max_size', 'gauge', 'Maximum connections per server.',
+                    [('mongo_pool_max_size', {}, stats['max_pool_size'])]))
+    return metrics
+
+
+registry.register_collector(collect_pool_stats)
 
 
 class SessionManager:
@@ -21,8 +334,8 @@ class SessionManager:
         """
         Initialize a new instance of SessionManager.
 
-        This class is responsible for managing the MongoDB connection
-        and provides a context manager interface for using the database.
+        This class hands out the process-wide MongoDB client and
+        provides a context manager interface for using the database.
 
         Attributes:
             mongo_uri (str): The URI of the MongoDB database.
@@ -31,7 +344,7 @@ class SessionManager:
         """
         # Get the URI of the MongoDB database from the environment variables
         self.mongo_uri = mongo_uri
-        
+
         # Initialize the MongoDB client and database objects
         self.client = None
         self.db = None
@@ -40,15 +353,15 @@ class SessionManager:
         """
         Context manager method to enter the context.
 
-        Initializes the MongoDB client and database objects,
+        Borrows the shared MongoDB client and database objects,
         and returns the client and database objects.
 
         Returns:
             tuple: A tuple containing the MongoDB client and database objects.
         """
-        # Initialize the MongoDB client
-        self.client = MongoClient(self.mongo_uri)
-        logger.info('Connected to MongoDB')
+        # Get the shared MongoDB client, connections are pooled inside it
+        self.client = get_client()
+        pool_listener.incr('sessions')
 
         # Get the MongoDB database
         self.db = self.client.get_database()
@@ -87,7 +400,10 @@ class SessionManager:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """
-        Exit the context manager and close the MongoDB client.
+        Exit the context manager.
+
+        The shared client is left open so its pooled connections can be
+        reused by the next session; use close_client() on shutdown.
 
         Args:
             exc_type: The type of the exception.
@@ -97,8 +413,6 @@ class SessionManager:
         Returns:
             None
         """
-        # Close the MongoDB client
-        self.client.close()
-        
-        # Log the disconnection message
-        logger.info('Disconnected from MongoDB')
+        # Release the references, the connections go back to the pool
+        self.client = None
+        self.db = None
@@ -0,0 +1,155 @@
+import logging
+
+from collections import Counter
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from .connections import Collections
+from .indexes import index_models
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+# Movie fields counted in the movie_facets collection
+facet_fields = ('type', 'country', 'rating', 'release_year', 'listed_in')
+
+# Fields holding several values, each value is counted on its own. They are arrays, or
+# comma separated strings in movies ingested before split-list-fields was run
+multi_valued_facets = {'country', 'listed_in'}
+
+
+def facet_values(document, field):
+    """
+    Get the values of a movie counted for a facet.
+
+    Args:
+        document (dict): The movie document.
+        field (str): The facet field.
+
+    Returns:
+        list: The non empty values, a multi valued field gives one value per item.
+    """
+    value = document.get(field)
+    if isinstance(value, list):
+        values = value
+    elif isinstance(value, str) and field in multi_valued_facets:
+        values = value.split(',')
+    else:
+        values = [value]
+
+    values = [value.strip() if isinstance(value, str) else value for value in values]
+    return [value for value in values if value not in (None, '')]
+
+
+def count_facets(documents):
+    """
+    Count the facet values of movies.
+
+    Args:
+        documents (iterable): The movie documents.
+
+    Returns:
+        collections.Counter: The number of movies per (facet, value).
+    """
+    counts = Counter()
+    for document in documents:
+        for field in facet_fields:
+            # A value listed twice in the same movie still counts the movie once
+            for value in set(facet_values(document, field)):
+                counts[(field, value)] += 1
+    return counts
+
+
+def facet_updates(counts):
+    """
+    Returns:
+        list: One upsert per (facet, value), adding its count.
+    """
+    now = datetime.now()
+    return [UpdateOne({'facet': field, 'value': value},
+                      {'$inc': {'count': count}, '$set': {'updated_at': now}},
+                      upsert=True)
+            for (field, value), count in counts.items()]
+
+
+def increment_facets(db, documents):
+    """
+    Add newly inserted movies to the facet counts.
+
+    Called by the ingestion writers with the documents each batch actually inserted,
+    so rows written again on a retry are not counted twice. A failure is logged and
+    ignored: the movies are already committed, and rebuild_facets recounts them.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        documents (list): The inserted movie documents.
+    """
+    updates = facet_updates(count_facets(documents))
+    if not updates:
+        return
+    try:
+        db.get_collection(Collections.movie_facets).bulk_write(updates, ordered=False)
+    except PyMongoError as e:
+        logger.error('Facet counts not updated, rebuild them: {}'.format(e))
+
+
+def rebuild_facets(db, batch_size=10000):
+    """
+    Recount the facets from the whole movies collection.
+
+    The counts are built in a separate collection, with the indexes of movie_facets,
+    which then replaces movie_facets in one rename, so readers never see partial
+    counts. Rows ingested while the rebuild runs may be missed, run it when no file
+    is being processed. The movies version is bumped so cached facet responses are
+    dropped.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        batch_size (int, optional): The number of movies read per batch.
+
+    Returns:
+        int: The number of (facet, value) buckets.
+    """
+    movies = db.get_collection(Collections.movies)
+    projection = {field: 1 for field in facet_fields}
+    updates = facet_updates(count_facets(movies.find({}, projection, batch_size=batch_size)))
+
+    staging = db.get_collection(Collections.movie_facets + '_rebuild')
+    staging.drop()
+    staging.create_indexes(index_models(Collections.movie_facets))
+    for start in range(0, len(updates), batch_size):
+        staging.bulk_write(updates[start:start + batch_size], ordered=False)
+    staging.rename(Collections.movie_facets, dropTarget=True)
+    bump_version(db, Collections.movies)
+    return len(updates)
+
+
+def facets_query(fields):
+    """
+    Returns:
+        tuple: The filter, projection and sort reading the buckets of the facets, largest first.
+    """
+    return ({'facet': {'$in': list(fields)}, 'count': {'$gt': 0}},
+            {'_id': 0, 'facet': 1, 'value': 1, 'count': 1},
+            [('facet', 1), ('count', -1)])
+
+
+def facets_result(buckets, fields, limit=None):
+    """
+    Group facet buckets by facet.
+
+    Args:
+        buckets (iterable): movie_facets documents read with facets_query.
+        fields (list): The requested facets, each gets a list even if it has no bucket.
+        limit (int, optional): The number of values kept per facet, the largest ones.
+
+    Returns:
+        dict: Per facet, a list of {'value', 'count'}.
+    """
+    result = {field: [] for field in fields}
+    for bucket in buckets:
+        values = result[bucket['facet']]
+        if limit is None or len(values) < limit:
+            values.append({'value': bucket['value'], 'count': bucket['count']})
+    return result
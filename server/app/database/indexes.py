@@ -0,0 +1,143 @@
+import logging
+import threading
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from .connections import Collections
+
+logger = logging.getLogger(__name__)
+
+# Fields with a supporting index per collection, loaded once per process
+_indexed_fields = {}
+# (collection, field) pairs already reported as unindexed
+_warned = set()
+_lock = threading.Lock()
+
+
+def index_models(collection_name):
+    """
+    Build pymongo index models from the spec declared in Collections.indexes.
+
+    Args:
+        collection_name (str): The name of the collection.
+
+    Returns:
+        list: A list of pymongo.IndexModel.
+    """
+    models = []
+    for spec in Collections.indexes.get(collection_name, []):
+        options = {key: value for key, value in spec.items() if key != 'keys'}
+        models.append(IndexModel(spec['keys'], **options))
+    return models
+
+
+def ensure_indexes(db):
+    """
+    Create the declared indexes on every collection.
+
+    Creating an index that already exists with the same spec is a no-op, so this
+    is safe to run on every startup. An index that conflicts with an existing one
+    is logged and skipped so one bad spec does not block the others.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+
+    Returns:
+        list: The names of the indexes that were created or already existed.
+    """
+    names = []
+    for collection_name in Collections.indexes:
+        collection = db.get_collection(collection_name)
+        for model in index_models(collection_name):
+            try:
+                names.extend(collection.create_indexes([model]))
+            except OperationFailure as e:
+                logger.error('index {} on {}: {}'.format(model.document['name'], collection_name, e))
+        logger.info('indexes ensured on {}'.format(collection_name))
+
+    # Reload the supported fields on the next check
+    with _lock:
+        _indexed_fields.clear()
+    return names
+
+
+def _supported_fields(index_information):
+    # The fields that are the prefix of an index, from index_information()
+    fields = {'_id'}
+    for index in index_information.values():
+        first_key, kind = index['key'][0]
+        if kind == 'text':
+            # Text indexes support the weighted fields rather than the _fts key
+            fields.update(index.get('weights', {}))
+        else:
+            fields.add(first_key)
+    return fields
+
+
+def _warn(collection_name, fields, supported):
+    # Request threads share _warned, only the first one to find a field logs it
+    with _lock:
+        unwarned = [field for field in fields if field not in supported and (collection_name, field) not in _warned]
+        _warned.update((collection_name, field) for field in unwarned)
+
+    for field in unwarned:
+        logger.warning('{}.{} is used for search or sort but has no supporting index'.format(collection_name, field))
+
+
+def indexed_fields(collection):
+    """
+    Get the fields that are the prefix of an index on a collection.
+
+    Args:
+        collection (pymongo.collection.Collection): The collection.
+
+    Returns:
+        set: The field names that can be used for an index seek or sort.
+    """
+    with _lock:
+        fields = _indexed_fields.get(collection.name)
+    if fields is None:
+        fields = _supported_fields(collection.index_information())
+        with _lock:
+            _indexed_fields[collection.name] = fields
+    return fields
+
+
+def warn_unindexed(collection, fields):
+    """
+    Log a warning, once per process, for each field that has no supporting index.
+
+    Args:
+        collection (pymongo.collection.Collection): The collection.
+        fields (iterable): The field names used for search or sort.
+    """
+    try:
+        supported = indexed_fields(collection)
+    except OperationFailure as e:
+        logger.error(e)
+        return
+    _warn(collection.name, fields, supported)
+
+
+async def warn_unindexed_async(collection, fields):
+    """
+    Log a warning, once per process, for each field that has no supporting index, through a motor collection.
+
+    Shares the supported fields and the warned fields with warn_unindexed.
+
+    Args:
+        collection (motor.motor_asyncio.AsyncIOMotorCollection): The collection.
+        fields (iterable): The field names used for search or sort.
+    """
+    with _lock:
+        supported = _indexed_fields.get(collection.name)
+    if supported is None:
+        try:
+            supported = _supported_fields(await collection.index_information())
+        except OperationFailure as e:
+            logger.error(e)
+            return
+        with _lock:
+            _indexed_fields[collection.name] = supported
+    _warn(collection.name, fields, supported)
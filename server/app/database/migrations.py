@@ -0,0 +1,59 @@
+import logging
+
+from .connections import Collections
+
+logger = logging.getLogger(__name__)
+
+
+def split_list_fields(db, fields):
+    """
+    Convert comma separated string fields of existing movies into arrays.
+
+    Movies ingested before these fields were split at ingestion keep strings, which
+    the exact value filters and their multikey indexes cannot match. Each field is
+    converted server side by one update with an aggregation pipeline, the same way
+    app.celery.parsing.split_values does it. Running it again only touches strings.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        fields (iterable): The fields to convert.
+
+    Returns:
+        dict: The number of movies converted per field.
+    """
+    movies = db.get_collection(Collections.movies)
+    converted = {}
+    for field in fields:
+        items = {'$map': {'input': {'$split': ['$' + field, ',']}, 'as': 'item',
+                          'in': {'$trim': {'input': '$$item'}}}}
+        result = movies.update_many(
+            {field: {'$type': 'string'}},
+            [{'$set': {field: {'$filter': {'input': items, 'as': 'item', 'cond': {'$ne': ['$$item', '']}}}}}]
+        )
+        converted[field] = result.modified_count
+        logger.info('{} movies converted on {}'.format(result.modified_count, field))
+    return converted
+
+
+def null_blank_values(db, fields):
+    """
+    Replace the empty strings stored in typed fields of existing movies with None.
+
+    Movies ingested before blank values were stored as None hold '' in typed fields,
+    which the keyset cursor cannot page through since $gt and $lt only match values
+    of the same type. Running it again finds nothing to convert.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        fields (iterable): The typed fields to convert.
+
+    Returns:
+        dict: The number of movies converted per field.
+    """
+    movies = db.get_collection(Collections.movies)
+    converted = {}
+    for field in fields:
+        result = movies.update_many({field: ''}, {'$set': {field: None}})
+        converted[field] = result.modified_count
+        logger.info('{} movies converted on {}'.format(result.modified_count, field))
+    return converted
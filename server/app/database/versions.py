@@ -0,0 +1,117 @@
+import os
+import time
+import logging
+import threading
+
+from datetime import datetime
+from pymongo import ReturnDocument
+
+from .connections import SessionManager, Collections
+from app.utils.const import version_check_interval
+
+logger = logging.getLogger(__name__)
+
+check_interval = float(os.environ.get('VERSION_CHECK_INTERVAL', version_check_interval))
+
+# collection name -> (version, updated_at, checked at)
+_versions = {}
+_lock = threading.Lock()
+
+
+def bump_version(db, collection_name):
+    """
+    Increment the data version of a collection.
+
+    Every process caching data derived from the collection compares its
+    copy of the version and drops stale entries once it changes.
+
+    Args:
+        db (pymongo.database.Database): The MongoDB database.
+        collection_name (str): The name of the collection whose data changed.
+
+    Returns:
+        int: The new version.
+    """
+    versions = db.get_collection(Collections.versions)
+    doc = versions.find_one_and_update(
+        {'_id': collection_name},
+        {'$inc': {'version': 1}, '$set': {'updated_at': datetime.now()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    with _lock:
+        _versions[collection_name] = (doc['version'], doc['updated_at'], time.monotonic())
+    logger.info('{} version: {}'.format(collection_name, doc['version']))
+    return doc['version']
+
+
+def _cached(collection_name):
+    # The cached version and updated_at, or None if it must be reloaded
+    with _lock:
+        cached = _versions.get(collection_name)
+    if cached and time.monotonic() - cached[2] < check_interval:
+        return cached[0], cached[1]
+    return None
+
+
+def _store(collection_name, doc):
+    version, updated_at = doc.get('version', 0), doc.get('updated_at')
+    with _lock:
+        _versions[collection_name] = (version, updated_at, time.monotonic())
+    return version, updated_at
+
+
+def get_version_info(collection_name):
+    """
+    Get the data version of a collection and when it last changed.
+
+    The value is reloaded from the database at most every check_interval seconds.
+
+    Args:
+        collection_name (str): The name of the collection.
+
+    Returns:
+        tuple: The version (0 if never bumped) and its updated_at datetime (or None).
+    """
+    cached = _cached(collection_name)
+    if cached:
+        return cached
+
+    with SessionManager() as (client, db):
+        versions = db.get_collection(Collections.versions)
+        doc = versions.find_one({'_id': collection_name}) or {}
+    return _store(collection_name, doc)
+
+
+async def get_version_info_async(db, collection_name):
+    """
+    Get the data version of a collection and when it last changed, through a motor database.
+
+    Shares the per-process cache with get_version_info.
+
+    Args:
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+        collection_name (str): The name of the collection.
+
+    Returns:
+        tuple: The version (0 if never bumped) and its updated_at datetime (or None).
+    """
+    cached = _cached(collection_name)
+    if cached:
+        return cached
+
+    doc = await db.get_collection(Collections.versions).find_one({'_id': collection_name}) or {}
+    return _store(collection_name, doc)
+
+
+def get_version(collection_name):
+    """
+    Get the data version of a collection.
+
+    Args:
+        collection_name (str): The name of the collection.
+
+    Returns:
+        int: The version, 0 if it was never bumped.
+    """
+    return get_version_info(collection_name)[0]
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+
+from functools import wraps
+from jwt import PyJWTError
+from bson import json_util
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from quart import Response, current_app, jsonify, request
+
+from app.database import Collections
+from app.database.aio import AsyncSessionManager
+from app.database.indexes import warn_unindexed_async
+from app.database.versions import get_version_info_async
+from .auth import verify_mode, user_cache, revocation_list, token_payload, user_from_claims
+from .helper import count_cache, result_cache, encode_cursor, page_query, page_result, result_cache_key
+from .streaming import PageEncoder
+
+logger = logging.getLogger(__name__)
+
+# Only one coroutine reloads the revoked token ids, the others keep using the previous set.
+# Created on first use so it belongs to the loop of the server
+revocation_lock = None
+
+
+async def is_revoked(db, jti):
+    """
+    Check whether a token id has been revoked, reloading the revocation list through motor when due.
+
+    Args:
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+        jti (str): The token id.
+
+    Returns:
+        bool: True if the token has been revoked.
+    """
+    global revocation_lock
+    if revocation_lock is None:
+        revocation_lock = asyncio.Lock()
+
+    if revocation_list.due() and (revocation_list.refreshed_at is None or not revocation_lock.locked()):
+        async with revocation_lock:
+            # Another coroutine may have reloaded it while this one waited
+            if revocation_list.due():
+                try:
+                    revoked_tokens = db.get_collection(Collections.revoked_tokens)
+                    revocation_list.update(await revoked_tokens.find(*revocation_list.query()).to_list(None))
+                except Exception as e:
+                    logger.error(e)
+    return jti in revocation_list.revoked
+
+
+async def load_user(db, user_id):
+    """
+    Load a user document by its id through motor, sharing the user cache with app.utils.auth.load_user.
+
+    Args:
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+        user_id (str): The id of the user.
+
+    Returns:
+        dict: The user document without its password, or None if the user does not exist.
+    """
+    if verify_mode != 'db':
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+
+    users = db.get_collection(Collections.users)
+    user = await users.find_one({'_id': ObjectId(user_id)}, {'password': 0})
+
+    if user and verify_mode != 'db':
+        user_cache.set(user_id, user)
+    return user
+
+
+def jwt_required(f):
+    """
+    Async counterpart of app.utils.auth.jwt_required, with the same checks and error responses.
+
+    The decorated coroutine receives the user object and the motor database.
+
+    Args:
+        f (function): The coroutine to be decorated.
+
+    Returns:
+        function: The decorated coroutine.
+    """
+
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        async with AsyncSessionManager() as (client, db):
+            try:
+                # Get the authorization header from the request and check the token
+                payload, error = token_payload(request.headers.get('Authorization'))
+                if error:
+                    return jsonify({'error': error}), 401
+                # Check if the token has been revoked
+                if payload.get('jti') and await is_revoked(db, payload['jti']):
+                    return jsonify({'error': 'Token has been revoked'}), 401
+                # Get the user from the claims without touching the database if allowed
+                user = user_from_claims(payload) if verify_mode == 'stateless' else None
+                if user is None:
+                    user = await load_user(db, payload['sub'])
+                # Check if the user exists
+                if not user:
+                    return jsonify({'error': 'Invalid token'}), 401
+            except (InvalidId, PyJWTError):
+                return jsonify({'error': 'Invalid token'}), 401
+
+            # Call the decorated coroutine with the user object
+            return await f(user, db, *args, **kwargs)
+
+    return decorated
+
+
+async def get_total_count(db, collection, find_context, exact=False, cache_counts=False):
+    """
+    Async counterpart of app.utils.helper.get_total_count, sharing its count cache.
+
+    Returns:
+        tuple: the count and 'exact' or 'estimated'
+    """
+    if not find_context and not exact:
+        return await collection.estimated_document_count(), 'estimated'
+
+    if not cache_counts:
+        return await collection.count_documents(find_context), 'exact'
+
+    version, _ = await get_version_info_async(db, collection.name)
+    key = (collection.name, version, json_util.dumps(find_context, sort_keys=True))
+    total_count = count_cache.get(key)
+    if total_count is None:
+        total_count = await collection.count_documents(find_context)
+        count_cache.set(key, total_count)
+    return total_count, 'exact'
+
+
+async def paginator(db, collection, rqst_args, search_allowed_fields, sort_allowed_fields, text_search_fields=None,
+                    projection_allowed_fields=None, filter_allowed_fields=None, cache_counts=False,
+                    cache_results=False, lazy=False):
+    """
+    Async counterpart of app.utils.helper.paginator, running the same page query through motor.
+
+    Args:
+        db (motor.motor_asyncio.AsyncIOMotorDatabase): The MongoDB database.
+        collection (motor.motor_asyncio.AsyncIOMotorCollection): The collection.
+        rqst_args (object): request args
+        search_allowed_fields (dict): allowed fields for search
+        sort_allowed_fields (dict): allowed fields for sort
+        text_search_fields (set): search fields covered by the collection text index
+        projection_allowed_fields (set): fields that may be requested with the fields argument
+        filter_allowed_fields (set): multi valued fields that can be filtered on by exact values
+        cache_counts (bool): cache filtered counts until the collection version changes
+        cache_results (bool): cache whole pages until the collection version changes, shared with
+            app.utils.helper.paginator
+        lazy (bool): return the open motor cursor as data instead of a list
+
+    Raises:
+        ValueError: if the cursor or a requested field is invalid
+
+    Returns:
+        dict: total_count, count_type, data, page, page_size, skip, next_cursor, cursor_sort_key
+    """
+    # Warn once per process about allowed fields that would cause a collection scan
+    await warn_unindexed_async(collection, list(search_allowed_fields or {}) + list(sort_allowed_fields or {}) +
+                               list(filter_allowed_fields or ()))
+
+    query = page_query(rqst_args, search_allowed_fields, sort_allowed_fields, text_search_fields,
+                       projection_allowed_fields, filter_allowed_fields)
+
+    # Serve repeated pages from memory, the key changes as soon as the collection version does
+    key = None
+    if cache_results and not lazy:
+        version, _ = await get_version_info_async(db, collection.name)
+        key = result_cache_key(collection.name, version, query)
+        result = result_cache.get(key)
+        if result is not None:
+            return dict(result)
+
+    # A text search matching nothing, e.g. on a partial word, is run again with a word prefix regex
+    if query['fallback'] and await collection.find_one(query['count_filter'], {'_id': 1}) is None:
+        query = query['fallback']
+
+    if query['count']:
+        total_count, count_type = await get_total_count(db, collection, query['count_filter'],
+                                                        query['count'] == 'exact', cache_counts)
+    else:
+        total_count, count_type = None, None
+
+    data = collection.find(query['filter'], query['projection']).skip(query['skip']).limit(
+        query['page_size']).sort(query['sort'])
+    if lazy:
+        return page_result(query, total_count, count_type, data)
+
+    data = await data.to_list(None)
+    # In keyset mode the cursor points after the last document of a full page
+    next_cursor = None
+    sort_key = query['cursor_sort_key']
+    if sort_key and data and len(data) == query['page_size']:
+        next_cursor = encode_cursor(sort_key, data[-1])
+    result = page_result(query, total_count, count_type, data, next_cursor)
+    if key:
+        result_cache.set(key, result)
+    return dict(result)
+
+
+def stream_page(data):
+    """
+    Async counterpart of app.utils.streaming.stream_page, iterating a motor cursor.
+
+    Args:
+        data (dict): paginator result built with lazy=True
+
+    Returns:
+        quart.Response: A streamed JSON response.
+    """
+    encoder = PageEncoder(data, current_app.json.dumps)
+
+    async def generate():
+        async for document in data['data']:
+            chunk = encoder.add(document)
+            if chunk:
+                yield chunk.encode('utf-8')
+        yield encoder.finish().encode('utf-8')
+
+    return Response(generate(), mimetype='application/json')
@@ -1,17 +1,195 @@
 import os
+import time
+import uuid
 import logging
+import threading
 import bcrypt
 
 from functools import wraps
 from jwt import PyJWTError, decode, encode
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from flask import request, jsonify
 
 from app.database import SessionManager, Collections
+from app.utils.cache import TTLCache
+from app.utils.const import (jwt_verify_mode, user_cache_size, user_cache_ttl, revocation_refresh_interval,
+                             bcrypt_rounds)
 
 logger = logging.getLogger(__name__)
 
+# 'db' looks the user up on every request, 'cache' keeps user documents in a
+# bounded TTL cache and 'stateless' trusts the signed claims of the token
+verify_mode = os.environ.get('JWT_VERIFY_MODE', jwt_verify_mode)
+
+# Claims a token must carry to be verified without a database lookup
+stateless_claims = ('sub', 'username', 'jti')
+
+user_cache = TTLCache(int(os.environ.get('JWT_USER_CACHE_SIZE', user_cache_size)),
+                      float(os.environ.get('JWT_USER_CACHE_TTL', user_cache_ttl)))
+
+# The bcrypt cost of new password hashes, each step doubles the verification time
+password_rounds = int(os.environ.get('BCRYPT_ROUNDS', bcrypt_rounds))
+
+
+class RevocationList:
+
+    def __init__(self, refresh_interval):
+        """
+        Initialize a new instance of RevocationList.
+
+        Keeps the ids (jti) of revoked tokens in memory and reloads them
+        from the revoked_tokens collection at most every refresh_interval seconds.
+
+        Args:
+            refresh_interval (float): Seconds between two reloads from the database.
+        """
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.revoked = frozenset()
+        self.refreshed_at = None
+
+    def due(self):
+        """
+        Returns:
+            bool: True if the revoked ids were never loaded or are older than the refresh interval.
+        """
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at > self.refresh_interval
+
+    def query(self):
+        """
+        Returns:
+            tuple: The filter and projection selecting the non-expired revoked token ids.
+        """
+        return {'expires_at': {'$gt': datetime.now()}}, {'jti': 1}
+
+    def update(self, docs):
+        """
+        Replace the revoked ids with the ones of the loaded documents.
+        """
+        self.revoked = frozenset(doc['jti'] for doc in docs)
+        self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """
+        Reload the non-expired revoked token ids from the database.
+        """
+        with SessionManager() as (client, db):
+            revoked_tokens = db.get_collection(Collections.revoked_tokens)
+            self.update(revoked_tokens.find(*self.query()))
+
+    def is_revoked(self, jti):
+        """
+        Check whether a token id has been revoked.
+
+        Args:
+            jti (str): The token id.
+
+        Returns:
+            bool: True if the token has been revoked.
+        """
+        # Only one thread reloads the set, the others keep using the previous one
+        if self.due():
+            if self.lock.acquire(blocking=self.refreshed_at is None):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(e)
+                finally:
+                    self.lock.release()
+        return jti in self.revoked
+
+    def revoke(self, jti, expires_at):
+        """
+        Revoke a token in this process and persist it for the other processes.
+
+        Args:
+            jti (str): The token id.
+            expires_at (datetime): When the token expires, after which the entry is useless.
+        """
+        with SessionManager() as (client, db):
+            revoked_tokens = db.get_collection(Collections.revoked_tokens)
+            revoked_tokens.update_one({'jti': jti},
+                                      {'$set': {'jti': jti, 'expires_at': expires_at}},
+                                      upsert=True)
+        self.revoked = self.revoked | {jti}
+
+
+revocation_list = RevocationList(float(os.environ.get('JWT_REVOCATION_REFRESH_INTERVAL',
+                                                      revocation_refresh_interval)))
+
+
+def load_user(user_id):
+    """
+    Load a user document by its id, going through the user cache unless verify_mode is 'db'.
+
+    Args:
+        user_id (str): The id of the user.
+
+    Returns:
+        dict: The user document without its password, or None if the user does not exist.
+    """
+    if verify_mode != 'db':
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+
+    with SessionManager() as (client, db):
+        # Get the users collection
+        users = db.get_collection(Collections.users)
+        # Find the user with the given id, the password hash is never needed by the handlers
+        user = users.find_one({'_id': ObjectId(user_id)}, {'password': 0})
+
+    if user and verify_mode != 'db':
+        user_cache.set(user_id, user)
+    return user
+
+
+def user_from_claims(payload):
+    """
+    Build the user object handed to the handlers from the token claims.
+
+    Args:
+        payload (dict): The decoded token payload.
+
+    Returns:
+        dict: The user object, or None if the token lacks the required claims.
+    """
+    if not all(payload.get(claim) for claim in stateless_claims):
+        return None
+    return {'_id': ObjectId(payload['sub']), 'username': payload['username']}
+
+
+def token_payload(auth_header):
+    """
+    Decode and check the JWT token of an Authorization header.
+
+    Only checks the signature and expiry, revocation and the user lookup are left
+    to the caller so the sync and async decorators share this part.
+
+    Args:
+        auth_header (str): The Authorization header value.
+
+    Raises:
+        PyJWTError: If the token is malformed or its signature is invalid.
+
+    Returns:
+        tuple: The payload and None, or None and an error message.
+    """
+    if not auth_header:
+        return None, 'Missing token'
+    # Extract the token from the authorization header
+    parts = auth_header.split()
+    if len(parts) < 2:
+        return None, 'Invalid token'
+    # Decode the token and get the payload
+    payload = decode(parts[1], os.environ.get('JWT_SECRET_KEY'), algorithms=['HS256'])
+    # Check if the token has expired
+    if datetime.now() > datetime.fromtimestamp(payload['exp']):
+        return None, 'Token has expired'
+    return payload, None
+
 
 # validate token decorator
 def jwt_required(f):
@@ -37,33 +215,29 @@ def jwt_required(f):
         Returns:
             Flask response: The response returned by the decorated function.
         """
-        # Get the authorization header from the request
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            try:
-                # Extract the token from the authorization header
-                token = auth_header.split()[1]
-                # Decode the token and get the payload
-                payload = decode(token, os.environ.get('JWT_SECRET_KEY'), algorithms=['HS256'])
-                # Check if the token has expired
-                if datetime.now() > datetime.fromtimestamp(payload['exp']):
-                    return jsonify({'error': 'Token has expired'}), 401
-                else:
-                    with SessionManager() as (client, db):
-                        # Get the users collection
-                        users = db.get_collection(Collections.users)
-                        # Find the user with the given id in the payload
-                        user = users.find_one({'_id': ObjectId(payload['sub'])})
-                        # Check if the user exists
-                        if not user:
-                            return jsonify({'error': 'Invalid token'}), 401
-                        # Call the decorated function with the user object
-                        return f(user, *args, **kwargs)
-            except PyJWTError:
+        try:
+            # Get the authorization header from the request and check the token
+            payload, error = token_payload(request.headers.get('Authorization'))
+            if error:
+                return jsonify({'error': error}), 401
+            # Check if the token has been revoked
+            if payload.get('jti') and revocation_list.is_revoked(payload['jti']):
+                return jsonify({'error': 'Token has been revoked'}), 401
+            # Get the user from the claims without touching the database if allowed,
+            # tokens issued before the claims were added fall back to a lookup
+            user = user_from_claims(payload) if verify_mode == 'stateless' else None
+            if user is None:
+                user = load_user(payload['sub'])
+            # Check if the user exists
+            if not user:
                 return jsonify({'error': 'Invalid token'}), 401
-        else:
-            # Return an error if the token is missing
-            return jsonify({'error': 'Missing token'}), 401
+        except InvalidId:
+            return jsonify({'error': 'Invalid token'}), 401
+        except PyJWTError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        # Call the decorated function with the user object
+        return f(user, *args, **kwargs)
 
     return decorated
 
@@ -82,6 +256,8 @@ def generate_token(user):
     # Generate the payload for the token
     payload = {
         'sub': str(user.get('_id')),  # Subject: user id
+        'username': user.get('username'),  # Username, lets handlers skip the user lookup
+        'jti': uuid.uuid4().hex,  # Token id, used for revocation
         'iat': datetime.now(),  # Issued at: current timestamp
         'exp': datetime.now() + timedelta(days=1)  # Expiration: 1 day from now
     }
@@ -92,6 +268,27 @@ def generate_token(user):
     return token
 
 
+def revoke_token(token):
+    """
+    Revokes a JWT token so it is rejected by every process after their next refresh.
+
+    Args:
+        token (str): The JWT token to revoke.
+
+    Returns:
+        bool: True if the token was revoked, False if it carries no token id.
+    """
+    # Decode the token to get its id, subject and expiration
+    payload = decode(token, os.environ.get('JWT_SECRET_KEY'), algorithms=['HS256'])
+    if not payload.get('jti'):
+        return False
+
+    revocation_list.revoke(payload['jti'], datetime.fromtimestamp(payload['exp']))
+    # Drop the cached user document so it is reloaded on the next request
+    user_cache.pop(payload['sub'])
+    return True
+
+
 def hash_password(password):
     """
     Hashes a password using bcrypt.
@@ -102,9 +299,9 @@ def hash_password(password):
     Returns:
         bytes: The hashed password.
     """
-    # Encode the password as bytes and generate a salt
+    # Encode the password as bytes and generate a salt with the configured cost
     encoded_password = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=password_rounds)
 
     # Hash the encoded password with the salt
     hashed_password = bcrypt.hashpw(encoded_password, salt)
@@ -130,3 +327,19 @@ def verify_password(password, hashed_password):
     except Exception as e:
         logger.error(e)
         return False
+
+
+def needs_rehash(hashed_password):
+    """
+    Check whether a password hash was made with another cost than BCRYPT_ROUNDS.
+
+    Args:
+        hashed_password (bytes): The stored hash, e.g. b'$2b$12$...'.
+
+    Returns:
+        bool: True if the hash should be replaced after a successful login.
+    """
+    try:
+        return int(hashed_password.split(b'$')[2]) != password_rounds
+    except (IndexError, ValueError):
+        return False
@@ -0,0 +1,104 @@
+import time
+import threading
+
+from collections import OrderedDict
+
+
+class TTLCache:
+
+    def __init__(self, maxsize, ttl):
+        """
+        Initialize a new instance of TTLCache.
+
+        A thread-safe in-process cache with least-recently-used eviction
+        once maxsize entries are stored, and per-entry expiry after ttl seconds.
+
+        Args:
+            maxsize (int): The maximum number of entries to keep.
+            ttl (float): The number of seconds an entry stays valid.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Get a value from the cache.
+
+        Args:
+            key: The cache key.
+            default: The value returned on a miss.
+
+        Returns:
+            The cached value, or default if the key is missing or expired.
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                # Drop the expired entry and count it as a miss
+                del self.data[key]
+                self.misses += 1
+                return default
+
+            # Mark the entry as recently used
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value in the cache, evicting the least recently used entries if full.
+
+        Args:
+            key: The cache key.
+            value: The value to store.
+            ttl (float, optional): Overrides the cache ttl for this entry.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.data[key] = (value, expires_at)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """
+        Remove a key from the cache.
+
+        Returns:
+            The removed value, or default if the key was not cached.
+        """
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: The size, hit, miss and eviction counters of the cache.
+        """
+        with self.lock:
+            return {
+                'size': len(self.data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
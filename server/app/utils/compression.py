@@ -0,0 +1,128 @@
+import io
+import bz2
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+# Errors raised by the decompressors on corrupt input
+decompression_errors = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Accepted upload suffixes and their compression, None for plain CSV
+upload_formats = {
+    '.csv': None,
+    '.csv.gz': 'gzip',
+    '.csv.bz2': 'bz2',
+    '.csv.zst': 'zstd',
+}
+
+
+def upload_format(filename):
+    """
+    Get the compression of an uploaded file from its name.
+
+    Args:
+        filename (str): The name of the file.
+
+    Raises:
+        ValueError: If the file is not a CSV file, plain or with a supported compression.
+
+    Returns:
+        str: 'gzip', 'bz2', 'zstd', or None for a plain CSV file.
+    """
+    for suffix, compression in upload_formats.items():
+        if filename.lower().endswith(suffix):
+            if compression == 'zstd' and zstandard is None:
+                raise ValueError('zstd compression is not supported')
+            return compression
+    raise ValueError('Invalid file format')
+
+
+def file_compression(file_path):
+    """
+    Returns:
+        str: The compression of a stored file from its suffix, None for a plain file.
+    """
+    try:
+        return upload_format(file_path)
+    except ValueError:
+        return None
+
+
+def decompressor(compression):
+    """
+    Create an incremental decompressor.
+
+    Args:
+        compression (str): 'gzip', 'bz2' or 'zstd'.
+
+    Returns:
+        object: A decompressor whose decompress(data) returns the bytes inflated so far.
+    """
+    if compression == 'gzip':
+        # wbits 16 + 15 expects a gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError('Unsupported compression: {}'.format(compression))
+
+
+def open_decompressed(file_path, compression=None):
+    """
+    Open a file for reading, decompressing it as a stream.
+
+    Only a buffer of the file is inflated at a time, never the whole file.
+
+    Args:
+        file_path (str): The path of the file.
+        compression (str, optional): 'gzip', 'bz2' or 'zstd', defaults to the one of the file suffix.
+
+    Returns:
+        file-like: A binary stream of the decompressed content.
+    """
+    compression = compression or file_compression(file_path)
+    if compression == 'gzip':
+        return gzip.open(file_path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(file_path, 'rb')
+    if compression == 'zstd':
+        reader = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd=True)
+        return io.BufferedReader(reader)
+    return open(file_path, 'rb')
+
+
+def decompressed_sample(file_path, sample_bytes, compression=None, read_bytes=65536):
+    """
+    Decompress the start of a file and measure how many stored bytes it took.
+
+    Args:
+        file_path (str): The path of the file.
+        sample_bytes (int): The number of decompressed bytes wanted.
+        compression (str, optional): Defaults to the one of the file suffix.
+        read_bytes (int, optional): The number of stored bytes read at a time.
+
+    Returns:
+        tuple: The decompressed sample and the number of stored bytes it was inflated from.
+    """
+    compression = compression or file_compression(file_path)
+    with open(file_path, 'rb') as f:
+        if compression is None:
+            sample = f.read(sample_bytes)
+            return sample, len(sample)
+
+        inflate = decompressor(compression)
+        chunks, size, consumed = [], 0, 0
+        while size < sample_bytes:
+            data = f.read(read_bytes)
+            if not data:
+                break
+            consumed += len(data)
+            chunk = inflate.decompress(data)
+            chunks.append(chunk)
+            size += len(chunk)
+        return b''.join(chunks), consumed
@@ -0,0 +1,85 @@
+import json
+import hashlib
+
+from datetime import timezone
+
+
+def catalogue_validators(request, version, updated_at):
+    """
+    Build the cache validators of a response derived from the movies collection.
+
+    The response of a read endpoint only depends on its path, its arguments and
+    the data of the collection, so the ETag combines the collection version with
+    a digest of the path and the sorted arguments.
+
+    Args:
+        request (flask.Request): The request, a quart.Request works the same way.
+        version (int): The data version of the collection.
+        updated_at (datetime): When the version last changed, None if it never did.
+
+    Returns:
+        tuple: The ETag and the Last-Modified datetime (None without updated_at).
+    """
+    args = sorted(request.args.items(multi=True))
+    digest = hashlib.sha1(json.dumps([request.path, args]).encode('utf-8')).hexdigest()[:16]
+    etag = '{}-{}'.format(version, digest)
+
+    # updated_at is a naive local datetime, HTTP dates are UTC with a one second resolution
+    last_modified = updated_at.astimezone(timezone.utc).replace(microsecond=0) if updated_at else None
+    return etag, last_modified
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Check the conditional headers of a request, If-None-Match taking precedence over If-Modified-Since.
+
+    Args:
+        request (flask.Request): The request.
+        etag (str): The current ETag.
+        last_modified (datetime): The current Last-Modified datetime, or None.
+
+    Returns:
+        bool: True if the copy held by the client is still current.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Add the cache validators to a response.
+
+    The endpoints require a token, so shared caches must not store the response
+    and clients revalidate it before each reuse.
+
+    Args:
+        response (flask.Response): The response.
+        etag (str): The ETag.
+        last_modified (datetime): The Last-Modified datetime, or None.
+
+    Returns:
+        flask.Response: The same response.
+    """
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(response_class, etag, last_modified):
+    """
+    Build an empty 304 Not Modified response carrying the validators.
+
+    Args:
+        response_class (type): The response class of the application.
+        etag (str): The ETag.
+        last_modified (datetime): The Last-Modified datetime, or None.
+
+    Returns:
+        flask.Response: The 304 response.
+    """
+    return set_validators(response_class(status=304), etag, last_modified)
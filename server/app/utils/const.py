@@ -1,6 +1,85 @@
 # csv headers required for parsing
 csv_headers = ['show_id', 'type', 'title', 'director', 'cast', 'country', 'date_added', 'release_year', 'rating',
                'duration', 'listed_in', 'description']
-pd_chunk_size = 500
+pd_chunk_size = 5000
 
 default_page_size = 30
+# most ids resolved by one batch lookup
+batch_max_ids = 500
+# values returned per facet unless limit is given
+default_facet_limit = 50
+
+# mongo client pool settings, overridable through the environment
+mongo_max_pool_size = 50
+mongo_min_pool_size = 0
+mongo_max_idle_time_ms = 60000
+mongo_wait_queue_timeout_ms = 5000
+mongo_connect_timeout_ms = 5000
+mongo_server_selection_timeout_ms = 10000
+
+# jwt verification, one of 'db', 'cache' or 'stateless'
+jwt_verify_mode = 'cache'
+user_cache_size = 10000
+user_cache_ttl = 60
+revocation_refresh_interval = 30
+
+# login, new hashes use bcrypt_rounds and older ones are rehashed on the next successful login
+bcrypt_rounds = 12
+# bcrypt runs on a pool of password_workers threads, logins beyond password_queue_size waiting are rejected
+password_workers = 4
+password_queue_size = 16
+# failed logins allowed per username and per client address within the window, in seconds, 0 turns
+# a limit off. Behind reverse proxies every client has the proxy address until trusted_proxies is
+# set, so the per address limit is off by default
+login_max_failures_per_user = 5
+login_max_failures_per_ip = 0
+login_failure_window = 300
+login_throttle_size = 100000
+# reverse proxies in front of the Flask app, the client address is read from the X-Forwarded-For
+# header they add, 0 when clients connect directly
+trusted_proxies = 0
+
+# seconds a process trusts its copy of a collection version before reloading it
+version_check_interval = 2
+count_cache_size = 1024
+count_cache_ttl = 300
+# listing pages per (collection, collection version, query), streamed pages are never cached
+result_cache_size = 256
+result_cache_ttl = 300
+
+# listings with at least this page size are streamed instead of built in memory
+stream_min_page_size = 200
+stream_buffer_size = 65536
+
+# csv parsing, columns not listed are kept as strings, list columns are split on commas
+csv_column_types = {'date_added': 'date', 'release_year': 'int',
+                    'cast': 'list', 'country': 'list', 'director': 'list', 'listed_in': 'list'}
+csv_date_format = '%B %d, %Y'
+# 'c' for the pandas reader, 'pyarrow' for the multithreaded arrow reader
+csv_engine = 'c'
+pyarrow_block_size = 1 << 20
+
+# pipelined ingestion, batch sizes adapt to keep each bulk write near the target duration
+ingest_writers = 4
+ingest_queue_size = 8
+ingest_batch_size = 1000
+ingest_min_batch_size = 100
+ingest_max_batch_size = 10000
+ingest_target_batch_seconds = 0.5
+
+# files larger than this are split into shards processed by several workers, 0 disables it
+csv_shard_bytes = 256 * 1024 * 1024
+
+# upload progress, written at most every interval or when it moved by step percent of the file
+progress_publish_interval = 1.0
+progress_publish_step_percent = 5
+progress_stream_poll_interval = 1.0
+progress_stream_heartbeat = 15
+progress_stream_timeout = 600
+
+# uploads are copied to disk through a buffer of this size, the header must fit in max header bytes
+upload_buffer_size = 1 << 20
+upload_max_header_bytes = 64 * 1024
+
+# seconds the csv ingestion metrics, aggregated from csv_files, are reused across scrapes
+metrics_csv_files_ttl = 15
@@ -1,5 +1,9 @@
 import re
+import csv
 import uuid
+import hashlib
+
+from .compression import decompressor, decompression_errors
 
 
 def format_file_name(file_name):
@@ -16,6 +20,9 @@ def format_file_name(file_name):
     # Split the file name into name and extension
     filename_split = file_name.split('.')
     file_name, file_extension = filename_split[0], filename_split[-1]
+    # Keep the csv part of compressed files, e.g. movies.csv.gz
+    if len(filename_split) > 2 and filename_split[-2].lower() == 'csv':
+        file_extension = '.'.join(filename_split[-2:])
 
     # Remove special characters and spaces
     file_name = re.sub(r'[^\w\s-]', '', file_name)  # Remove all non-alphanumeric, non-space, non-hyphen characters
@@ -26,3 +33,93 @@ def format_file_name(file_name):
     formatted_file_name = f"{file_name}-{unique_substring}.{file_extension}"  # Construct the formatted file name
 
     return formatted_file_name
+
+
+def read_header_bytes(stream, buffer_size, max_header_bytes, compression=None):
+    """
+    Read the start of a stream until its content holds the whole first line.
+
+    Args:
+        stream (file-like): The uploaded file stream.
+        buffer_size (int): The number of bytes read at a time.
+        max_header_bytes (int): The longest accepted header line.
+        compression (str, optional): The compression of the stream, the header is
+            read from the decompressed content.
+
+    Raises:
+        ValueError: If the first line is longer than max_header_bytes or the
+            stream cannot be decompressed.
+
+    Returns:
+        tuple: The bytes read as stored and the content they decompress to.
+    """
+    inflate = decompressor(compression) if compression else None
+    raw, head = [], b''
+    while b'\n' not in head:
+        chunk = stream.read(buffer_size)
+        if not chunk:
+            break
+        raw.append(chunk)
+        try:
+            head += inflate.decompress(chunk) if inflate else chunk
+        except decompression_errors as e:
+            raise ValueError('Invalid {} file: {}'.format(compression, e))
+        if b'\n' not in head and len(head) > max_header_bytes:
+            raise ValueError('Invalid header')
+    return b''.join(raw), head
+
+
+def parse_header(head):
+    """
+    Parse the header line of a CSV file from its first bytes.
+
+    Args:
+        head (bytes): The first bytes of the file.
+
+    Returns:
+        list: The column names, empty if the bytes are not valid UTF-8.
+    """
+    try:
+        # utf-8-sig drops the byte order mark written by spreadsheet exports
+        line = head.split(b'\n', 1)[0].decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return []
+    return next(csv.reader([line]), [])
+
+
+def save_upload(stream, file_path, expected_headers, buffer_size, max_header_bytes, compression=None):
+    """
+    Validate the header of an uploaded CSV file and copy it to disk while hashing its content.
+
+    The header is checked before anything is written, so a file with the wrong
+    columns is rejected without being stored. Compressed files are stored as
+    uploaded, only their first bytes are decompressed to read the header.
+
+    Args:
+        stream (file-like): The uploaded file stream.
+        file_path (str): The destination path.
+        expected_headers (list): The required column names, in order.
+        buffer_size (int): The number of bytes read and written at a time.
+        max_header_bytes (int): The longest accepted header line.
+        compression (str, optional): 'gzip', 'bz2' or 'zstd' for a compressed upload.
+
+    Raises:
+        ValueError: If the header does not match expected_headers.
+
+    Returns:
+        tuple: The SHA-256 hex digest of the stored bytes and their number.
+    """
+    raw, head = read_header_bytes(stream, buffer_size, max_header_bytes, compression)
+    if parse_header(head) != expected_headers:
+        raise ValueError('Invalid header')
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'wb') as f:
+        chunk = raw
+        while chunk:
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+            chunk = stream.read(buffer_size)
+    return digest.hexdigest(), size
@@ -1,30 +1,299 @@
-from .const import default_page_size
+import os
+import re
+import base64
+import binascii
 
+from bson import json_util
 
-def paginator(collection, rqst_args, search_allowed_fields, sort_allowed_fields):
+from app.database.indexes import warn_unindexed
+from app.database.versions import get_version
+from .cache import TTLCache
+from .const import default_page_size, count_cache_size, count_cache_ttl, result_cache_size, result_cache_ttl
+
+# Exact counts per (collection, collection version, normalized filter)
+count_cache = TTLCache(count_cache_size, count_cache_ttl)
+
+# Listing pages per (collection, collection version, normalized query)
+result_cache = TTLCache(int(os.environ.get('RESULT_CACHE_SIZE', result_cache_size)),
+                        float(os.environ.get('RESULT_CACHE_TTL', result_cache_ttl)))
+
+
+def encode_cursor(sort_key, document):
     """
-    Paginate the result of a mongo collection based on request arguments.
+    Encode the position of a document in a sorted listing as an opaque cursor.
+
+    Args:
+        sort_key (str): the field the listing is sorted on
+        document (dict): the last document of the current page
+
+    Returns:
+        str: url safe cursor token
+    """
+    position = {'k': sort_key, 'v': document.get(sort_key), 'id': document['_id']}
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort_key):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): cursor token
+        sort_key (str): the field the listing is sorted on, must match the cursor
+
+    Raises:
+        ValueError: if the cursor is malformed or was issued for another sort key
+
+    Returns:
+        tuple: sort value and _id of the last document of the previous page
+    """
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        value, last_id = position['v'], position['id']
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise ValueError('Invalid cursor')
+    if position.get('k') != sort_key:
+        raise ValueError('Cursor does not match sort key')
+    return value, last_id
+
+
+def keyset_condition(sort_key, direction, value, last_id):
+    """
+    Build the filter selecting documents after (value, last_id) in (sort_key, _id) order.
+
+    $gt and $lt only match values of the same type, so the sort key must hold one type
+    besides null, blank values are stored as None. Mongo sorts null (and missing) values
+    first, so they follow every value in descending order and precede them in ascending order.
+
+    Args:
+        sort_key (str): the field the listing is sorted on
+        direction (int): 1 for ascending, -1 for descending
+        value: sort value of the last document of the previous page
+        last_id (ObjectId): _id of the last document of the previous page
+
+    Returns:
+        dict: mongo filter
+    """
+    op = '$gt' if direction > 0 else '$lt'
+    if sort_key == '_id':
+        return {'_id': {op: last_id}}
+
+    if value is None:
+        # The rest of the nulls, then in ascending order every value
+        after = [{sort_key: None, '_id': {op: last_id}}]
+        if direction > 0:
+            after.append({sort_key: {'$ne': None}})
+        return {'$or': after}
+
+    after = [{sort_key: {op: value}}, {sort_key: value, '_id': {op: last_id}}]
+    if direction < 0:
+        after.append({sort_key: None})
+    return {'$or': after}
+
+
+def text_search_context(search_key, search_term):
+    """
+    Build a filter that searches a text indexed field.
+
+    The $text clause selects candidates through the text index and ranks them, each word
+    is then checked against search_key only, since the text index covers several fields.
+
+    Args:
+        search_key (str): the field to search
+        search_term (str): the words to search for
+
+    Returns:
+        dict: mongo filter
+    """
+    words = search_term.split()
+    return {
+        '$text': {'$search': ' '.join(words)},
+        '$and': [{search_key: {'$regex': re.escape(word), '$options': 'i'}} for word in words]
+    }
+
+
+def prefix_search_context(search_key, search_term):
+    """
+    Build a filter matching documents where each word of the search term starts a word of search_key.
+
+    Used when a text search finds nothing, since the text index only matches whole words.
+
+    Args:
+        search_key (str): the field to search
+        search_term (str): the words, or beginnings of words, to search for
+
+    Returns:
+        dict: mongo filter
+    """
+    return {'$and': [{search_key: {'$regex': r'\b' + re.escape(word), '$options': 'i'}}
+                     for word in search_term.split()]}
+
+
+def get_total_count(collection, find_context, exact=False, cache_counts=False):
+    """
+    Count the documents matching a filter.
+
+    Unfiltered counts come from the collection metadata unless exact is set. Exact counts
+    can be cached, keyed on the collection version so they are dropped once new data
+    is ingested.
 
     Args:
         collection (object): mongo collection
+        find_context (dict): mongo filter
+        exact (bool): always run count_documents
+        cache_counts (bool): cache exact counts
+
+    Returns:
+        tuple: the count and 'exact' or 'estimated'
+    """
+    if not find_context and not exact:
+        return collection.estimated_document_count(), 'estimated'
+
+    if not cache_counts:
+        return collection.count_documents(find_context), 'exact'
+
+    key = (collection.name, get_version(collection.name), json_util.dumps(find_context, sort_keys=True))
+    total_count = count_cache.get(key)
+    if total_count is None:
+        total_count = collection.count_documents(find_context)
+        count_cache.set(key, total_count)
+    return total_count, 'exact'
+
+
+def value_filters(rqst_args, filter_allowed_fields):
+    """
+    Build exact match filters on multi valued fields from request arguments.
+
+    field=a,b selects documents holding every value ($all) and field_any=a,b the ones
+    holding at least one ($in). A single value is an equality on an array element.
+    Each is answered by a seek on the multikey index of the field.
+
+    Args:
+        rqst_args (object): request args
+        filter_allowed_fields (set): fields that can be filtered on
+
+    Returns:
+        dict: mongo filter, empty without filter arguments
+    """
+    filters = {}
+    for field in sorted(filter_allowed_fields or ()):
+        every = [value.strip() for value in rqst_args.get(field, '').split(',') if value.strip()]
+        any_of = [value.strip() for value in rqst_args.get(field + '_any', '').split(',') if value.strip()]
+
+        if len(every) == 1 and not any_of:
+            filters[field] = every[0]
+        elif every or any_of:
+            condition = {}
+            if every:
+                condition['$all'] = every
+            if any_of:
+                condition['$in'] = any_of
+            filters[field] = condition
+    return filters
+
+
+def parse_projection(rqst_args, projection_allowed_fields):
+    """
+    Build a mongo projection from the fields argument.
+
+    Args:
+        rqst_args (object): request args, fields is a comma separated list of field names
+        projection_allowed_fields (set): fields that may be requested, None to ignore the argument
+
+    Raises:
+        ValueError: if a requested field is not allowed
+
+    Returns:
+        dict: the projection, _id is always included, or None to return whole documents
+    """
+    fields = [field.strip() for field in rqst_args.get('fields', '').split(',') if field.strip()]
+    if not fields or not projection_allowed_fields:
+        return None
+
+    invalid = [field for field in fields if field not in projection_allowed_fields]
+    if invalid:
+        raise ValueError('Invalid fields: {}'.format(', '.join(invalid)))
+    return dict({field: 1 for field in fields}, _id=1)
+
+
+def page_query(rqst_args, search_allowed_fields, sort_allowed_fields, text_search_fields=None,
+               projection_allowed_fields=None, filter_allowed_fields=None):
+    """
+    Build the mongo query of a listing page from request arguments.
+
+    Only parses and validates the arguments, so the same plan is executed by the
+    pymongo paginator and by its motor counterpart in app.utils.aio.
+
+    Args:
         rqst_args (object): request args
         search_allowed_fields (dict): allowed fields for search
         sort_allowed_fields (dict): allowed fields for sort, -1 for descending, 1 for ascending
+        text_search_fields (set): search fields covered by the collection text index
+        projection_allowed_fields (set): fields that may be requested with the fields argument
+        filter_allowed_fields (set): multi valued fields that can be filtered on by exact values
+
+    Raises:
+        ValueError: if the cursor or a requested field is invalid or a number argument is not an integer
 
     Returns:
-        dict: total_count, data, page, page_size, skip
+        dict: filter, count_filter, sort, projection, skip, page, page_size, count ('true', 'exact' or None),
+            cursor_sort_key, set in keyset mode only, and fallback, the query run instead when a
+            text search matches no document
     """
     # Initialize the find context using the search parameters
     # The find context is only used if search_allowed_fields is not empty
     find_context = {}
+    fallback_context = None
     if search_allowed_fields:
         # If search_key and search_term are provided and search_key is an allowed search field
         # then add the search term to the find context with a regex search
         search_key = rqst_args.get('search_key')
         search_term = rqst_args.get('search_term')
         if search_key and search_term and search_allowed_fields.get(search_key):
-            find_context[search_key] = {'$regex': search_term, '$options': 'i'}
+            if text_search_fields and search_key in text_search_fields and search_term.split():
+                find_context = text_search_context(search_key, search_term)
+                # $text only matches whole words, partial words are searched with a regex instead
+                fallback_context = prefix_search_context(search_key, search_term)
+            else:
+                find_context[search_key] = {'$regex': search_term, '$options': 'i'}
+
+    # Order text searches by relevance when no explicit sort was requested, checked before
+    # the filters wrap the search in $and
+    relevance_sort = '$text' in find_context and not rqst_args.get('sort_key')
+
+    # Add the exact value filters, alongside a search on the same field if there is one
+    filters = value_filters(rqst_args, filter_allowed_fields)
+    if filters:
+        find_context = {'$and': [find_context, filters]} if find_context else filters
+        if fallback_context:
+            fallback_context = {'$and': [fallback_context, filters]}
+
+    query = build_page_query(rqst_args, find_context, sort_allowed_fields, projection_allowed_fields, relevance_sort)
+    query['fallback'] = None
+    if fallback_context:
+        query['fallback'] = build_page_query(rqst_args, fallback_context, sort_allowed_fields,
+                                             projection_allowed_fields)
+    return query
+
+
+def build_page_query(rqst_args, find_context, sort_allowed_fields, projection_allowed_fields=None,
+                     relevance_sort=False):
+    """
+    Build the mongo query of a listing page from its filter and the paging and sort request arguments.
+
+    Args:
+        rqst_args (object): request args
+        find_context (dict): mongo filter of the search and value filters
+        sort_allowed_fields (dict): allowed fields for sort, -1 for descending, 1 for ascending
+        projection_allowed_fields (set): fields that may be requested with the fields argument
+        relevance_sort (bool): sort by text score in page/skip mode
 
+    Raises:
+        ValueError: if the cursor or a requested field is invalid or a number argument is not an integer
+
+    Returns:
+        dict: filter, count_filter, sort, projection, skip, page, page_size, count and cursor_sort_key
+    """
     # Initialize the sort parameter using the sort parameters
     # The sort parameter is set to {'created_at': -1} if sort_allowed_fields is empty
     # or if sort_key is not an allowed sort field
@@ -41,20 +310,167 @@ def paginator(collection, rqst_args, search_allowed_fields, sort_allowed_fields)
     page = int(rqst_args.get('page', 1))
     page_size = int(rqst_args.get('page_size', default_page_size))
     skip = (page - 1) * page_size
-    if rqst_args.get('total_count', 'false') == 'true':
-        total_count = collection.count_documents(find_context)
-    else:
-        total_count = None
+    total_count_arg = rqst_args.get('total_count', 'false')
 
-    # Return the total count, data, page, page_size, and skip
-    return {
-        # Count the number of documents in the collection that match the find context
-        'total_count': total_count,
-        # Find documents in the collection that match the find context,
-        # skip a certain number of documents, limit the result to a certain number of documents,
-        # and sort the result based on the sort parameter
-        'data': list(collection.find(find_context).skip(skip).limit(page_size).sort(sort)),
+    query = {
+        'filter': find_context,
+        'count_filter': find_context,
+        'sort': sort,
+        'projection': parse_projection(rqst_args, projection_allowed_fields),
+        'skip': skip,
         'page': page,
         'page_size': page_size,
-        'skip': skip
+        'count': total_count_arg if total_count_arg in ('true', 'exact') else None,
+        'cursor_sort_key': None
     }
+
+    # Keyset mode: seek past the cursor position instead of skipping documents
+    cursor = rqst_args.get('cursor', rqst_args.get('after'))
+    if cursor is not None:
+        sort = sort or {'_id': 1}
+        sort_key, direction = next(iter(sort.items()))
+        # Break ties on _id so the order is total and the cursor position is unique
+        if sort_key != '_id':
+            sort = {sort_key: direction, '_id': direction}
+
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort_key)
+            query['filter'] = {'$and': [find_context, keyset_condition(sort_key, direction, value, last_id)]}
+        query.update({'sort': sort, 'skip': 0, 'page': None, 'cursor_sort_key': sort_key})
+        # The next cursor is read from the last document, so it must carry the sort key
+        if query['projection']:
+            query['projection'][sort_key] = 1
+
+    # Relevance cannot be used as a keyset, so it only applies to page/skip mode
+    elif relevance_sort:
+        query['sort'] = {'score': {'$meta': 'textScore'}}
+
+    return query
+
+
+def result_cache_key(collection_name, version, query):
+    """
+    Build the result cache key of a page query.
+
+    Filters and sorts are serialized with sorted keys, so equivalent requests share
+    an entry whatever the order of their arguments. Including the version drops
+    every page of a collection at once when new data is ingested, in every process.
+
+    Args:
+        collection_name (str): The name of the collection.
+        version (int): The data version of the collection.
+        query (dict): The page query built by page_query.
+
+    Returns:
+        tuple: The cache key.
+    """
+    normalized = json_util.dumps([query['filter'], query['sort'], query['projection'], query['skip'],
+                                  query['page_size'], query['count']], sort_keys=True)
+    return collection_name, version, normalized
+
+
+def page_result(query, total_count, count_type, data, next_cursor=None):
+    """
+    Build the paginator result of an executed page query.
+
+    Returns:
+        dict: total_count, count_type, data, page, page_size, skip, next_cursor, cursor_sort_key
+    """
+    keyset = query['cursor_sort_key'] is not None
+    return {
+        'total_count': total_count,
+        'count_type': count_type,
+        'data': data,
+        'page': query['page'],
+        'page_size': query['page_size'],
+        'skip': None if keyset else query['skip'],
+        'next_cursor': next_cursor,
+        'cursor_sort_key': query['cursor_sort_key']
+    }
+
+
+def paginator(collection, rqst_args, search_allowed_fields, sort_allowed_fields, text_search_fields=None,
+              projection_allowed_fields=None, filter_allowed_fields=None, cache_counts=False, cache_results=False,
+              lazy=False):
+    """
+    Paginate the result of a mongo collection based on request arguments.
+
+    Two modes are supported: page/page_size, which skips (page - 1) * page_size documents,
+    and keyset pagination, enabled by passing a cursor (or after) argument, which seeks past
+    the last document of the previous page on (sort key, _id) so deep pages cost the same as
+    the first one. Pass an empty cursor to request the first page in keyset mode.
+
+    total_count=true returns an estimated count for unfiltered listings and an exact one
+    otherwise, total_count=exact always counts. count_type tells which one was returned.
+
+    fields=a,b returns only those fields and _id. When the requested fields and the filter
+    and sort keys all belong to one index, e.g. fields=show_id sorted on show_id, mongo
+    answers the page from the index without reading the documents.
+
+    Args:
+        collection (object): mongo collection
+        rqst_args (object): request args
+        search_allowed_fields (dict): allowed fields for search
+        sort_allowed_fields (dict): allowed fields for sort, -1 for descending, 1 for ascending
+        text_search_fields (set): search fields covered by the collection text index, searched with $text
+            and ordered by relevance unless a sort_key is given
+        projection_allowed_fields (set): fields that may be requested with the fields argument,
+            None returns whole documents whatever the arguments
+        filter_allowed_fields (set): multi valued fields filtered with field=a,b (all values)
+            and field_any=a,b (any value)
+        cache_counts (bool): cache filtered counts until the collection version changes,
+            only for collections whose writers call bump_version
+        cache_results (bool): cache whole pages until the collection version changes, with the same
+            requirement as cache_counts; lazy pages are never cached
+        lazy (bool): return the open mongo cursor as data instead of a list; in keyset mode
+            next_cursor is then left to the caller, using cursor_sort_key and the last document
+
+    Raises:
+        ValueError: if the cursor or a requested field is invalid
+
+    Returns:
+        dict: total_count, count_type, data, page, page_size, skip, next_cursor, cursor_sort_key
+    """
+    # Warn once per process about allowed fields that would cause a collection scan
+    warn_unindexed(collection, list(search_allowed_fields or {}) + list(sort_allowed_fields or {}) +
+                   list(filter_allowed_fields or ()))
+
+    query = page_query(rqst_args, search_allowed_fields, sort_allowed_fields, text_search_fields,
+                       projection_allowed_fields, filter_allowed_fields)
+
+    # Serve repeated pages from memory, the key changes as soon as the collection version does
+    key = None
+    if cache_results and not lazy:
+        key = result_cache_key(collection.name, get_version(collection.name), query)
+        result = result_cache.get(key)
+        if result is not None:
+            return dict(result)
+
+    # A text search matching nothing, e.g. on a partial word, is run again with a word prefix regex
+    if query['fallback'] and collection.find_one(query['count_filter'], {'_id': 1}) is None:
+        query = query['fallback']
+
+    if query['count']:
+        total_count, count_type = get_total_count(collection, query['count_filter'], query['count'] == 'exact',
+                                                  cache_counts)
+    else:
+        total_count, count_type = None, None
+
+    # Find documents in the collection that match the find context,
+    # skip a certain number of documents, limit the result to a certain number of documents,
+    # and sort the result based on the sort parameter
+    data = collection.find(query['filter'], query['projection']).skip(query['skip']).limit(
+        query['page_size']).sort(query['sort'])
+    if lazy:
+        return page_result(query, total_count, count_type, data)
+
+    data = list(data)
+    # In keyset mode the cursor points after the last document of a full page
+    next_cursor = None
+    sort_key = query['cursor_sort_key']
+    if sort_key and data and len(data) == query['page_size']:
+        next_cursor = encode_cursor(sort_key, data[-1])
+    result = page_result(query, total_count, count_type, data, next_cursor)
+    if key:
+        result_cache.set(key, result)
+    return dict(result)
@@ -0,0 +1,75 @@
+from bson import ObjectId, Decimal128
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def mongo_default(o):
+    """
+    Encode the BSON and datetime values found in mongo documents.
+
+    Datetimes keep the HTTP date format used by Flask's default provider,
+    so the wire format does not depend on the JSON backend.
+
+    Args:
+        o (object): The value the JSON backend cannot encode.
+
+    Raises:
+        TypeError: If the value is not supported.
+
+    Returns:
+        A JSON encodable value.
+    """
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, Decimal128):
+        return str(o.to_decimal())
+    # Dates, decimals and uuids are handled by Flask's default encoder
+    return DefaultJSONProvider.default(o)
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that encodes ObjectId and datetime values natively,
+    so endpoints can return mongo documents without converting them first.
+
+    orjson is used when it is installed, the standard library otherwise.
+    """
+
+    default = staticmethod(mongo_default)
+    sort_keys = False
+    compact = True
+    # Datetimes are passed to mongo_default so both backends format them the same way
+    orjson_options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps_bytes(self, obj, **kwargs):
+        """
+        Serialize data as JSON bytes.
+
+        Args:
+            obj: The data to serialize.
+            kwargs: Passed to the standard library backend.
+
+        Returns:
+            bytes: The encoded data.
+        """
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=self.orjson_options)
+        return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
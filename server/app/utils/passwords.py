@@ -0,0 +1,159 @@
+import os
+import time
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import SessionManager, Collections
+from app.utils.auth import hash_password, verify_password
+from app.utils.cache import TTLCache
+from app.utils.metrics import Counter, registry
+from app.utils.const import (password_workers, password_queue_size, login_max_failures_per_user,
+                             login_max_failures_per_ip, login_failure_window, login_throttle_size)
+
+logger = logging.getLogger(__name__)
+
+login_attempts = registry.register(Counter(
+    'login_attempts_total', 'Login attempts by result: success, invalid, throttled or busy.', ('result',)))
+
+
+class PoolFull(Exception):
+    """
+    Raised when every password worker is busy and the queue is full.
+    """
+
+
+class PasswordPool:
+
+    def __init__(self, workers, queue_size):
+        """
+        Initialize a new instance of PasswordPool.
+
+        Runs bcrypt on a fixed number of threads, bcrypt releases the GIL so they
+        use that many cores at most, whatever the number of concurrent logins. At
+        most queue_size calls wait for a thread, further ones are rejected at once
+        instead of piling up request threads behind the pool.
+
+        Args:
+            workers (int): The number of bcrypt threads.
+            queue_size (int): The number of calls that can wait for a thread.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, fn, *args):
+        """
+        Run a function on the pool.
+
+        Raises:
+            PoolFull: If every thread is busy and the queue is full.
+
+        Returns:
+            concurrent.futures.Future: The future of the call.
+        """
+        if not self.slots.acquire(blocking=False):
+            raise PoolFull()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def verify(self, password, hashed_password):
+        """
+        Verify a password on the pool, blocking until it is checked.
+
+        Raises:
+            PoolFull: If every thread is busy and the queue is full.
+
+        Returns:
+            bool: True if the password matches the hash.
+        """
+        return self.submit(verify_password, password, hashed_password).result()
+
+
+class LoginThrottle:
+
+    def __init__(self, max_failures, window, maxsize):
+        """
+        Initialize a new instance of LoginThrottle.
+
+        Counts failed logins per key, a username or a client address. Once a key
+        reaches max_failures, its logins are refused without checking the password
+        until window seconds have passed since its first failure. A max_failures of 0
+        turns the throttle off.
+
+        Args:
+            max_failures (int): The failures allowed within the window, 0 for no limit.
+            window (float): The length of the window in seconds.
+            maxsize (int): The number of keys tracked, the least recently used are dropped.
+        """
+        self.max_failures = max_failures
+        self.window = window
+        self.lock = threading.Lock()
+        self.failures = TTLCache(maxsize, window)
+
+    def retry_after(self, key):
+        """
+        Returns:
+            int: The seconds before the key may log in again, 0 if it is not throttled.
+        """
+        if not self.max_failures:
+            return 0
+        entry = self.failures.get(key)
+        if entry is None or entry[0] < self.max_failures:
+            return 0
+        return max(int(self.window - (time.monotonic() - entry[1])) + 1, 1)
+
+    def failed(self, key):
+        """
+        Record a failed login.
+        """
+        if not self.max_failures:
+            return
+        now = time.monotonic()
+        with self.lock:
+            count, first = self.failures.get(key) or (0, now)
+            # The entry expires with the window of its first failure
+            self.failures.set(key, (count + 1, first), ttl=self.window - (now - first))
+
+    def reset(self, key):
+        """
+        Forget the failures of a key, after a successful login.
+        """
+        self.failures.pop(key)
+
+
+password_pool = PasswordPool(int(os.environ.get('PASSWORD_WORKERS', password_workers)),
+                             int(os.environ.get('PASSWORD_QUEUE_SIZE', password_queue_size)))
+
+window = float(os.environ.get('LOGIN_FAILURE_WINDOW', login_failure_window))
+user_throttle = LoginThrottle(int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', login_max_failures_per_user)),
+                              window, login_throttle_size)
+ip_throttle = LoginThrottle(int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', login_max_failures_per_ip)),
+                            window, login_throttle_size)
+
+
+def rehash_password(user_id, password, stored_password):
+    """
+    Replace a password hash made with another cost, run on the password pool.
+
+    The update only applies if the hash was not changed in between.
+
+    Args:
+        user_id (ObjectId): The id of the user.
+        password (str): The verified password.
+        stored_password (bytes): The hash it was verified against.
+    """
+    try:
+        hashed_password = hash_password(password)
+        with SessionManager() as (client, db):
+            users = db.get_collection(Collections.users)
+            users.update_one({'_id': user_id, 'password': stored_password},
+                             {'$set': {'password': hashed_password}})
+        logger.info('rehashed the password of user {}'.format(user_id))
+    except Exception as e:
+        logger.error(e)
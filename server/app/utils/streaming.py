@@ -0,0 +1,115 @@
+from flask import Response, current_app
+
+from .const import stream_min_page_size, stream_buffer_size, default_page_size
+from .helper import encode_cursor
+
+
+def should_stream(rqst_args):
+    """
+    Decide whether a listing should be streamed.
+
+    Args:
+        rqst_args (object): request args, stream=true forces streaming and
+            large page sizes are always streamed
+
+    Raises:
+        ValueError: if page_size is not an integer
+
+    Returns:
+        bool: True if the listing should be streamed
+    """
+    page_size = int(rqst_args.get('page_size', default_page_size))
+    return rqst_args.get('stream', 'false') == 'true' or page_size >= stream_min_page_size
+
+
+class PageEncoder:
+
+    def __init__(self, data, dumps):
+        """
+        Initialize a new instance of PageEncoder.
+
+        Encodes a lazy paginator result one document at a time into buffered JSON
+        chunks, so the sync and async streaming responses share the same body. The
+        body has the same keys as the non-streamed listing, with next_cursor written
+        last since in keyset mode it depends on the last document.
+
+        Args:
+            data (dict): paginator result built with lazy=True
+            dumps (function): the JSON encoder of the application
+        """
+        self.data = data
+        self.dumps = dumps
+        meta = {key: data[key] for key in ('total_count', 'count_type', 'page', 'page_size', 'skip')}
+        # Open the object with the metadata and the data array
+        self.buffer = [dumps(meta)[:-1], ', "data": [']
+        self.size = 0
+        self.last = None
+        self.count = 0
+
+    def add(self, document):
+        """
+        Encode a document.
+
+        Returns:
+            str: a chunk to send once the buffer is large enough, otherwise None
+        """
+        if self.count:
+            self.buffer.append(',')
+        self.count += 1
+        # Keep the keyset position of the last document
+        key = self.data['cursor_sort_key']
+        if key:
+            self.last = {key: document.get(key), '_id': document['_id']}
+
+        encoded = self.dumps(document)
+        self.buffer.append(encoded)
+        self.size += len(encoded)
+
+        # Flush once the buffer is large enough
+        if self.size >= stream_buffer_size:
+            chunk = ''.join(self.buffer)
+            self.buffer, self.size = [], 0
+            return chunk
+        return None
+
+    def finish(self):
+        """
+        Close the data array and the object.
+
+        Returns:
+            str: the last chunk
+        """
+        # In keyset mode the cursor points after the last document of a full page
+        next_cursor = self.data['next_cursor']
+        key = self.data['cursor_sort_key']
+        if key and self.last is not None and self.count == self.data['page_size']:
+            next_cursor = encode_cursor(key, self.last)
+
+        self.buffer.append('], "next_cursor": {}}}'.format(self.dumps(next_cursor)))
+        return ''.join(self.buffer)
+
+
+def stream_page(data):
+    """
+    Stream a lazy paginator result as a JSON response.
+
+    Documents are encoded one at a time while the mongo cursor is iterated and sent in
+    buffered chunks, so memory stays constant regardless of the page size.
+
+    Args:
+        data (dict): paginator result built with lazy=True
+
+    Returns:
+        flask.Response: A streamed JSON response.
+    """
+    # Bind the JSON provider now, the generator runs after the request context is gone
+    encoder = PageEncoder(data, current_app.json.dumps)
+
+    def generate():
+        for document in data['data']:
+            chunk = encoder.add(document)
+            if chunk:
+                yield chunk
+        yield encoder.finish()
+
+    return Response(generate(), mimetype='application/json')
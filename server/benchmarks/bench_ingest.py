@@ -0,0 +1,132 @@
+"""
+Benchmark process_csv against a local mongod.
+
+Each size runs in a fresh process so the reported peak RSS belongs to that run
+only. Generated files are cached in --data-dir and reused across runs. The rows
+and file record of a run are removed afterwards unless --keep is given, which
+leaves a loaded catalogue for benchmarks.bench_queries.
+
+Point MONGO_URI at a database used only for benchmarking, e.g.
+mongodb://localhost:27017/movieapp_bench.
+
+Usage:
+    python -m benchmarks.bench_ingest [--rows 10000 100000 1000000] [--engine c|pyarrow]
+        [--shard-bytes 0] [--compress gzip] [--keep] [--output results.jsonl]
+"""
+import os
+import time
+import argparse
+import multiprocessing
+
+from benchmarks.common import emit, peak_rss_mb
+from benchmarks.generate_csv import generate
+
+suffixes = {None: '.csv', 'gzip': '.csv.gz', 'bz2': '.csv.bz2', 'zstd': '.csv.zst'}
+
+
+def run_ingest(file_path, engine, shard_bytes, keep, results):
+    """
+    Ingest one file with process_csv in the current process and put the result in a queue.
+
+    Args:
+        file_path (str): The CSV file to ingest.
+        engine (str): The CSV_ENGINE setting.
+        shard_bytes (int): The CSV_SHARD_BYTES setting.
+        keep (bool): Keep the ingested rows.
+        results (multiprocessing.Queue): Receives the result dict.
+    """
+    # Settings are read at import time, set them before importing the tasks
+    os.environ['CSV_ENGINE'] = engine
+    os.environ['CSV_SHARD_BYTES'] = str(shard_bytes)
+
+    from bson.objectid import ObjectId
+    from datetime import datetime
+    from app.celery import celery
+    from app.celery.tasks import process_csv
+    from app.database import SessionManager, Collections
+    from app.database.indexes import ensure_indexes
+
+    # Shard tasks run inline, one after the other, instead of going through the broker
+    celery.conf.task_always_eager = True
+
+    with SessionManager() as (client, db):
+        ensure_indexes(db)
+        csv_files = db.get_collection(Collections.csv_files)
+        file_id = csv_files.insert_one({
+            'filepath': file_path,
+            'filename': os.path.basename(file_path),
+            'status': 'pending',
+            'processed_at': None,
+            'uploaded_by': ObjectId(),
+            'created_at': datetime.now(),
+            'updated_at': datetime.now(),
+            'file_size': os.path.getsize(file_path),
+            'progress': 0
+        }).inserted_id
+
+        started = time.perf_counter()
+        process_csv.run(str(file_id))
+        seconds = time.perf_counter() - started
+
+        file = csv_files.find_one({'_id': file_id})
+        results.put({
+            'status': file['status'],
+            'error': file.get('error'),
+            'rows': file.get('progress', 0),
+            'quarantined': file.get('quarantined', 0),
+            'shards': len(file.get('shards', [])),
+            'seconds': seconds,
+            'rows_per_second': file.get('progress', 0) / seconds if seconds else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        })
+
+        if not keep:
+            db.get_collection(Collections.movies).delete_many({'sourced_from': file_id})
+            db.get_collection(Collections.quarantined_rows).delete_many({'file_id': file_id})
+            csv_files.delete_one({'_id': file_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--engine', choices=['c', 'pyarrow'], default='c')
+    parser.add_argument('--shard-bytes', type=int, default=0, help='0 disables fan-out')
+    parser.add_argument('--compress', choices=['gzip', 'bz2', 'zstd'])
+    parser.add_argument('--bad-rate', type=float, default=0.001)
+    parser.add_argument('--data-dir', default='/tmp/movieapp-bench')
+    parser.add_argument('--keep', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    for rows in args.rows:
+        file_path = os.path.join(args.data_dir, 'catalogue-{}-{}{}'.format(rows, args.bad_rate,
+                                                                           suffixes[args.compress]))
+        if not os.path.exists(file_path):
+            generate(file_path, rows, bad_rate=args.bad_rate, compress=args.compress)
+
+        results = context.Queue()
+        process = context.Process(target=run_ingest,
+                                  args=(file_path, args.engine, args.shard_bytes, args.keep, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            result = {'status': 'crashed', 'error': 'exit code {}'.format(process.exitcode)}
+        else:
+            result = results.get()
+
+        emit({
+            'benchmark': 'ingest',
+            'input_rows': rows,
+            'engine': args.engine,
+            'shard_bytes': args.shard_bytes,
+            'compress': args.compress,
+            'file_bytes': os.path.getsize(file_path),
+            **result
+        }, args.output)
+
+
+if __name__ == '__main__':
+    main()
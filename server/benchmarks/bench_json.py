@@ -0,0 +1,99 @@
+"""
+Benchmark the movie list serialization: the previous per-document str() copies
+through Flask's default provider against MongoJSONProvider.
+
+Usage:
+    python -m benchmarks.bench_json [--rows 1000] [--repeat 50]
+"""
+import argparse
+import json
+import time
+
+from datetime import datetime
+from bson.objectid import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.utils.json_provider import MongoJSONProvider, orjson
+
+
+def make_movies(rows):
+    """
+    Build movie documents shaped like the ones returned by the movies collection.
+    """
+    created_by, sourced_from = ObjectId(), ObjectId()
+    return [{
+        '_id': ObjectId(),
+        'show_id': 's{}'.format(i),
+        'type': 'Movie',
+        'title': 'Title {}'.format(i),
+        'director': 'Director {}'.format(i % 100),
+        'cast': ', '.join('Actor {}'.format(j) for j in range(i % 10)),
+        'country': 'United States',
+        'date_added': datetime(2021, 9, 25),
+        'release_year': 2000 + i % 20,
+        'rating': 'PG-13',
+        'duration': '90 min',
+        'listed_in': 'Dramas, International Movies',
+        'description': 'A description of the movie ' * 5,
+        'created_at': datetime.now(),
+        'updated_at': datetime.now(),
+        'created_by': created_by,
+        'sourced_from': sourced_from,
+    } for i in range(rows)]
+
+
+def legacy(app, movies):
+    # The conversion the endpoints did before the provider handled ObjectId
+    return app.json.response({
+        'data': [{
+            **movie, '_id': str(movie['_id']),
+            'created_by': str(movie['created_by']),
+            'sourced_from': str(movie['sourced_from'])
+        } for movie in movies],
+    }).get_data()
+
+
+def provider(app, movies):
+    return app.json.response({'data': movies}).get_data()
+
+
+def timeit(func, app, movies, repeat):
+    """
+    Returns:
+        float: The best time of repeat runs, in seconds.
+    """
+    best = float('inf')
+    with app.app_context():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(app, movies)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    movies = make_movies(args.rows)
+
+    default_app = Flask(__name__)
+    default_app.json = DefaultJSONProvider(default_app)
+    mongo_app = Flask(__name__)
+    mongo_app.json = MongoJSONProvider(mongo_app)
+
+    results = {
+        'rows': args.rows,
+        'backend': 'orjson' if orjson else 'json',
+        'legacy_seconds': timeit(legacy, default_app, movies, args.repeat),
+        'provider_seconds': timeit(provider, mongo_app, movies, args.repeat),
+    }
+    results['speedup'] = results['legacy_seconds'] / results['provider_seconds']
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
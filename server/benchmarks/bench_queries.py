@@ -0,0 +1,139 @@
+"""
+Benchmark the movie list, get and search endpoints against a local mongod.
+
+Requests go through the Flask test client, so the timings cover routing, auth,
+the paginator, the query and serialization, without network overhead. Load a
+catalogue first, e.g. with benchmarks.bench_ingest --keep. Each scenario is
+reported separately as a JSON line with its p50 and p99 latency.
+
+Usage:
+    python -m benchmarks.bench_queries [--requests 200] [--warmup 20] [--output results.jsonl]
+"""
+import os
+import time
+import random
+import argparse
+
+from urllib.parse import quote
+
+from benchmarks.common import emit, latency_summary, peak_rss_mb
+from benchmarks.generate_csv import words, last_names, countries, genres
+
+
+def list_scenarios(rng, movie_ids):
+    """
+    Build the request scenarios, each a function returning the next URL to request.
+
+    Args:
+        rng (random.Random): The random generator.
+        movie_ids (list): Sampled movie ids for the get scenario.
+
+    Returns:
+        dict: Scenario name to URL factory.
+    """
+    return {
+        'list_first_page': lambda: '/api/movies/list/',
+        'list_offset_page_100': lambda: '/api/movies/list/?page=100',
+        'list_sort_release_year': lambda: '/api/movies/list/?sort_key=release_year&sort_value=-1',
+        'list_exact_count': lambda: '/api/movies/list/?total_count=exact',
+        'list_large_page_streamed': lambda: '/api/movies/list/?page_size=500',
+        'list_projected_fields': lambda: '/api/movies/list/?fields=show_id,title,release_year',
+        'get_by_id': lambda: '/api/movies/get/{}'.format(rng.choice(movie_ids)),
+        'search_title_text': lambda: '/api/movies/list/?search_key=title&search_term={}'.format(rng.choice(words)),
+        'search_cast_text': lambda: '/api/movies/list/?search_key=cast&search_term={}'.format(
+            rng.choice(last_names)),
+        'search_country_regex': lambda: '/api/movies/list/?search_key=country&search_term={}'.format(
+            rng.choice(countries)),
+        'filter_genre_exact': lambda: '/api/movies/list/?listed_in={}'.format(quote(rng.choice(genres))),
+        'filter_country_any': lambda: '/api/movies/list/?country_any={}'.format(
+            quote(','.join(rng.sample(countries, 3)))),
+    }
+
+
+def time_requests(client, headers, next_url, requests, warmup):
+    """
+    Returns:
+        list: The latency of each measured request, in seconds.
+
+    Raises:
+        RuntimeError: If a request does not succeed.
+    """
+    samples = []
+    for i in range(warmup + requests):
+        url = next_url()
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        # Read the body so streamed responses are fully produced
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError('{} returned {}'.format(url, response.status_code))
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+def time_keyset_walk(client, headers, pages):
+    """
+    Follow next_cursor through consecutive pages, the deep pagination path.
+
+    Returns:
+        list: The latency of each page, in seconds.
+    """
+    samples = []
+    # An empty cursor starts keyset mode at the first page
+    url = '/api/movies/list/?sort_key=release_year&sort_value=-1&cursor='
+    for _ in range(pages):
+        started = time.perf_counter()
+        data = client.get(url, headers=headers).get_json()
+        samples.append(time.perf_counter() - started)
+        if not data.get('next_cursor'):
+            break
+        url = '/api/movies/list/?sort_key=release_year&sort_value=-1&cursor={}'.format(data['next_cursor'])
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenario', nargs='*', help='run only these scenarios')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark')
+
+    from app.app import app
+    from app.database import SessionManager, Collections
+    from app.utils.auth import generate_token
+
+    with SessionManager() as (client, db):
+        user = db.get_collection(Collections.users).find_one({'username': 'admin'})
+        movies = db.get_collection(Collections.movies)
+        rows = movies.estimated_document_count()
+        movie_ids = [str(doc['_id']) for doc in movies.aggregate([{'$sample': {'size': 1000}},
+                                                                  {'$project': {'_id': 1}}])]
+    if not movie_ids:
+        raise SystemExit('The movies collection is empty, load a catalogue with benchmarks.bench_ingest --keep')
+
+    headers = {'Authorization': 'Bearer {}'.format(generate_token(user))}
+    rng = random.Random(args.seed)
+    test_client = app.test_client()
+
+    scenarios = list_scenarios(rng, movie_ids)
+    for name, next_url in scenarios.items():
+        if args.scenario and name not in args.scenario:
+            continue
+        samples = time_requests(test_client, headers, next_url, args.requests, args.warmup)
+        emit({'benchmark': 'query', 'scenario': name, 'catalogue_rows': rows,
+              **latency_summary(samples), 'peak_rss_mb': peak_rss_mb()}, args.output)
+
+    if not args.scenario or 'keyset_walk' in args.scenario:
+        samples = time_keyset_walk(test_client, headers, args.requests)
+        emit({'benchmark': 'query', 'scenario': 'keyset_walk', 'catalogue_rows': rows,
+              **latency_summary(samples), 'peak_rss_mb': peak_rss_mb()}, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Helpers shared by the benchmarks: results are JSON lines tagged with the git
+revision so runs on different commits can be compared with benchmarks.compare.
+"""
+import sys
+import json
+import resource
+import subprocess
+
+from datetime import datetime
+
+
+def git_revision():
+    """
+    Returns:
+        str: The short hash of the checked out commit, with a + suffix if the tree is dirty.
+    """
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                           stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], stderr=subprocess.DEVNULL)
+        return revision + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def peak_rss_mb():
+    """
+    Returns:
+        float: The peak resident set size of the current process, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of a list of numbers.
+
+    Args:
+        values (list): The samples.
+        percent (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The value below which percent of the samples fall, None without samples.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def latency_summary(samples):
+    """
+    Args:
+        samples (list): Latencies in seconds.
+
+    Returns:
+        dict: The number of samples and the p50, p99 and max latency in milliseconds.
+    """
+    return {
+        'samples': len(samples),
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+
+def emit(result, output=None):
+    """
+    Print a result as a JSON line and append it to an output file.
+
+    Args:
+        result (dict): The benchmark result, tagged here with the revision and time.
+        output (str, optional): The path of a JSON lines file to append to.
+    """
+    result = {'revision': git_revision(), 'timestamp': datetime.now().isoformat(timespec='seconds'), **result}
+    line = json.dumps(result)
+    print(line, flush=True)
+    if output:
+        with open(output, 'a') as f:
+            f.write(line + '\n')
@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files written with --output, e.g. from two commits.
+
+Results are matched on their benchmark parameters, and the last result of each
+is kept when a file holds repeated runs.
+
+Usage:
+    python -m benchmarks.compare base.jsonl head.jsonl
+"""
+import json
+import argparse
+
+# Result fields that identify a run, the others are measurements
+key_fields = ('benchmark', 'scenario', 'input_rows', 'engine', 'shard_bytes', 'compress')
+
+# Measurements compared, and whether higher is better
+metrics = {
+    'rows_per_second': True,
+    'peak_rss_mb': False,
+    'p50_ms': False,
+    'p99_ms': False,
+}
+
+
+def load(path):
+    """
+    Returns:
+        dict: The last result of each run key in a JSON lines file.
+    """
+    results = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[tuple(result.get(field) for field in key_fields)] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    args = parser.parse_args()
+
+    base, head = load(args.base), load(args.head)
+    for key in sorted(set(base) & set(head), key=str):
+        name = ' '.join(str(value) for value in key if value is not None)
+        for metric, higher_is_better in metrics.items():
+            before, after = base[key].get(metric), head[key].get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            print('{:<50} {:<16} {:>12.2f} -> {:>12.2f} {:+7.1f}% {}'.format(
+                name, metric, before, after, change, 'better' if better and change else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Generate a synthetic Netflix-style catalogue CSV with the columns of csv_headers.
+
+Rows are written as they are generated, so memory stays flat for any size. The
+same seed always produces the same file.
+
+Usage:
+    python -m benchmarks.generate_csv --rows 1000000 --output /tmp/catalogue.csv [--seed 0]
+        [--bad-rate 0.001] [--compress gzip|bz2|zstd]
+"""
+import io
+import csv
+import bz2
+import gzip
+import random
+import argparse
+
+from datetime import date, timedelta
+
+from app.utils.const import csv_headers, csv_date_format
+from app.utils.compression import zstandard
+
+types = ['Movie', 'TV Show']
+ratings = ['G', 'PG', 'PG-13', 'R', 'NC-17', 'TV-Y', 'TV-G', 'TV-PG', 'TV-14', 'TV-MA']
+countries = ['United States', 'India', 'United Kingdom', 'Japan', 'South Korea', 'Canada', 'Spain', 'France',
+             'Mexico', 'Germany', 'Brazil', 'Nigeria', 'Egypt', 'Turkey', 'Australia']
+genres = ['Dramas', 'Comedies', 'Documentaries', 'Action & Adventure', 'International Movies', 'Thrillers',
+          'Kids\' TV', 'Romantic Movies', 'Horror Movies', 'Stand-Up Comedy', 'Anime Series', 'Docuseries']
+first_names = ['Ana', 'Raj', 'Yuki', 'Min-jun', 'Olu', 'Carlos', 'Emma', 'Liam', 'Priya', 'Hiro', 'Sofia', 'Omar',
+               'Chloe', 'Mateo', 'Aisha', 'Lucas', 'Mei', 'Ivan', 'Zara', 'Noah']
+last_names = ['Silva', 'Sharma', 'Tanaka', 'Kim', 'Adeyemi', 'Garcia', 'Smith', 'Brown', 'Patel', 'Sato',
+              'Rossi', 'Hassan', 'Martin', 'Lopez', 'Khan', 'Muller', 'Chen', 'Petrov', 'Ali', 'Wilson']
+words = ['Night', 'Lost', 'City', 'Dream', 'Secret', 'Love', 'War', 'Last', 'Dark', 'Road', 'Summer', 'Girl',
+         'House', 'Blood', 'King', 'River', 'Fire', 'Ghost', 'Game', 'Heart', 'Stars', 'Shadow', 'Island', 'Storm']
+
+
+def person(rng):
+    return '{} {}'.format(rng.choice(first_names), rng.choice(last_names))
+
+
+def make_row(rng, index, bad=False):
+    """
+    Build one CSV row.
+
+    Args:
+        rng (random.Random): The random generator.
+        index (int): The position of the row, used for the unique show_id.
+        bad (bool, optional): Put a value that cannot be converted in a typed column.
+
+    Returns:
+        list: The values in the order of csv_headers.
+    """
+    kind = rng.choice(types)
+    added = date(2008, 1, 1) + timedelta(days=rng.randrange(5000))
+    duration = '{} min'.format(rng.randint(60, 180)) if kind == 'Movie' else '{} Seasons'.format(rng.randint(1, 9))
+    row = {
+        'show_id': 's{}'.format(index + 1),
+        'type': kind,
+        'title': ' '.join(rng.sample(words, rng.randint(1, 4))),
+        'director': person(rng) if rng.random() < 0.7 else '',
+        'cast': ', '.join(person(rng) for _ in range(rng.randint(0, 8))),
+        'country': ', '.join(rng.sample(countries, rng.randint(1, 3))) if rng.random() < 0.9 else '',
+        'date_added': added.strftime(csv_date_format) if rng.random() < 0.98 else '',
+        'release_year': str(rng.randint(1950, added.year)),
+        'rating': rng.choice(ratings),
+        'duration': duration,
+        'listed_in': ', '.join(rng.sample(genres, rng.randint(1, 3))),
+        'description': ' '.join(rng.choice(words).lower() for _ in range(rng.randint(15, 30))) + '.',
+    }
+    if bad:
+        row[rng.choice(['date_added', 'release_year'])] = 'not a value'
+    return [row[header] for header in csv_headers]
+
+
+def open_output(path, compress=None):
+    """
+    Open the output file as text, through a compressor if asked.
+    """
+    if compress == 'gzip':
+        return gzip.open(path, 'wt', newline='', encoding='utf-8')
+    if compress == 'bz2':
+        return bz2.open(path, 'wt', newline='', encoding='utf-8')
+    if compress == 'zstd':
+        writer = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+        return io.TextIOWrapper(writer, newline='', encoding='utf-8')
+    return open(path, 'w', newline='', encoding='utf-8')
+
+
+def generate(path, rows, seed=0, bad_rate=0.0, compress=None):
+    """
+    Write a synthetic catalogue CSV.
+
+    Args:
+        path (str): The output path.
+        rows (int): The number of data rows.
+        seed (int, optional): The random seed.
+        bad_rate (float, optional): The share of rows with a value that cannot be converted.
+        compress (str, optional): 'gzip', 'bz2' or 'zstd'.
+
+    Returns:
+        str: The output path.
+    """
+    rng = random.Random(seed)
+    with open_output(path, compress) as f:
+        writer = csv.writer(f)
+        writer.writerow(csv_headers)
+        for index in range(rows):
+            writer.writerow(make_row(rng, index, bad=bad_rate and rng.random() < bad_rate))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bad-rate', type=float, default=0.0)
+    parser.add_argument('--compress', choices=['gzip', 'bz2', 'zstd'])
+    args = parser.parse_args()
+
+    generate(args.output, args.rows, args.seed, args.bad_rate, args.compress)
+    print(args.output)
+
+
+if __name__ == '__main__':
+    main()
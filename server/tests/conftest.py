@@ -0,0 +1,5 @@
+import os
+
+# Settings read when the app modules are imported
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/movies')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret')
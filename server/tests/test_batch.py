@@ -0,0 +1,39 @@
+import mongomock
+import pytest
+
+from bson import ObjectId
+
+from app.api.movies import batch_query, batch_result
+
+
+@pytest.fixture
+def movies():
+    collection = mongomock.MongoClient().db.movies
+    collection.insert_many([{'show_id': 's{}'.format(i)} for i in range(3)])
+    return collection
+
+
+def lookup(movies, body):
+    field, keys, find_context = batch_query(body)
+    return batch_result(field, keys, movies.find(find_context).sort('_id', 1))
+
+
+def test_batch_keeps_request_order_and_reports_missing_ids(movies):
+    ids = [str(movie['_id']) for movie in movies.find().sort('_id', 1)]
+    unknown = str(ObjectId())
+    result = lookup(movies, {'ids': [ids[2], unknown, ids[0], 'not-an-id']})
+    assert [movie and str(movie['_id']) for movie in result['data']] == [ids[2], None, ids[0], None]
+    assert result['missing'] == [unknown, 'not-an-id']
+
+
+def test_batch_matches_uppercase_ids(movies):
+    movie_id = str(movies.find_one()['_id'])
+    result = lookup(movies, {'ids': [movie_id.upper(), movie_id]})
+    assert [str(movie['_id']) for movie in result['data']] == [movie_id, movie_id]
+    assert result['missing'] == []
+
+
+def test_batch_by_show_id(movies):
+    result = lookup(movies, {'show_ids': ['s1', 'S1']})
+    assert result['data'][0]['show_id'] == 's1'
+    assert result['missing'] == ['S1']
@@ -0,0 +1,69 @@
+import pytest
+
+from app.utils import cache
+from app.utils.cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_get_returns_default_on_miss():
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    assert ttl_cache.get('missing') is None
+    assert ttl_cache.get('missing', 'default') == 'default'
+    assert ttl_cache.stats()['misses'] == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set('key', 'value')
+    clock[0] += 9
+    assert ttl_cache.get('key') == 'value'
+    clock[0] += 2
+    assert ttl_cache.get('key') is None
+    assert ttl_cache.stats()['size'] == 0
+
+
+def test_ttl_can_be_set_per_entry(clock):
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set('short', 1, ttl=1)
+    ttl_cache.set('long', 2)
+    clock[0] += 5
+    assert ttl_cache.get('short') is None
+    assert ttl_cache.get('long') == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    # Reading a makes b the least recently used entry
+    ttl_cache.get('a')
+    ttl_cache.set('c', 3)
+    assert ttl_cache.get('b') is None
+    assert ttl_cache.get('a') == 1
+    assert ttl_cache.get('c') == 3
+    assert ttl_cache.stats()['evictions'] == 1
+
+
+def test_pop_and_clear():
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    assert ttl_cache.pop('a') == 1
+    assert ttl_cache.pop('a', 'gone') == 'gone'
+    ttl_cache.clear()
+    assert ttl_cache.stats()['size'] == 0
+
+
+def test_stats_count_hits_and_misses():
+    ttl_cache = TTLCache(maxsize=2, ttl=10)
+    ttl_cache.set('a', 1)
+    ttl_cache.get('a')
+    ttl_cache.get('a')
+    ttl_cache.get('b')
+    assert ttl_cache.stats() == {'size': 1, 'maxsize': 2, 'hits': 2, 'misses': 1, 'evictions': 0}
@@ -0,0 +1,84 @@
+import bz2
+import gzip
+
+import pytest
+
+from app.utils.compression import (zstandard, decompression_errors, upload_format, open_decompressed,
+                                   decompressed_sample)
+
+content = b''.join(b'show_id,title\ns%d,Title %d\n' % (i, i) for i in range(5000))
+
+compressors = {
+    '.csv.gz': gzip.compress,
+    '.csv.bz2': bz2.compress,
+}
+if zstandard is not None:
+    compressors['.csv.zst'] = lambda data: zstandard.ZstdCompressor().compress(data)
+
+
+def write(tmp_path, suffix, data):
+    path = tmp_path / ('upload' + suffix)
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('suffix', sorted(compressors))
+def test_open_decompressed_from_suffix(tmp_path, suffix):
+    path = write(tmp_path, suffix, compressors[suffix](content))
+    with open_decompressed(path) as f:
+        assert f.read() == content
+
+
+@pytest.mark.parametrize('suffix', sorted(compressors))
+def test_open_decompressed_reads_lines(tmp_path, suffix):
+    # The CSV readers consume the stream line by line and in buffers
+    path = write(tmp_path, suffix, compressors[suffix](content))
+    with open_decompressed(path) as f:
+        assert f.readline() == b'show_id,title\n'
+        assert f.read(7) == b's0,Titl'
+        assert f.read() == content[len(b'show_id,title\ns0,Titl'):]
+
+
+def test_open_decompressed_plain_file(tmp_path):
+    path = write(tmp_path, '.csv', content)
+    with open_decompressed(path) as f:
+        assert f.read() == content
+
+
+def test_open_decompressed_explicit_compression(tmp_path):
+    # Stored files may lose their suffix, the compression recorded at upload wins
+    path = write(tmp_path, '', gzip.compress(content))
+    with open_decompressed(path, 'gzip') as f:
+        assert f.read() == content
+
+
+def test_open_decompressed_corrupt_file(tmp_path):
+    path = write(tmp_path, '.csv.gz', gzip.compress(content)[:200])
+    with pytest.raises(decompression_errors):
+        with open_decompressed(path) as f:
+            f.read()
+
+
+@pytest.mark.parametrize('suffix', sorted(compressors))
+def test_decompressed_sample(tmp_path, suffix):
+    stored = compressors[suffix](content)
+    path = write(tmp_path, suffix, stored)
+    sample, consumed = decompressed_sample(path, 1000, read_bytes=64)
+    assert len(sample) >= 1000
+    assert content.startswith(sample)
+    assert 0 < consumed <= len(stored)
+
+
+@pytest.mark.parametrize('filename, compression', [
+    ('movies.csv', None),
+    ('Movies.CSV.GZ', 'gzip'),
+    ('movies.csv.bz2', 'bz2'),
+])
+def test_upload_format(filename, compression):
+    assert upload_format(filename) == compression
+
+
+@pytest.mark.parametrize('filename', ['movies.json', 'movies.gz', 'movies.csv.xz'])
+def test_upload_format_rejects_other_files(filename):
+    with pytest.raises(ValueError):
+        upload_format(filename)
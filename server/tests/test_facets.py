@@ -0,0 +1,46 @@
+import mongomock
+import pytest
+
+from app.database import connections, Collections
+from app.database.facets import count_facets, rebuild_facets, facets_query, facets_result
+from app.database.versions import get_version_info
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = mongomock.MongoClient('mongodb://localhost:27017/movies')
+    monkeypatch.setattr(connections, 'get_client', lambda: client)
+    return client.get_database()
+
+
+def test_count_facets_splits_multi_valued_fields():
+    counts = count_facets([
+        {'type': 'Movie', 'country': ['India', 'France'], 'listed_in': 'Dramas, Comedies', 'release_year': 2020},
+        {'type': 'Movie', 'country': 'India, India', 'listed_in': [], 'release_year': None, 'rating': ''},
+    ])
+    assert counts[('type', 'Movie')] == 2
+    assert counts[('country', 'India')] == 2
+    assert counts[('country', 'France')] == 1
+    assert counts[('listed_in', 'Comedies')] == 1
+    assert counts[('release_year', 2020)] == 1
+    assert ('release_year', None) not in counts
+    assert ('rating', '') not in counts
+
+
+def test_rebuild_facets_replaces_counts_and_bumps_version(db):
+    db.get_collection(Collections.movies).insert_many([
+        {'type': 'Movie', 'country': ['India']},
+        {'type': 'TV Show', 'country': ['India']},
+    ])
+    db.get_collection(Collections.movie_facets).insert_one({'facet': 'type', 'value': 'Stale', 'count': 3})
+    version, _ = get_version_info(Collections.movies)
+
+    assert rebuild_facets(db) == 3
+    find_context, projection, sort = facets_query(['type', 'country'])
+    buckets = db.get_collection(Collections.movie_facets).find(find_context, projection).sort(sort)
+    assert facets_result(buckets, ['type', 'country']) == {
+        'type': [{'value': 'Movie', 'count': 1}, {'value': 'TV Show', 'count': 1}],
+        'country': [{'value': 'India', 'count': 2}],
+    }
+    assert get_version_info(Collections.movies)[0] == version + 1
+
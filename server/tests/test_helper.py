@@ -0,0 +1,138 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+
+from bson import ObjectId, json_util
+
+from app.utils import helper
+from app.utils.helper import encode_cursor, decode_cursor, keyset_condition, page_query, paginator
+
+
+@pytest.fixture
+def movies(monkeypatch):
+    # mongomock has no index information to check
+    monkeypatch.setattr(helper, 'warn_unindexed', lambda collection, fields: None)
+    collection = mongomock.MongoClient().db.movies
+    years = [2001, None, 1999, 2001, None, 2010, 1999]
+    dates = [datetime(2020, 1, 1), None, datetime(2019, 5, 1), None, datetime(2021, 3, 1), None, datetime(2019, 5, 1)]
+    collection.insert_many([{'show_id': 's{}'.format(i), 'release_year': year, 'date_added': date,
+                             'created_at': datetime(2024, 1, 1)} for i, (year, date) in enumerate(zip(years, dates))])
+    return collection
+
+
+def page_through(collection, sort_key, sort_value, page_size=2):
+    """
+    Returns:
+        list: The show_id of every document listed in keyset mode, page by page.
+    """
+    shown, cursor = [], ''
+    while cursor is not None:
+        args = {'cursor': cursor, 'page_size': str(page_size), 'sort_key': sort_key, 'sort_value': str(sort_value)}
+        result = paginator(collection, args, {}, {sort_key: sort_value})
+        shown += [document['show_id'] for document in result['data']]
+        cursor = result['next_cursor']
+    return shown
+
+
+def test_cursor_round_trip():
+    last_id = ObjectId()
+    cursor = encode_cursor('release_year', {'_id': last_id, 'release_year': 2001})
+    assert decode_cursor(cursor, 'release_year') == (2001, last_id)
+
+
+def test_cursor_keeps_dates_and_nulls():
+    last_id = ObjectId()
+    assert decode_cursor(encode_cursor('date_added', {'_id': last_id, 'date_added': datetime(2020, 1, 1)}),
+                         'date_added') == (datetime(2020, 1, 1), last_id)
+    assert decode_cursor(encode_cursor('date_added', {'_id': last_id}), 'date_added') == (None, last_id)
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', 'e30=', '!!'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'release_year')
+
+
+def test_cursor_of_another_sort_key_is_rejected():
+    cursor = encode_cursor('release_year', {'_id': ObjectId(), 'release_year': 2001})
+    with pytest.raises(ValueError, match='sort key'):
+        decode_cursor(cursor, 'date_added')
+
+
+def test_keyset_condition_on_id():
+    last_id = ObjectId()
+    assert keyset_condition('_id', 1, last_id, last_id) == {'_id': {'$gt': last_id}}
+    assert keyset_condition('_id', -1, last_id, last_id) == {'_id': {'$lt': last_id}}
+
+
+def test_keyset_condition_includes_nulls_after_values_in_descending_order():
+    last_id = ObjectId()
+    assert keyset_condition('release_year', -1, 2001, last_id) == {'$or': [
+        {'release_year': {'$lt': 2001}},
+        {'release_year': 2001, '_id': {'$lt': last_id}},
+        {'release_year': None}
+    ]}
+
+
+def test_keyset_condition_includes_values_after_nulls_in_ascending_order():
+    last_id = ObjectId()
+    assert keyset_condition('release_year', 1, None, last_id) == {'$or': [
+        {'release_year': None, '_id': {'$gt': last_id}},
+        {'release_year': {'$ne': None}}
+    ]}
+
+
+@pytest.mark.parametrize('sort_key, sort_value', [
+    ('release_year', -1), ('release_year', 1), ('date_added', -1), ('date_added', 1)
+])
+def test_keyset_pages_list_every_document_once(movies, sort_key, sort_value):
+    expected = [document['show_id'] for document in movies.find().sort([(sort_key, sort_value), ('_id', sort_value)])]
+    assert page_through(movies, sort_key, sort_value) == expected
+    assert len(expected) == 7
+
+
+def test_empty_keyset_page_has_no_next_cursor(movies):
+    result = paginator(movies, {'cursor': '', 'page_size': '0', 'search_key': 'show_id', 'search_term': 'none'},
+                       {'show_id': 1}, {'show_id': 1})
+    assert result['data'] == []
+    assert result['next_cursor'] is None
+
+
+@pytest.mark.parametrize('filters', [{}, {'listed_in': 'Dramas'}])
+def test_text_search_is_sorted_by_relevance_with_or_without_filters(filters):
+    args = dict(filters, search_key='title', search_term='love')
+    query = page_query(args, {'title': 1}, {'title': 1}, text_search_fields={'title'},
+                       filter_allowed_fields={'listed_in'})
+    assert query['sort'] == {'score': {'$meta': 'textScore'}}
+
+
+class TextSearchMisses:
+    # mongomock has no $text support, stand in for a text index with no whole word match
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def find_one(self, filter, *args, **kwargs):
+        if '$text' in json_util.dumps(filter):
+            return None
+        return self.collection.find_one(filter, *args, **kwargs)
+
+    def find(self, filter, *args, **kwargs):
+        assert '$text' not in json_util.dumps(filter)
+        return self.collection.find(filter, *args, **kwargs)
+
+
+@pytest.mark.parametrize('search_term, titles', [
+    ('matri', ['The Matrix', 'Matrix Reloaded']),
+    ('the matri', ['The Matrix']),
+    ('atrix', []),
+])
+def test_partial_word_search_falls_back_to_word_prefixes(movies, search_term, titles):
+    movies.delete_many({})
+    movies.insert_many([{'title': title, 'created_at': datetime(2024, 1, i + 1)}
+                        for i, title in enumerate(['The Matrix', 'Matrix Reloaded', 'Rematrix'])])
+    args = {'search_key': 'title', 'search_term': search_term}
+    result = paginator(TextSearchMisses(movies), args, {'title': 1}, {'title': 1}, text_search_fields={'title'},
+                       filter_allowed_fields={'listed_in'})
+    assert sorted(document['title'] for document in result['data']) == sorted(titles)
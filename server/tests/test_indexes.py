@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+import mongomock
+import pytest
+
+from app.database import indexes
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(indexes, '_indexed_fields', {})
+    monkeypatch.setattr(indexes, '_warned', set())
+
+
+@pytest.fixture
+def movies():
+    collection = mongomock.MongoClient().get_database('movies').get_collection('movies')
+    collection.create_index('title')
+    return collection
+
+
+class AsyncCollection:
+    # The part of a motor collection used by warn_unindexed_async
+    def __init__(self, collection):
+        self.name = collection.name
+        self.collection = collection
+
+    async def index_information(self):
+        return self.collection.index_information()
+
+
+def warnings(caplog):
+    return [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+
+
+def test_warn_unindexed_once_per_field(movies, caplog):
+    indexes.warn_unindexed(movies, ['title', 'director'])
+    indexes.warn_unindexed(movies, ['title', 'director'])
+    assert warnings(caplog) == ['movies.director is used for search or sort but has no supporting index']
+
+
+def test_warn_unindexed_async(movies, caplog):
+    asyncio.run(indexes.warn_unindexed_async(AsyncCollection(movies), ['title', 'director']))
+    assert warnings(caplog) == ['movies.director is used for search or sort but has no supporting index']
+    assert indexes._indexed_fields['movies'] == {'_id', 'title'}
+
+
+def test_warn_unindexed_shared_between_modes(movies, caplog):
+    indexes.warn_unindexed(movies, ['director'])
+    asyncio.run(indexes.warn_unindexed_async(AsyncCollection(movies), ['director']))
+    assert len(warnings(caplog)) == 1
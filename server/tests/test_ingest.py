@@ -0,0 +1,165 @@
+import threading
+
+import mongomock
+import pytest
+
+from pymongo.errors import BulkWriteError
+
+from app.celery.ingest import IngestPipeline, insert_ignoring_duplicates
+from app.celery.progress import ProgressPublisher
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.movies
+    collection.create_index('source_row', unique=True)
+    return collection
+
+
+def rows(start, end):
+    return [{'source_row': row, 'title': 'Title {}'.format(row)} for row in range(start, end)]
+
+
+def test_pipeline_writes_every_document_in_batches(collection):
+    commits = []
+    with IngestPipeline(collection, on_commit=lambda committed, *_: commits.append(committed),
+                        writers=2, batch_size=10) as pipeline:
+        pipeline.put(rows(0, 25))
+        pipeline.put(rows(25, 42))
+
+    assert collection.count_documents({}) == 42
+    assert sorted(commits)[-1] == 42
+    stats = pipeline.stats()
+    assert stats['rows'] == stats['inserted'] == 42
+    assert stats['batches'] == 5
+
+
+def test_writer_error_is_raised_in_the_caller(collection):
+    class Failing:
+        name = 'movies'
+
+        def insert_many(self, documents, ordered=True):
+            raise RuntimeError('write failed')
+
+    with pytest.raises(RuntimeError, match='write failed'):
+        with IngestPipeline(Failing(), writers=1, batch_size=5) as pipeline:
+            pipeline.put(rows(0, 5))
+            pipeline.put(rows(5, 10))
+
+
+def test_batch_size_adapts_to_write_time(collection):
+    pipeline = IngestPipeline(collection, writers=1, batch_size=1000)
+    pipeline.adapt(1000, pipeline.target_seconds / 4)
+    assert pipeline.batch_size == 2000
+    pipeline.adapt(2000, pipeline.target_seconds * 2)
+    assert pipeline.batch_size == 1000
+
+
+def test_insert_ignoring_duplicates_returns_the_new_documents(collection):
+    collection.insert_many(rows(2, 4))
+    inserted = insert_ignoring_duplicates(collection, rows(0, 6))
+    assert [document['source_row'] for document in inserted] == [0, 1, 4, 5]
+    assert collection.count_documents({}) == 6
+
+
+def test_insert_ignoring_duplicates_raises_other_errors():
+    class Invalid:
+        def insert_many(self, documents, ordered=True):
+            # 121 is a document validation failure
+            raise BulkWriteError({'writeErrors': [{'index': 0, 'code': 11000}, {'index': 1, 'code': 121}]})
+
+    with pytest.raises(BulkWriteError):
+        insert_ignoring_duplicates(Invalid(), rows(0, 2))
+
+
+def test_checkpoint_waits_for_every_earlier_batch(collection):
+    first_written = threading.Event()
+    second_committed = threading.Event()
+
+    class Gated:
+        name = 'movies'
+
+        def insert_many(self, documents, ordered=True):
+            # Hold the first batch until the second one is committed
+            if documents[0]['source_row'] == 0:
+                second_committed.wait(5)
+            result = collection.insert_many(documents, ordered=ordered)
+            if documents[0]['source_row'] == 0:
+                first_written.set()
+            return result
+
+    checkpoints = []
+
+    def on_commit(committed, checkpoint, checkpoint_committed):
+        checkpoints.append(checkpoint)
+        second_committed.set()
+
+    with IngestPipeline(Gated(), on_commit=on_commit, writers=2, batch_size=10) as pipeline:
+        pipeline.put(rows(0, 20))
+
+    assert first_written.is_set()
+    assert checkpoints == [0, 20]
+
+
+def test_resumed_pipeline_skips_committed_rows(collection):
+    checkpoints = []
+    with IngestPipeline(collection, on_commit=lambda committed, checkpoint, *_: checkpoints.append(checkpoint),
+                        writers=2, batch_size=5) as pipeline:
+        pipeline.put(rows(0, 20))
+    assert max(checkpoints) == pipeline.stats()['checkpoint'] == 20
+
+    # A retry after a crash re-reads the rows written after the last stored checkpoint
+    with IngestPipeline(collection, writers=2, batch_size=5, committed=10, checkpoint=10) as resumed:
+        resumed.put(rows(10, 25))
+    stats = resumed.stats()
+    assert stats['inserted'] == 5
+    assert stats['rows'] == 25
+    assert stats['checkpoint'] == 25
+    assert collection.count_documents({}) == 25
+
+
+@pytest.mark.parametrize('prefix', ['', 'shards.0.'])
+def test_resume_after_crash_counts_every_row_once(collection, monkeypatch, prefix):
+    monkeypatch.setenv('PROGRESS_PUBLISH_INTERVAL', '0')
+    csv_files = mongomock.MongoClient().db.csv_files
+    file_id = csv_files.insert_one({'progress': 0, 'shards': [{'progress': 0, 'checkpoint': 0,
+                                                              'checkpoint_progress': 0}]}).inserted_id
+    third_committed = threading.Event()
+
+    class Crashing:
+        name = 'movies'
+
+        def insert_many(self, documents, ordered=True):
+            # The second batch is lost after the third one committed past the checkpoint
+            if documents[0]['source_row'] == 10:
+                third_committed.wait(5)
+                raise RuntimeError('worker lost')
+            result = collection.insert_many(documents, ordered=ordered)
+            if documents[0]['source_row'] == 20:
+                third_committed.set()
+            return result
+
+    def run(target, start):
+        file = csv_files.find_one({'_id': file_id})
+        state = file['shards'][0] if prefix else file
+        committed = state.get('checkpoint_progress', 0)
+        publisher = ProgressPublisher(csv_files, file_id, 30, committed=committed, prefix=prefix,
+                                      add_to_total=bool(prefix))
+        pipeline = IngestPipeline(target, on_commit=publisher.update, writers=2, batch_size=10,
+                                  committed=committed, checkpoint=state.get('checkpoint', 0))
+        with pipeline:
+            pipeline.put(rows(start, 30))
+        publisher.flush()
+        return pipeline.stats()
+
+    with pytest.raises(RuntimeError, match='worker lost'):
+        run(Crashing(), 0)
+    file = csv_files.find_one({'_id': file_id})
+    state = file['shards'][0] if prefix else file
+    assert (state['checkpoint'], state['checkpoint_progress']) == (10, 10)
+
+    stats = run(collection, state['checkpoint'])
+    file = csv_files.find_one({'_id': file_id})
+    assert stats['rows'] == stats['checkpoint_rows'] == 30
+    assert file['progress'] == 30
+    assert collection.count_documents({}) == 30
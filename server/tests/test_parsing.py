@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from app.celery.parsing import parse_chunk, split_values, read_chunks, read_shard_chunks, shard_offsets
+from app.utils.const import csv_headers
+
+
+def make_chunk(*rows, start=0):
+    """
+    Build a chunk as read_chunks returns it, every column a string or NaN for an empty cell.
+    """
+    records = [{header: row.get(header, '') for header in csv_headers} for row in rows]
+    return pd.DataFrame(records, index=pd.RangeIndex(start, start + len(rows)), dtype=object)
+
+
+def test_typed_columns_are_converted():
+    df, quarantined = parse_chunk(make_chunk({'date_added': 'September 25, 2021', 'release_year': ' 2020 '}))
+    row = df.to_dict('records')[0]
+    assert quarantined == []
+    assert row['date_added'] == datetime(2021, 9, 25)
+    assert row['release_year'] == 2020
+    assert type(row['release_year']) is int
+
+
+def test_blank_typed_values_are_stored_as_none():
+    df, quarantined = parse_chunk(make_chunk({'date_added': float('nan'), 'release_year': '  '},
+                                             {'date_added': '', 'release_year': float('nan')}))
+    assert quarantined == []
+    for row in df.to_dict('records'):
+        assert row['date_added'] is None
+        assert row['release_year'] is None
+
+
+def test_blank_strings_stay_empty_strings():
+    df, _ = parse_chunk(make_chunk({'rating': float('nan'), 'description': ''}))
+    row = df.to_dict('records')[0]
+    assert row['rating'] == ''
+    assert row['description'] == ''
+
+
+def test_invalid_values_quarantine_the_row():
+    df, quarantined = parse_chunk(make_chunk({'show_id': 's1', 'release_year': '2020'},
+                                             {'show_id': 's2', 'release_year': 'twenty'},
+                                             {'show_id': 's3', 'release_year': '2020.5'},
+                                             {'show_id': 's4', 'date_added': 'yesterday', 'release_year': 'x'},
+                                             start=10))
+    assert list(df['show_id']) == ['s1']
+    assert [(row['row'], row['error']) for row in quarantined] == [
+        (11, 'Invalid release_year'), (12, 'Invalid release_year'), (13, 'Invalid date_added')]
+    assert quarantined[0]['data']['release_year'] == 'twenty'
+
+
+def test_list_columns_are_split_into_trimmed_values():
+    df, _ = parse_chunk(make_chunk({'cast': 'A,  B ,,C', 'country': float('nan'), 'listed_in': 'Dramas'}))
+    row = df.to_dict('records')[0]
+    assert row['cast'] == ['A', 'B', 'C']
+    assert row['country'] == []
+    assert row['listed_in'] == ['Dramas']
+
+
+def test_split_values():
+    assert split_values(' a, b ,, ') == ['a', 'b']
+    assert split_values('') == []
+
+
+def test_read_chunks_index_rows_by_position(tmp_path):
+    path = tmp_path / 'movies.csv'
+    path.write_text(','.join(csv_headers) + '\n' + ''.join(
+        's{},Movie,Title {},,,,,2020,,,,\n'.format(i, i) for i in range(5)))
+    chunks = list(read_chunks(str(path), engine='c', start_row=2))
+    df = pd.concat(chunks)
+    assert list(df.index) == [2, 3, 4]
+    assert list(df['show_id']) == ['s2', 's3', 's4']
+
+
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+@pytest.mark.parametrize('start_row', [0, 1, 2, 3])
+def test_resume_counts_rows_with_quoted_newlines(tmp_path, engine, start_row):
+    path = tmp_path / 'movies.csv'
+    path.write_text(','.join(csv_headers) + '\n' + ''.join(
+        's{},Movie,Title {},,,,,2020,,,,"Line one\nline two"\n'.format(i, i) for i in range(5)))
+    df = pd.concat(read_chunks(str(path), engine=engine, start_row=start_row))
+    assert list(df.index) == list(range(start_row, 5))
+    assert list(df['show_id']) == ['s{}'.format(i) for i in range(start_row, 5)]
+    assert df['description'].iloc[0] == 'Line one\nline two'
+
+
+@pytest.mark.parametrize('shard_bytes', [1, 40, 100, 1000])
+@pytest.mark.parametrize('block_bytes', [7, 64, 1 << 20])
+def test_shards_split_between_records_with_quoted_newlines(tmp_path, shard_bytes, block_bytes):
+    path = tmp_path / 'movies.csv'
+    path.write_bytes((','.join(csv_headers) + '\n' + ''.join(
+        's{},Movie,"Title ""{}""",,,,,2020,,,,"Line one\nline ""two""\n"\n'.format(i, i)
+        for i in range(8))).encode('utf-8'))
+    offsets = shard_offsets(str(path), shard_bytes, block_bytes=block_bytes)
+
+    df = pd.concat(chunk for start, end in offsets for chunk in read_shard_chunks(str(path), start, end))
+    assert list(df['show_id']) == ['s{}'.format(i) for i in range(8)]
+    assert list(df['title']) == ['Title "{}"'.format(i) for i in range(8)]
+    assert set(df['description']) == {'Line one\nline "two"\n'}
+    if shard_bytes == 1:
+        # Each record is a shard of its own
+        assert len(offsets) == 8
+
+
+def test_shards_of_a_header_only_file(tmp_path):
+    path = tmp_path / 'movies.csv'
+    path.write_text(','.join(csv_headers) + '\n')
+    size = path.stat().st_size
+    assert shard_offsets(str(path), 10) == [(size, size)]
@@ -0,0 +1,125 @@
+import threading
+
+import mongomock
+import pytest
+
+from app.database import connections
+from app.utils import cache, passwords
+from app.utils.auth import hash_password
+from app.utils.passwords import LoginThrottle, PasswordPool, PoolFull
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(passwords.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_throttle_after_max_failures(clock):
+    throttle = LoginThrottle(max_failures=3, window=60, maxsize=10)
+    for _ in range(2):
+        throttle.failed('admin')
+    assert throttle.retry_after('admin') == 0
+    throttle.failed('admin')
+    assert throttle.retry_after('admin') == 61
+    assert throttle.retry_after('other') == 0
+
+
+def test_throttle_window_starts_at_first_failure(clock):
+    throttle = LoginThrottle(max_failures=2, window=60, maxsize=10)
+    throttle.failed('admin')
+    clock[0] += 50
+    throttle.failed('admin')
+    assert throttle.retry_after('admin') == 11
+    clock[0] += 11
+    assert throttle.retry_after('admin') == 0
+    # The count starts over once the window has passed
+    throttle.failed('admin')
+    assert throttle.retry_after('admin') == 0
+
+
+def test_throttle_reset_after_success(clock):
+    throttle = LoginThrottle(max_failures=1, window=60, maxsize=10)
+    throttle.failed('admin')
+    assert throttle.retry_after('admin') > 0
+    throttle.reset('admin')
+    assert throttle.retry_after('admin') == 0
+
+
+def test_throttle_counts_concurrent_failures(clock):
+    throttle = LoginThrottle(max_failures=100, window=60, maxsize=10)
+    threads = [threading.Thread(target=lambda: [throttle.failed('admin') for _ in range(25)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert throttle.failures.get('admin')[0] == 100
+
+
+def submit_when_free(pool):
+    # Slots are released by the done callbacks, which may run just after result() returns
+    for _ in range(100):
+        try:
+            return pool.submit(lambda: True).result()
+        except PoolFull:
+            threading.Event().wait(0.01)
+    pytest.fail('pool slots were not released')
+
+
+def test_pool_verifies_passwords():
+    pool = PasswordPool(workers=2, queue_size=2)
+    hashed_password = hash_password('secret')
+    assert pool.verify('secret', hashed_password)
+    assert not pool.verify('wrong', hashed_password)
+
+
+def test_pool_rejects_calls_beyond_workers_and_queue():
+    pool = PasswordPool(workers=1, queue_size=1)
+    release = threading.Event()
+    running = [pool.submit(release.wait) for _ in range(2)]
+    with pytest.raises(PoolFull):
+        pool.submit(release.wait)
+
+    release.set()
+    for future in running:
+        future.result()
+    assert submit_when_free(pool)
+
+
+def test_pool_releases_slot_of_failed_call():
+    pool = PasswordPool(workers=1, queue_size=0)
+    with pytest.raises(ZeroDivisionError):
+        pool.submit(lambda: 1 / 0).result()
+    assert submit_when_free(pool)
+
+
+def test_disabled_throttle_never_refuses(clock):
+    throttle = LoginThrottle(max_failures=0, window=60, maxsize=10)
+    for _ in range(10):
+        throttle.failed('10.0.0.1')
+    assert throttle.retry_after('10.0.0.1') == 0
+
+
+def test_clients_behind_a_proxy_are_throttled_apart(monkeypatch):
+    from flask import Flask
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    from app.api import user
+
+    client = mongomock.MongoClient('mongodb://localhost:27017/movies')
+    monkeypatch.setattr(connections, 'get_client', lambda: client)
+    monkeypatch.setattr(user, 'user_throttle', LoginThrottle(max_failures=0, window=60, maxsize=10))
+    monkeypatch.setattr(user, 'ip_throttle', LoginThrottle(max_failures=2, window=60, maxsize=10))
+
+    app = Flask(__name__)
+    app.register_blueprint(user.user_router, url_prefix='/api/user')
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    test_client = app.test_client()
+
+    def login(address):
+        return test_client.post('/api/user/login', json={'username': 'admin', 'password': 'wrong'},
+                                headers={'X-Forwarded-For': address}, environ_base={'REMOTE_ADDR': '172.18.0.2'})
+
+    assert [login('203.0.113.1').status_code for _ in range(3)] == [401, 401, 429]
+    assert login('203.0.113.2').status_code == 401
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+import mongomock
+import pytest
+
+from bson import ObjectId
+
+from app.celery import tasks
+from app.database import connections, Collections
+from app.utils.const import csv_headers
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = mongomock.MongoClient('mongodb://localhost:27017/movies')
+    monkeypatch.setattr(connections, 'get_client', lambda: client)
+    return client.get_database()
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    calls = []
+    monkeypatch.setattr(tasks.process_csv_shard, 'delay', lambda *args: calls.append(args))
+    return calls
+
+
+def sharded_file(db, tmp_path, statuses, **fields):
+    path = tmp_path / 'movies.csv'
+    header = ','.join(csv_headers) + '\n'
+    body = ''.join('s{},Movie,Title {},,,,,2020,,,,\n'.format(i, i) for i in range(4))
+    path.write_text(header + body)
+    start, end = len(header), len(header) + len(body)
+    file = {
+        'filepath': str(path), 'uploaded_by': ObjectId(), 'status': 'in_progress', 'progress': 0,
+        'ingest_started_at': datetime.now(), 'shards_done': sum(status in ('processed', 'failed') for status in statuses),
+        'shards': [{'start': start, 'end': end, 'status': status, 'progress': 0, 'checkpoint': 0,
+                    'checkpoint_progress': 0, 'estimated_rows': 4} for status in statuses],
+    }
+    file.update(fields)
+    file['_id'] = db.get_collection(Collections.csv_files).insert_one(file).inserted_id
+    return file
+
+
+def test_redelivered_file_with_every_shard_done_is_finished(db, tmp_path, queued):
+    file = sharded_file(db, tmp_path, ['processed', 'failed'])
+    tasks.process_csv.run(str(file['_id']))
+
+    file = db.get_collection(Collections.csv_files).find_one({'_id': file['_id']})
+    assert file['status'] == 'failed'
+    assert file['error'] == 'Failed shards: 1'
+    assert queued == []
+
+
+def test_redelivered_file_only_queues_pending_shards(db, tmp_path, queued):
+    file = sharded_file(db, tmp_path, ['processed', 'in_progress', 'pending'])
+    tasks.process_csv.run(str(file['_id']))
+    assert queued == [(str(file['_id']), 2)]
+
+
+def test_shard_run_by_another_task_is_skipped(db, tmp_path):
+    file = sharded_file(db, tmp_path, ['in_progress'])
+    db.get_collection(Collections.csv_files).update_one({'_id': file['_id']}, {'$set': {'shards.0.task_id': 'first'}})
+
+    tasks.process_csv_shard.apply(args=(str(file['_id']), 0), task_id='second')
+
+    file = db.get_collection(Collections.csv_files).find_one({'_id': file['_id']})
+    assert file['shards'][0]['status'] == 'in_progress'
+    assert file['progress'] == 0
+    assert db.get_collection(Collections.movies).count_documents({}) == 0
+
+
+@pytest.mark.parametrize('status, task_id', [('pending', None), ('in_progress', 'first')])
+def test_claimed_shard_is_processed_once(db, tmp_path, status, task_id):
+    # A pending shard, or the shard of this task redelivered after its worker was lost
+    file = sharded_file(db, tmp_path, [status])
+    db.get_collection(Collections.csv_files).update_one({'_id': file['_id']}, {'$set': {'shards.0.task_id': task_id}})
+
+    tasks.process_csv_shard.apply(args=(str(file['_id']), 0), task_id='first')
+    tasks.process_csv_shard.apply(args=(str(file['_id']), 0), task_id='first')
+
+    file = db.get_collection(Collections.csv_files).find_one({'_id': file['_id']})
+    assert file['shards'][0]['status'] == 'processed'
+    assert file['shards_done'] == 1
+    assert file['status'] == 'processed'
+    assert file['progress'] == 4
+    assert db.get_collection(Collections.movies).count_documents({}) == 4
+
+
+def test_movies_version_is_bumped_per_shard_not_per_progress_write(db, tmp_path, monkeypatch):
+    monkeypatch.setenv('PROGRESS_PUBLISH_INTERVAL', '0')
+    monkeypatch.setenv('INGEST_BATCH_SIZE', '1')
+    file = sharded_file(db, tmp_path, ['pending', 'pending'])
+    versions = db.get_collection(Collections.versions)
+
+    tasks.process_csv_shard.apply(args=(str(file['_id']), 0), task_id='first')
+    assert versions.find_one({'_id': Collections.movies})['version'] == 1
+    assert db.get_collection(Collections.csv_files).find_one({'_id': file['_id']})['progress'] == 4